@@ -13,7 +13,8 @@ function popImage(filename) {
 
 var options = {
   urlForSize: function(filename, size) {
-    return 'thumbnail/' + filename;
+    // Built by generate_photos_gallery.py for each height pig.js asks for
+    return 'thumbnail/' + size + '/' + filename;
   },
   onClickHandler: function(filename) {
     popImage(filename);
@@ -25,6 +26,18 @@ var options = {
 var imageData = [];
 var searchTokens = {};
 var pig;
+// Per-year manifest index from photos/index.json, and the shards loaded so far
+var yearIndex = null;
+var yearShards = {};
+// Manifest locations. manifest.json, when published, swaps these for
+// content-hashed names that the browser may cache indefinitely.
+var manifestUrls = {photos: 'photos.csv', searchTokens: 'search-tokens.csv', years: 'photos/index.json'};
+var manifestsHashed = false;
+// '.br' or '.gz' when manifest.json says precompressed variants were uploaded
+var manifestSuffix = '';
+// Inverted index from search/index.json, and the prefix shards loaded so far
+var searchIndex = null;
+var searchShards = {};
 
 function onlyUnique(value, index, self) {
   return self.indexOf(value) === index;
@@ -35,6 +48,7 @@ function processData(allText) {
   var imageData = [];
 
   for (var i=0; i<allTextLines.length; i++) {
+      if (allTextLines[i] == "") continue;
       var data = allTextLines[i].split(',');
       var filename = data[0].replace("\"", "").replace("\"", "").replace('#', '%23')
       var tokens = []
@@ -59,95 +73,305 @@ function processSearchTokens(allText) {
   return tokens;
 }
 
-function showImages(year) {
+function renderImages(images) {
   // remove old images
   if (pig) pig.disable()
   $("#pig").empty()
   $("#pig").empty()
 
-  images = imageData;
-  if (year) {
-    images = []
-    for (var i=0; i<imageData.length; i++) {
-      if (new Date(imageData[i].datetime).getFullYear() == year) {
-        images.push(imageData[i]);
+  pig = new Pig(images, options).enable();
+}
+
+function loadYearShard(year, callback) {
+  if (yearShards[year]) {
+    callback(yearShards[year]);
+    return;
+  }
+  var entry = yearIndex.find(function(e) { return e.year == year; });
+  if (!entry) {
+    callback([]);
+    return;
+  }
+  $.ajax({
+      type: 'GET',
+      // The hash changes whenever the shard does, so it is safe to cache
+      url: entry.file + manifestSuffix + '?v=' + entry.hash,
+      contentType: 'csv',
+      processData: false,
+      success: function(data) {
+        yearShards[year] = processData(data);
+        callback(yearShards[year]);
+      },
+  });
+}
+
+function loadAllImages(callback) {
+  if (imageData.length > 0) {
+    callback(imageData);
+    return;
+  }
+  $.ajax({
+      type: 'GET',
+      url: manifestUrls.photos,
+      contentType: 'csv',
+      cache: manifestsHashed,
+      processData: false,
+      success: function(data) {
+        imageData = processData(data);
+        callback(imageData);
+      },
+  });
+}
+
+function showImages(year) {
+  if (yearIndex && year) {
+    loadYearShard(year, renderImages);
+    return;
+  }
+
+  loadAllImages(function(imageData) {
+    images = imageData;
+    if (year) {
+      images = []
+      for (var i=0; i<imageData.length; i++) {
+        if (new Date(imageData[i].datetime).getFullYear() == year) {
+          images.push(imageData[i]);
+        }
       }
     }
+
+    renderImages(images);
+  });
+}
+
+function loadSearchShard(prefix, callback) {
+  if (searchShards[prefix]) {
+    callback(searchShards[prefix]);
+    return;
   }
+  var entry = searchIndex.shards[prefix];
+  if (!entry) {
+    callback({});
+    return;
+  }
+  $.ajax({
+      type: 'GET',
+      url: entry.file + manifestSuffix + '?v=' + entry.hash,
+      dataType: 'json',
+      success: function(shard) {
+        searchShards[prefix] = shard;
+        callback(shard);
+      },
+      // A missing or unreadable shard matches nothing rather than hanging the search
+      error: function() {
+        callback({});
+      },
+  });
+}
 
-  pig = new Pig(images, options).enable();
+// Postings are stored as gaps between ascending photos.csv line numbers
+function decodePostings(gaps) {
+  var ordinals = [];
+  var current = 0;
+  for (var i=0; i<gaps.length; i++) {
+    current += gaps[i];
+    ordinals.push(current);
+  }
+  return ordinals;
+}
+
+function intersectOrdinals(a, b) {
+  var result = [];
+  var i = 0, j = 0;
+  while (i < a.length && j < b.length) {
+    if (a[i] < b[j]) i++;
+    else if (a[i] > b[j]) j++;
+    else { result.push(a[i]); i++; j++; }
+  }
+  return result;
+}
+
+// Rows matching every token, fetching one index shard per token
+function findOrdinals(tokens, callback) {
+  var postings = [];
+  var pending = tokens.length;
+  tokens.forEach(function(token, i) {
+    loadSearchShard(token.slice(0, searchIndex.prefixLength), function(shard) {
+      postings[i] = decodePostings(shard[token] || []);
+      if (--pending == 0) callback(postings.reduce(intersectOrdinals));
+    });
+  });
+}
+
+// The year shards hold the rows of photos.csv in the same order, so an
+// ordinal maps to a year and an offset without loading the full manifest.
+function rowsForOrdinals(ordinals, callback) {
+  if (!yearIndex) {
+    loadAllImages(function(imageData) {
+      callback(ordinals.map(function(ordinal) { return imageData[ordinal]; }));
+    });
+    return;
+  }
+  var located = [];
+  var years = [];
+  var start = 0, y = 0;
+  for (var i=0; i<ordinals.length; i++) {
+    while (y < yearIndex.length && ordinals[i] >= start + yearIndex[y].count) {
+      start += yearIndex[y].count;
+      y++;
+    }
+    if (y == yearIndex.length) break;
+    located.push({year: yearIndex[y].year, offset: ordinals[i] - start});
+    if (!years.includes(yearIndex[y].year)) years.push(yearIndex[y].year);
+  }
+  var pending = years.length;
+  if (pending == 0) {
+    callback([]);
+    return;
+  }
+  years.forEach(function(year) {
+    loadYearShard(year, function() {
+      if (--pending > 0) return;
+      callback(located.map(function(l) { return yearShards[l.year][l.offset]; }));
+    });
+  });
 }
 
 function showImagesSearch(searchToken) {
-  // remove old images
-  if (pig) pig.disable()
-  $("#pig").empty()
-  $("#pig").empty()
+  if (searchIndex) {
+    var tokens = searchToken.toLowerCase().split(/\s+/).filter(function(t) { return t != ""; });
+    if (tokens.length == 0) return;
+    findOrdinals(tokens, function(ordinals) {
+      rowsForOrdinals(ordinals, renderImages);
+    });
+    return;
+  }
+
+  loadAllImages(function(imageData) {
+    images = []
+    for (var i=0; i<imageData.length; i++) {
+      if (imageData[i].searchTokens.includes(searchToken)) {
+        images.push(imageData[i]);
+      }
+    }
+    renderImages(images);
+  });
+}
 
-  images = imageData;
-  images = []
-  for (var i=0; i<imageData.length; i++) {
-    if (imageData[i].searchTokens.includes(searchToken)) {
-      images.push(imageData[i]);
+function addYearLinks(output) {
+  p = $("#header-p")
+  for (var i=0; i<output.length; i++) {
+    if (!isNaN(output[i])) {
+      var text = "<span><a style=\"font-size: 20px\" href=\"javascript:showImages(" + output[i] + ");\">" + output[i] + "</a>&nbsp;&nbsp;</span>";
+      p.append(text)
     }
   }
-  pig = new Pig(images, options).enable();
 }
 
 var years = []
 var searchTokens = []
 var output = []
 
-$.ajax({
-    type: 'GET',
-    url: 'photos.csv',
-    contentType: 'csv',
-    cache: false,
-    processData: false,
-    async: false,
-    success: function(data) {
-      imageData = processData(data)
-      // figure out the years
-      var dates = []
-      var years = []
-      for (var i=0; i<imageData.length; i++) {
-        d = new Date(Date.parse(imageData[i].datetime));
-        dates.push(d);
-        years.push(d.getFullYear());
-      }
+function loadFullManifest() {
+  loadAllImages(function(imageData) {
+    // figure out the years
+    var dates = []
+    var years = []
+    for (var i=0; i<imageData.length; i++) {
+      d = new Date(Date.parse(imageData[i].datetime));
+      dates.push(d);
+      years.push(d.getFullYear());
+    }
 
-      var flags = [], output = []
-      for(var i=0; i<years.length; i++) {
-        if( flags[years[i]]) continue;
-        flags[years[i]] = true;
-        output.push(years[i]);
-      }
+    var flags = [], output = []
+    for(var i=0; i<years.length; i++) {
+      if( flags[years[i]]) continue;
+      flags[years[i]] = true;
+      output.push(years[i]);
+    }
 
+    addYearLinks(output);
 
-      p = $("#header-p")
-      for (var i=0; i<output.length; i++) {
-        if (!isNaN(output[i])) {
-          var text = "<span><a style=\"font-size: 20px\" href=\"javascript:showImages(" + output[i] + ");\">" + output[i] + "</a>&nbsp;&nbsp;</span>";
-          p.append(text)
+    d = new Date();
+    showImages(d.getFullYear());
+  });
+}
+
+// Fetch the small per-year index first and only the shard for the year being
+// viewed. Galleries generated before shards existed fall back to photos.csv.
+function loadYearIndex() {
+  $.ajax({
+      type: 'GET',
+      url: manifestUrls.years,
+      dataType: 'json',
+      cache: manifestsHashed,
+      success: function(index) {
+        yearIndex = index.years;
+        addYearLinks(yearIndex.map(function(e) { return e.year; }));
+
+        var year = new Date().getFullYear();
+        if (!yearIndex.find(function(e) { return e.year == year; }) && yearIndex.length > 0) {
+          year = yearIndex[0].year;
         }
-      }
+        showImages(year);
+      },
+      error: function() {
+        loadFullManifest();
+      },
+  });
+}
 
-      d = new Date();
-      showImages(d.getFullYear());
-    },
-});
+function loadSearchIndex() {
+  $.ajax({
+      type: 'GET',
+      url: 'search/index.json',
+      dataType: 'json',
+      cache: false,
+      success: function(index) {
+        searchIndex = index;
+      },
+  });
+}
 
+function loadSearchTokens() {
+  $.ajax({
+      type: 'GET',
+      url: manifestUrls.searchTokens,
+      contentType: 'csv',
+      cache: manifestsHashed,
+      processData: false,
+      success: function(data) {
+        tokens = processSearchTokens(data);
+
+        $('#search').autocomplete({source: tokens});
+      },
+  });
+}
+
+// manifest.json is the only file that is never cached; it names the current
+// content-hashed manifests. Without it, load the fixed names as before.
 $.ajax({
     type: 'GET',
-    url: 'search-tokens.csv',
-    contentType: 'csv',
+    url: 'manifest.json',
+    dataType: 'json',
     cache: false,
-    processData: false,
-    async: false,
-    success: function(data) {
-      tokens = processSearchTokens(data);
-
-      $('#search').autocomplete({source: tokens});
+    success: function(pointer) {
+      manifestsHashed = true;
+      // Browsers only decode brotli over https
+      var encodings = pointer.encodings || [];
+      if (encodings.includes('br') && location.protocol == 'https:') {
+        manifestSuffix = '.br';
+      } else if (encodings.includes('gzip')) {
+        manifestSuffix = '.gz';
+      }
+      ['photos', 'searchTokens', 'years'].forEach(function(key) {
+        if (pointer[key]) manifestUrls[key] = pointer[key] + manifestSuffix;
+      });
+    },
+    complete: function() {
+      loadYearIndex();
+      loadSearchIndex();
+      loadSearchTokens();
     },
 });
 
@@ -0,0 +1,62 @@
+import datetime as dt
+import os
+import random
+import sys
+import tempfile
+import time
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+from compact_manifest import read_compact_manifest, write_compact_manifest  # noqa: E402
+from generate_photos_gallery import open_metadata_file, write_csv  # noqa: E402
+from models.csv_entry import CsvEntry  # noqa: E402
+
+
+def synthetic_rows(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    start = dt.datetime(2005, 1, 1, tzinfo=dt.timezone.utc)
+    rows = [
+        CsvEntry(
+            file_name=f"PXL_{rng.randint(20150101, 20241231)}_{i:09d}.jpg",
+            aspect_ratio=rng.choice([0.75, 1.0, 1.333, 1.777, 0.5625]),
+            created_date=start + dt.timedelta(seconds=rng.randint(0, 600_000_000)),
+        )
+        for i in range(count)
+    ]
+    return sorted(rows, key=lambda row: row.created_date, reverse=True)
+
+
+@click.command()
+@click.option("--count", default=200000, show_default=True, help="Number of manifest rows")
+def main(count: int):
+    rows = synthetic_rows(count)
+    with tempfile.TemporaryDirectory() as directory:
+        csv_file = os.path.join(directory, "photos.csv")
+        compact_file = os.path.join(directory, "photos.bin")
+        write_csv(rows, directory, directory, csv_file, False)
+        write_compact_manifest(rows, compact_file, False)
+
+        start = time.perf_counter()
+        open_metadata_file(csv_file)
+        csv_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        manifest = read_compact_manifest(compact_file)
+        for i in range(len(manifest)):
+            manifest.file_name(i)
+        years = manifest.timestamps.astype("datetime64[s]").astype("datetime64[Y]")
+        compact_seconds = time.perf_counter() - start
+
+        manifest.close()
+
+        csv_size = os.path.getsize(csv_file)
+        compact_size = os.path.getsize(compact_file)
+        print(f"{count} rows, {len(set(years.tolist()))} years")
+        print(f"CSV:     {csv_size / 1e6:8.2f} MB, parsed in {csv_seconds:.3f}s")
+        print(f"Compact: {compact_size / 1e6:8.2f} MB, parsed in {compact_seconds:.3f}s")
+        print(f"Size ratio {csv_size / compact_size:.2f}x, parse speedup {csv_seconds / compact_seconds:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+from generate_photos_gallery import parse_metadata_batch, parse_metadata_file  # noqa: E402
+
+
+def write_synthetic_sidecars(directory: str, count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    meta_file_names = []
+    for i in range(count):
+        file_name = f"IMG_{i:07d}.jpg"
+        created = f"{rng.randint(2005, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}Z"
+        metadata = {
+            "id": f"AF1Qip{i:012d}",
+            "productUrl": f"https://photos.google.com/lr/photo/AF1Qip{i:012d}",
+            "baseUrl": f"https://lh3.googleusercontent.com/lr/AF1Qip{i:012d}",
+            "mimeType": "image/jpeg",
+            "mediaMetadata": {
+                "creationTime": created,
+                "width": str(rng.choice([3024, 4032, 4000, 1920])),
+                "height": str(rng.choice([3024, 4032, 3000, 1080])),
+                "photo": {
+                    "cameraMake": "Google",
+                    "cameraModel": "Pixel 7",
+                    "focalLength": 6.81,
+                    "apertureFNumber": 1.85,
+                    "isoEquivalent": 48,
+                    "exposureTime": "0.001s",
+                },
+            },
+            "filename": file_name,
+        }
+        meta_file_name = f"{file_name}.meta.json"
+        with open(os.path.join(directory, meta_file_name), "w") as f:
+            json.dump(metadata, f, indent=2)
+        meta_file_names.append(meta_file_name)
+    return meta_file_names
+
+
+@click.command()
+@click.option("--count", default=100000, show_default=True, help="Number of synthetic sidecars")
+@click.option("--repeat", default=3, show_default=True, help="Runs of each path; the fastest is reported")
+def main(count: int, repeat: int):
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Writing {count} synthetic sidecars to {directory}...")
+        meta_file_names = write_synthetic_sidecars(directory, count)
+
+        # Best of several alternating runs, so neither path is measured only
+        # against a cold page cache or a noisy moment
+        full_seconds = fast_seconds = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            full = [parse_metadata_file(directory, name, False) for name in meta_file_names]
+            full_seconds = min(full_seconds, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            fast = parse_metadata_batch(directory, meta_file_names, False)
+            fast_seconds = min(fast_seconds, time.perf_counter() - start)
+
+        for full_row, fast_row in zip(full, fast):
+            if (full_row.file_name, full_row.aspect_ratio, full_row.created_date) != (
+                fast_row.file_name,
+                fast_row.aspect_ratio,
+                fast_row.created_date,
+            ):
+                raise Exception(f"Fast path disagrees on {full_row.file_name}")
+
+        print(f"Full pydantic path: {full_seconds:.2f}s ({count / full_seconds:,.0f} files/s)")
+        print(f"Fast path:          {fast_seconds:.2f}s ({count / fast_seconds:,.0f} files/s)")
+        print(f"Speedup:            {full_seconds / fast_seconds:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
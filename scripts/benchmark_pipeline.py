@@ -0,0 +1,480 @@
+import datetime as dt
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import click
+from PIL import Image
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIRECTORY, "src"))
+sys.path.insert(0, ROOT_DIRECTORY)
+sys.path.insert(0, os.path.join(ROOT_DIRECTORY, "tests"))
+
+from benchmark_metadata import write_synthetic_sidecars  # noqa: E402
+from generate_photos_gallery import regenerate_csv  # noqa: E402
+from media_headers import MEDIA_INDEX_FILE_NAME, update_media_index  # noqa: E402
+from photos_stub import (  # noqa: E402
+    StubMediaItems,
+    StubPhotosService,
+    serve_stub_downloads,
+)
+from thumbnails import generate_thumbnails  # noqa: E402
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+# Pixel sizes of the synthetic JPEGs; the sidecars claim camera resolutions
+JPEG_SIZES = [(32, 24), (24, 32), (32, 32), (32, 18)]
+JPEG_POOL_SIZE = 16
+# Share of the images that have no .meta.json and are dated from EXIF instead
+WITHOUT_SIDECARS_FRACTION = 0.05
+LIBRARY_MARKER = ".benchmark_library.json"
+BENCHMARK_BUCKET = "gallery-benchmark"
+
+
+def jpeg_bytes(rng: random.Random, created: Optional[dt.datetime] = None) -> bytes:
+    color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+    im = Image.new("RGB", rng.choice(JPEG_SIZES), color)
+    exif = Image.Exif()
+    if created is not None:
+        exif.get_ifd(0x8769)[0x9003] = created.strftime("%Y:%m:%d %H:%M:%S")
+    buffer = io.BytesIO()
+    im.save(buffer, "JPEG", quality=30, exif=exif)
+    return buffer.getvalue()
+
+
+def random_date(rng: random.Random) -> dt.datetime:
+    start = dt.datetime(2005, 1, 1)
+    return start + dt.timedelta(seconds=rng.randint(0, 600_000_000))
+
+
+def write_synthetic_library(
+    directory: str, count: int, import_count: int, seed: int = 0
+) -> None:
+    """Write a reproducible gallery of `count` images under `directory`.
+
+    - `images/`: tiny JPEGs, most with a Google Photos `.meta.json` sidecar and
+      the rest carrying only an EXIF capture date
+    - `source/<year>/<month>/`: `import_count` more JPEGs in a nested tree, as
+      a camera card or phone backup fed to sync_directory.py would look
+    """
+    rng = random.Random(seed)
+    pool = [jpeg_bytes(rng) for _ in range(JPEG_POOL_SIZE)]
+    image_directory = os.path.join(directory, "images")
+    os.makedirs(image_directory)
+    os.makedirs(os.path.join(directory, "videos"))
+
+    with_sidecars = count - int(count * WITHOUT_SIDECARS_FRACTION)
+    for meta_file_name in write_synthetic_sidecars(
+        image_directory, with_sidecars, seed
+    ):
+        with open(
+            os.path.join(image_directory, meta_file_name[: -len(".meta.json")]), "wb"
+        ) as f:
+            f.write(rng.choice(pool))
+    for i in range(count - with_sidecars):
+        with open(os.path.join(image_directory, f"DSC_{i:07d}.jpg"), "wb") as f:
+            f.write(jpeg_bytes(rng, random_date(rng)))
+
+    for i in range(import_count):
+        created = random_date(rng)
+        folder = os.path.join(
+            directory, "source", str(created.year), f"{created.month:02d}"
+        )
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"IMG_S{i:07d}.jpg"), "wb") as f:
+            f.write(rng.choice(pool))
+
+    with open(os.path.join(directory, LIBRARY_MARKER), "w") as f:
+        json.dump({"count": count, "importCount": import_count, "seed": seed}, f)
+
+
+def library_is_current(
+    directory: str, count: int, import_count: int, seed: int
+) -> bool:
+    marker = os.path.join(directory, LIBRARY_MARKER)
+    if not os.path.exists(marker):
+        return False
+    with open(marker) as f:
+        return json.load(f) == {
+            "count": count,
+            "importCount": import_count,
+            "seed": seed,
+        }
+
+
+def remove_paths(*paths: str) -> None:
+    """Reset a stage's outputs so its cold run starts from nothing."""
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def stub_album_items(count: int, port: int, seed: int = 0) -> List[dict]:
+    rng = random.Random(seed)
+    items = []
+    for i in range(count):
+        media_item_id = f"AF1QipStub-{i}"
+        items.append(
+            {
+                "id": media_item_id,
+                "productUrl": f"https://photos.google.com/lr/photo/{media_item_id}",
+                "baseUrl": f"http://127.0.0.1:{port}/{media_item_id}",
+                "mimeType": "image/jpeg",
+                "mediaMetadata": {
+                    "creationTime": random_date(rng).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "width": "4032",
+                    "height": "3024",
+                    "photo": {},
+                },
+                "filename": f"PXL_{i:07d}.jpg",
+            }
+        )
+    return items
+
+
+def stage_thumbnails(workers: int) -> None:
+    remove_paths("thumbnail")
+    generate_thumbnails("images", "thumbnail", workers=workers)
+
+
+def stage_media_index_cold(workers: int) -> None:
+    remove_paths(os.path.join("images", MEDIA_INDEX_FILE_NAME))
+    update_media_index("images", workers)
+
+
+def stage_media_index_warm(workers: int) -> None:
+    update_media_index("images", workers)
+
+
+def regenerate_images(workers: int, cache_file: Optional[str]) -> None:
+    regenerate_csv(
+        "images",
+        "thumbnail",
+        "photos.csv",
+        False,
+        cache_file=cache_file,
+        workers=workers,
+        shard_directory="photos",
+        compact_file="photos.bin",
+        search_directory="search",
+        search_tokens_file="search-tokens.csv",
+        without_sidecars=True,
+    )
+
+
+def stage_regenerate_csv(workers: int) -> None:
+    regenerate_images(workers, None)
+
+
+def stage_regenerate_csv_incremental_cold(workers: int) -> None:
+    remove_paths("photos.cache.json")
+    regenerate_images(workers, "photos.cache.json")
+
+
+def stage_regenerate_csv_incremental_warm(workers: int) -> None:
+    regenerate_images(workers, "photos.cache.json")
+
+
+def stage_trim_dry_run(workers: int) -> None:
+    from trim import process
+
+    os.makedirs("trash", exist_ok=True)
+    process("images", "trash", dry_run=True, workers=workers)
+
+
+def stage_sync_directory_cold(workers: int) -> None:
+    from sync_directory import copy_source_recursive_to_destination
+
+    remove_paths("imported")
+    os.makedirs("imported")
+    copy_source_recursive_to_destination("source", "imported", copy_workers=workers)
+
+
+def stage_sync_directory_warm(workers: int) -> None:
+    from sync_directory import copy_source_recursive_to_destination
+
+    copy_source_recursive_to_destination("source", "imported", copy_workers=workers)
+
+
+def sync_album(workers: int) -> None:
+    import sync_from_photos
+
+    with open(LIBRARY_MARKER) as f:
+        library = json.load(f)
+    rng = random.Random(library["seed"])
+    pool = [jpeg_bytes(rng) for _ in range(JPEG_POOL_SIZE)]
+    server = serve_stub_downloads(
+        lambda media_item_id: pool[int(media_item_id.rsplit("-", 1)[-1]) % len(pool)]
+    )
+    items = stub_album_items(
+        library["importCount"], server.server_address[1], library["seed"]
+    )
+    sync_from_photos.authenticate = lambda: None
+    media_items = StubMediaItems(items)
+    sync_from_photos.build = lambda *args, **kwargs: StubPhotosService(media_items)
+    try:
+        sync_from_photos.download_album(
+            "benchmark",
+            os.path.join("google", "images"),
+            os.path.join("google", "videos"),
+            os.path.join("google", "video_thumbnail"),
+            concurrency=workers,
+            state_db=os.path.join("google", "sync_state.db"),
+        )
+    finally:
+        server.shutdown()
+
+
+def stage_sync_from_photos_cold(workers: int) -> None:
+    remove_paths("google")
+    sync_album(workers)
+
+
+def stage_sync_from_photos_warm(workers: int) -> None:
+    sync_album(workers)
+
+
+def sync_bucket(workers: int) -> None:
+    # moto comes from requirements-dev.txt, so it is only imported here
+    import boto3
+    from moto import mock_aws
+
+    from s3_sync import S3Syncer, UploadManifest
+    from sync_to_aws import (
+        SYNC_TARGETS,
+        UPLOADED_FILES,
+        content_encoding,
+        publish_cache_control,
+    )
+
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BENCHMARK_BUCKET)
+        syncer = S3Syncer(
+            BENCHMARK_BUCKET,
+            UploadManifest(".s3_manifest.json"),
+            workers=max(16, workers),
+            client=client,
+            extra_args_for_key=lambda key: {
+                **publish_cache_control(key),
+                **content_encoding(key),
+            },
+        )
+        syncer.sync(SYNC_TARGETS + UPLOADED_FILES)
+
+
+def stage_sync_to_s3_cold(workers: int) -> None:
+    remove_paths(".s3_manifest.json")
+    sync_bucket(workers)
+
+
+def stage_sync_to_s3_warm(workers: int) -> None:
+    # The mocked bucket starts empty in every process, so this measures the
+    # manifest diff that decides nothing needs uploading
+    sync_bucket(workers)
+
+
+# Run in this order: later stages read what earlier ones wrote (thumbnails,
+# photos.csv, the media index)
+STAGES: Dict[str, Callable[[int], None]] = {
+    "thumbnails": stage_thumbnails,
+    "media_index_cold": stage_media_index_cold,
+    "media_index_warm": stage_media_index_warm,
+    "regenerate_csv": stage_regenerate_csv,
+    "regenerate_csv_incremental_cold": stage_regenerate_csv_incremental_cold,
+    "regenerate_csv_incremental_warm": stage_regenerate_csv_incremental_warm,
+    "trim_dry_run": stage_trim_dry_run,
+    "sync_directory_cold": stage_sync_directory_cold,
+    "sync_directory_warm": stage_sync_directory_warm,
+    "sync_from_photos_cold": stage_sync_from_photos_cold,
+    "sync_from_photos_warm": stage_sync_from_photos_warm,
+    "sync_to_s3_cold": stage_sync_to_s3_cold,
+    "sync_to_s3_warm": stage_sync_to_s3_warm,
+}
+
+
+def peak_rss_mb(who: int) -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_stage(name: str, library: str, workers: int, verbose: bool) -> dict:
+    """Run one stage in this (fresh) process and measure it.
+
+    Every stage gets its own spawned interpreter, so the peak RSS is that of
+    the stage alone rather than the high-water mark of everything before it.
+    Worker pools the stage starts are reported separately.
+    """
+    os.chdir(library)
+    if not verbose:
+        # The sync scripts print a line per file; that would dominate the timing
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+    start = time.perf_counter()
+    # User and system time of this process and of the worker pools it waited for
+    cpu_start = sum(os.times()[:4])
+    STAGES[name](workers)
+    result = {
+        "seconds": round(time.perf_counter() - start, 3),
+        "cpuSeconds": round(sum(os.times()[:4]) - cpu_start, 3),
+    }
+    if resource is not None:
+        result["peakRssMb"] = round(peak_rss_mb(resource.RUSAGE_SELF), 1)
+        result["peakChildRssMb"] = round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1)
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIRECTORY,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(output_file: str) -> dict:
+    if not os.path.exists(output_file):
+        return {"runs": []}
+    with open(output_file) as f:
+        return json.load(f)
+
+
+def previous_seconds(results: dict, size: str, stage: str) -> Optional[float]:
+    for run in reversed(results["runs"]):
+        for library in run["libraries"]:
+            if library["size"] == size and stage in library["stages"]:
+                return library["stages"][stage]["seconds"]
+    return None
+
+
+@click.command()
+@click.option(
+    "--size",
+    "sizes",
+    type=click.Choice(list(SIZES)),
+    multiple=True,
+    default=["1k", "10k"],
+    show_default=True,
+    help="Library sizes to benchmark; repeat for several",
+)
+@click.option(
+    "--stage",
+    "stages",
+    type=click.Choice(list(STAGES)),
+    multiple=True,
+    help="Stages to run (default: all, in pipeline order)",
+)
+@click.option("--workers", default=4, show_default=True)
+@click.option(
+    "--import-fraction",
+    default=0.1,
+    show_default=True,
+    help="Size of the nested source tree and of the stub album, relative to the library",
+)
+@click.option("--seed", default=0, show_default=True)
+@click.option(
+    "--work-dir",
+    default=None,
+    help="Keep the libraries here and reuse them across runs (default: a temporary directory)",
+)
+@click.option(
+    "--output",
+    "output_file",
+    default="benchmark_results.json",
+    show_default=True,
+    help="Results of every run are appended here",
+)
+@click.option("--verbose", is_flag=True, help="Show the output of every stage")
+def main(
+    sizes: List[str],
+    stages: List[str],
+    workers: int,
+    import_fraction: float,
+    seed: int,
+    work_dir: Optional[str],
+    output_file: str,
+    verbose: bool,
+):
+    stages = [name for name in STAGES if not stages or name in stages]
+    results = load_results(output_file)
+    run = {
+        "startedAt": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "workers": workers,
+        "seed": seed,
+        "libraries": [],
+    }
+    temporary = tempfile.TemporaryDirectory() if work_dir is None else None
+    root = os.path.abspath(work_dir or temporary.name)
+    context = multiprocessing.get_context("spawn")
+    try:
+        for size in sizes:
+            count = SIZES[size]
+            import_count = max(1, int(count * import_fraction))
+            library = os.path.join(root, size)
+            entry = {"size": size, "items": count, "stages": {}}
+            if not library_is_current(library, count, import_count, seed):
+                remove_paths(library)
+                print(f"Writing a synthetic library of {count} images to {library}...")
+                start = time.perf_counter()
+                write_synthetic_library(library, count, import_count, seed)
+                entry["generateSeconds"] = round(time.perf_counter() - start, 3)
+
+            for name in stages:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(
+                        run_stage, name, library, workers, verbose
+                    ).result()
+                entry["stages"][name] = result
+                before = previous_seconds(results, size, name)
+                change = (
+                    f" ({result['seconds'] / before:.2f}x previous)" if before else ""
+                )
+                memory = (
+                    f", peak {result['peakRssMb']:.0f} MB"
+                    if "peakRssMb" in result
+                    else ""
+                )
+                print(
+                    f"{size:>4} {name:<32} {result['seconds']:9.3f}s"
+                    f"{memory}{change}"
+                )
+            run["libraries"].append(entry)
+    finally:
+        if temporary is not None:
+            temporary.cleanup()
+
+    results["runs"].append(run)
+    with open(f"{output_file}.tmp", "w") as f:
+        json.dump(results, f, indent=2)
+    os.replace(f"{output_file}.tmp", output_file)
+    print(f"Appended results to {output_file}")
+
+
+if __name__ == "__main__":
+    main()
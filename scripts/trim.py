@@ -1,43 +1,88 @@
 import sys
 import typing
-import PIL
 import os
-import numpy as np
 import shutil
 import datetime as dt
+import json
 import click
 import logging
 import coloredlogs
-from PIL import Image, ImageFile
 from typing import List, Tuple, Dict
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src'))
 
-def process(img_directory: str, trash_directory: str) -> None:
+from media_headers import IMAGE_EXTENSIONS, save_media_index, update_media_index  # noqa: E402
+
+
+def process(img_directory: str, trash_directory: str, dry_run: bool = False, workers: int = 1) -> None:
+    """Trim images no larger than MIN_SIZE, as a query over the directory's media index.
+
+    Only files added or changed since the last run (of this script or of
+    generate_photos_gallery.py) have their headers read.
+    """
     MIN_SIZE = (400, 400)
-    ImageFile.LOAD_TRUNCATED_IMAGES = True
 
-    source_files = os.listdir(img_directory)
+    # A dry run leaves the directory, index included, exactly as it was
+    index = update_media_index(img_directory, workers, save=not dry_run)
 
     if os.path.exists('trim.log'):
         os.remove('trim.log')
 
     with open('trim.log', 'w') as log_file:
-        for f in source_files:
-            try:
-                im = Image.open(img_directory + '/' + f)
-                if im.size[0] <= MIN_SIZE[0] and im.size[1] <= MIN_SIZE[1]:
-                    logging.info('Moving {} to trash directory {}'.format(f, trash_directory))
-                    shutil.move(img_directory + '/' + f, trash_directory + '/' + f)
-            except Exception as ex:
-                log_file.write('{} had exception {}\n'.format(f, ex))
+        for f in sorted(index):
+            if not f.lower().endswith(IMAGE_EXTENSIONS):
+                # Videos are in the index too; only still images are trimmed
+                continue
+            entry = index[f]
+            if 'error' in entry:
+                log_file.write('{} had exception {}\n'.format(f, entry['error']))
+                continue
+            if entry['width'] <= MIN_SIZE[0] and entry['height'] <= MIN_SIZE[1]:
+                if dry_run:
+                    logging.info('Would move {} ({}x{}) to trash directory {}'.format(f, entry['width'], entry['height'], trash_directory))
+                    continue
+                logging.info('Moving {} to trash directory {}'.format(f, trash_directory))
+                shutil.move(img_directory + '/' + f, trash_directory + '/' + f)
+                del index[f]
+
+    if not dry_run:
+        save_media_index(img_directory, index)
+
+
+def trim_duplicates(img_directory: str, trash_directory: str, report_file: str, dry_run: bool = False) -> None:
+    """Move every duplicate listed in a src/near_duplicates.py report, keeping each cluster's "keep" file."""
+    with open(report_file) as f:
+        report = json.load(f)
+
+    with open('trim.log', 'a') as log_file:
+        for cluster in report['clusters']:
+            if not os.path.exists(img_directory + '/' + cluster['keep']):
+                # Never trash the rest of a cluster when the copy to keep is gone
+                log_file.write('{} is missing, skipping its duplicates\n'.format(cluster['keep']))
+                continue
+            for f in cluster['duplicates']:
+                if not os.path.exists(img_directory + '/' + f):
+                    continue
+                if dry_run:
+                    logging.info('Would move duplicate {} of {} to trash directory {}'.format(f, cluster['keep'], trash_directory))
+                    continue
+                logging.info('Moving duplicate {} of {} to trash directory {}'.format(f, cluster['keep'], trash_directory))
+                shutil.move(img_directory + '/' + f, trash_directory + '/' + f)
 
 
 @click.command()
 @click.option('--source_dir', required=True, help='Source directory of images')
 @click.option('--trash_dir', required=True, help='Destination directory of images to trim/remove')
-def main(source_dir: str, trash_dir: str):
+@click.option('--min_size/--no_min_size', default=True, show_default=True, help='Trim images no larger than the minimum size')
+@click.option('--duplicates_report', default=None, help='Also trim the near duplicates listed in this report from src/near_duplicates.py')
+@click.option('--dry_run', is_flag=True, default=False, help='Only log what would be moved')
+@click.option('--workers', default=1, show_default=True, help='Processes reading headers of new or changed files')
+def main(source_dir: str, trash_dir: str, min_size: bool, duplicates_report: str, dry_run: bool, workers: int):
     coloredlogs.install(level='INFO')
-    process(source_dir, trash_dir)
+    if min_size:
+        process(source_dir, trash_dir, dry_run, workers)
+    if duplicates_report is not None:
+        trim_duplicates(source_dir, trash_dir, duplicates_report, dry_run)
 
 
 if __name__ == '__main__':
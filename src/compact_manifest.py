@@ -0,0 +1,199 @@
+import datetime as dt
+import mmap
+import struct
+import numpy as np
+from typing import Iterator, List
+
+from models.csv_entry import CsvEntry
+
+# Layout (little endian):
+#   header        magic, row count, flags, string table length
+#   timestamps    int32[count]     creation time, epoch seconds (UTC)
+#   offsets       uint32[count+1]  start of each file name in the string table
+#   aspect ratios uint16[count]    aspect ratio * ASPECT_SCALE
+#   utc offsets   int16[count]     minutes east of UTC the photo was taken in
+#                                  (only with FLAG_UTC_OFFSETS; older files are UTC)
+#   string table  utf-8 file names, back to back
+MAGIC = b"PGM1"
+HEADER = struct.Struct("<4sIII")
+ASPECT_SCALE = 1000
+FLAG_VIDEOS = 1
+FLAG_UTC_OFFSETS = 2
+
+
+class CompactManifest:
+    """Read-only view over a compact manifest; the columns are numpy arrays."""
+
+    def __init__(
+        self,
+        buffer,
+        is_for_videos: bool,
+        timestamps,
+        offsets,
+        aspect_ratios,
+        strings,
+        utc_offsets=None,
+    ):
+        self._buffer = buffer
+        self.is_for_videos = is_for_videos
+        self.timestamps = timestamps
+        self.offsets = offsets
+        self.aspect_ratios = aspect_ratios
+        self.strings = strings
+        self.utc_offsets = utc_offsets
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def file_name(self, index: int) -> str:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return bytes(self.strings[start:end]).decode("utf-8")
+
+    def entry(self, index: int) -> CsvEntry:
+        file_name = self.file_name(index)
+        return CsvEntry(
+            file_name=file_name,
+            thumbnail_file_name=f"{file_name}.jpg" if self.is_for_videos else None,
+            aspect_ratio=int(self.aspect_ratios[index]) / ASPECT_SCALE,
+            created_date=dt.datetime.fromtimestamp(
+                int(self.timestamps[index]), tz=self.timezone(index)
+            ),
+        )
+
+    def timezone(self, index: int) -> dt.timezone:
+        if self.utc_offsets is None or not self.utc_offsets[index]:
+            return dt.timezone.utc
+        return dt.timezone(dt.timedelta(minutes=int(self.utc_offsets[index])))
+
+    def __iter__(self) -> Iterator[CsvEntry]:
+        for index in range(len(self)):
+            yield self.entry(index)
+
+    def close(self) -> None:
+        """Drop this manifest's views and unmap the file.
+
+        The columns are views into the map. If a caller still holds one, the
+        map can't be closed yet, so it is left to be unmapped once the last
+        view is garbage collected instead of raising BufferError.
+        """
+        strings = self.strings
+        self.timestamps = self.offsets = self.aspect_ratios = self.strings = None
+        self.utc_offsets = None
+        try:
+            if isinstance(strings, memoryview):
+                strings.release()
+            if isinstance(self._buffer, mmap.mmap):
+                self._buffer.close()
+        except BufferError:
+            pass
+        self._buffer = None
+
+
+def check_column(
+    values: np.ndarray,
+    low: int,
+    high: int,
+    column: str,
+    metadata: List[CsvEntry],
+    manifest_file: str,
+) -> None:
+    """Raise ValueError naming the first row whose `values` entry is outside [low, high]."""
+    outside = np.flatnonzero((values < low) | (values > high))
+    if len(outside):
+        row = metadata[outside[0]]
+        raise ValueError(
+            f"Can't write {manifest_file}: {row.file_name} has {column} "
+            f"{getattr(row, column)}, which the compact format can't store"
+        )
+
+
+def write_compact_manifest(
+    metadata: List[CsvEntry], manifest_file: str, is_for_videos: bool
+) -> None:
+    """Write rows in the compact format.
+
+    Creation times keep whole seconds only and aspect ratios are rounded to
+    three decimals, which is the same precision the CSV carries. The UTC
+    offset of each creation time is kept in minutes, so dates read back with
+    the same timezone the CSV shows. Rows outside the columns' ranges (dates
+    before 1901 or after 2038, aspect ratios below 0.001 or above 65.535)
+    raise ValueError instead of being stored wrapped or clipped.
+    """
+    names = [row.file_name.encode("utf-8") for row in metadata]
+    timestamps = np.array(
+        [int(row.created_date.timestamp()) for row in metadata], dtype=np.int64
+    )
+    int32 = np.iinfo(np.int32)
+    check_column(
+        timestamps, int32.min, int32.max, "created_date", metadata, manifest_file
+    )
+    utc_offsets = np.array(
+        [
+            (
+                int(row.created_date.utcoffset().total_seconds() // 60)
+                if row.created_date.utcoffset() is not None
+                else 0
+            )
+            for row in metadata
+        ],
+        dtype="<i2",
+    )
+    offsets = np.zeros(len(names) + 1, dtype="<u4")
+    np.cumsum([len(name) for name in names], out=offsets[1:])
+    aspect_ratios = np.rint(
+        np.array([row.aspect_ratio for row in metadata], dtype=np.float64)
+        * ASPECT_SCALE
+    )
+    check_column(
+        aspect_ratios,
+        1,
+        np.iinfo(np.uint16).max,
+        "aspect_ratio",
+        metadata,
+        manifest_file,
+    )
+    strings = b"".join(names)
+
+    flags = FLAG_UTC_OFFSETS | (FLAG_VIDEOS if is_for_videos else 0)
+    with open(manifest_file, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(metadata), flags, len(strings)))
+        f.write(timestamps.astype("<i4").tobytes())
+        f.write(offsets.tobytes())
+        f.write(aspect_ratios.astype("<u2").tobytes())
+        f.write(utc_offsets.tobytes())
+        f.write(strings)
+
+
+def read_compact_manifest(manifest_file: str, use_mmap: bool = True) -> CompactManifest:
+    with open(manifest_file, "rb") as f:
+        if use_mmap:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buffer = f.read()
+
+    magic, count, flags, strings_length = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{manifest_file} is not a compact manifest")
+
+    position = HEADER.size
+    timestamps = np.frombuffer(buffer, dtype="<i4", count=count, offset=position)
+    position += timestamps.nbytes
+    offsets = np.frombuffer(buffer, dtype="<u4", count=count + 1, offset=position)
+    position += offsets.nbytes
+    aspect_ratios = np.frombuffer(buffer, dtype="<u2", count=count, offset=position)
+    position += aspect_ratios.nbytes
+    utc_offsets = None
+    if flags & FLAG_UTC_OFFSETS:
+        utc_offsets = np.frombuffer(buffer, dtype="<i2", count=count, offset=position)
+        position += utc_offsets.nbytes
+    strings = memoryview(buffer)[position : position + strings_length]
+
+    return CompactManifest(
+        buffer,
+        bool(flags & FLAG_VIDEOS),
+        timestamps,
+        offsets,
+        aspect_ratios,
+        strings,
+        utc_offsets,
+    )
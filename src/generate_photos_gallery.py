@@ -1,4 +1,6 @@
+import hashlib
 import json
+import re
 from pathlib import Path
 import PIL
 import os
@@ -7,15 +9,29 @@ import datetime as dt
 import logging
 import coloredlogs
 import click
-from typing import Tuple, Dict, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple, Dict, List, Optional
 from PIL import Image, ImageFile, ExifTags
 from pydantic import ValidationError
 
+from compact_manifest import write_compact_manifest
+from media_headers import update_media_index
+from precompress import check_encoders, precompress_files, remove_orphaned_variants
+from publish_manifests import publish_manifests
+from search_index import write_search_index
+from tag_cache import cached_tags
+from thumbnails import SKIPPED_EXTENSIONS, generate_thumbnails
+from video_posters import VIDEO_EXTENSIONS, generate_posters
 from models.csv_entry import CsvEntry
-from models.photo_metadata_gapis import GapisMetadata
+from models.photo_metadata_gapis import GapisMetadata, GapisMetadataSummary
+from pipeline_utils import load_json_cache, pool_chunks, save_json_cache
 
 
 default_date = dt.datetime.fromisoformat("2020-01-30T22:35:20+00:00")
+# Plain UTC timestamps, which is what Google sends for nearly every item. Anything
+# else goes through get_date_from_meta.
+# Fractions fromisoformat reads on every Python 3 version
+simple_creation_time = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{3}|\.\d{6})?Z$")
 
 
 def get_script_directory() -> str:
@@ -81,106 +97,604 @@ def get_date_from_meta(photo_metadata: GapisMetadata) -> Optional[dt.datetime]:
         raise ex
 
 
+def parse_metadata_file(
+    source_directory: str, meta_file_name: str, is_for_videos: bool
+) -> CsvEntry:
+    file_name = meta_file_name.replace(".meta.json", "")
+    logging.info("regenerating {}".format(file_name))
+    json_path = f"{source_directory}/{meta_file_name}"
+    try:
+        gapi_metadata: GapisMetadata = None
+        with open(json_path) as raw_metadata:
+            raw_metadata = json.load(raw_metadata)
+            gapi_metadata = GapisMetadata(**raw_metadata)
+
+        created_date = get_date_from_meta(gapi_metadata)
+        aspect_ratio = float(gapi_metadata.mediaMetadata.width) / float(
+            gapi_metadata.mediaMetadata.height
+        )
+
+        thumbnail_file_name = f"{file_name}.jpg" if is_for_videos else None
+        # logging.info(f"Instantiating meta: {file_name}, {thumbnail_file_name}, {aspect_ratio}, {created_date}")
+        return CsvEntry(
+            file_name=file_name,
+            thumbnail_file_name=thumbnail_file_name,
+            aspect_ratio=aspect_ratio,
+            created_date=created_date,
+        )
+
+    except ValidationError as ve:
+        logging.error(f"Validation error while processing {meta_file_name}:")
+        for error in ve.errors():
+            logging.error(
+                f"  {error['loc'][0]}: {error['msg']} (type={error['type']})"
+            )
+        raise ve
+    except Exception as ex:
+        logging.exception("{}: {}".format(meta_file_name, ex), exc_info=False)
+        raise ex
+
+
+class MetadataParseError(Exception):
+    """Names the sidecar that failed to parse, even when raised in a pool worker."""
+
+    def __init__(self, meta_file_name: str, message: str):
+        super().__init__(meta_file_name, message)
+        self.meta_file_name = meta_file_name
+        self.message = message
+
+    def __str__(self):
+        return f"{self.meta_file_name}: {self.message}"
+
+
+def parse_creation_times(creation_times: List[str]) -> List[Optional[dt.datetime]]:
+    """Parse a batch of `creationTime` strings without get_date_from_meta's cleanup.
+
+    Returns None for any string that isn't a plain UTC timestamp so the caller
+    can fall back to get_date_from_meta for it. Going through numpy
+    datetime64 and back to datetime objects was ~10x slower than the C
+    fromisoformat on the matched strings.
+    """
+    return [
+        dt.datetime.fromisoformat(creation_time[:-1]).replace(tzinfo=dt.timezone.utc)
+        if simple_creation_time.match(creation_time)
+        else None
+        for creation_time in creation_times
+    ]
+
+
+def parse_metadata_batch(
+    source_directory: str, meta_file_names: List[str], is_for_videos: bool
+) -> List[CsvEntry]:
+    """Fast path for a batch of sidecars.
+
+    Each sidecar is validated straight from its raw bytes against
+    GapisMetadataSummary, which accepts the same sidecars as GapisMetadata but
+    skips the camera/video details, and dates are parsed for the whole batch
+    at once. Sidecars that fail any of that, including ones
+    that can't be read, go through the full parse_metadata_file path instead,
+    so every error is reported the same way.
+    """
+    rows: List[Optional[CsvEntry]] = [None] * len(meta_file_names)
+    fast: List[Tuple[int, str, float]] = []
+    for index, meta_file_name in enumerate(meta_file_names):
+        try:
+            with open(f"{source_directory}/{meta_file_name}", "rb") as raw_metadata:
+                raw = raw_metadata.read()
+            summary = GapisMetadataSummary.model_validate_json(raw).mediaMetadata
+            aspect_ratio = float(summary.width) / float(summary.height)
+        except (OSError, ValidationError, ValueError, ZeroDivisionError):
+            # The full path reports it, wrapped in MetadataParseError
+            continue
+        fast.append((index, summary.creationTime, aspect_ratio))
+
+    dates = parse_creation_times([creation_time for _, creation_time, _ in fast])
+    for (index, _, aspect_ratio), created_date in zip(fast, dates):
+        if created_date is None:
+            continue
+        file_name = meta_file_names[index].replace(".meta.json", "")
+        rows[index] = CsvEntry(
+            file_name=file_name,
+            thumbnail_file_name=f"{file_name}.jpg" if is_for_videos else None,
+            aspect_ratio=aspect_ratio,
+            created_date=created_date,
+        )
+
+    for index, meta_file_name in enumerate(meta_file_names):
+        if rows[index] is not None:
+            continue
+        try:
+            rows[index] = parse_metadata_file(
+                source_directory, meta_file_name, is_for_videos
+            )
+        except Exception as ex:
+            raise MetadataParseError(meta_file_name, str(ex)) from ex
+    return rows
+
+
+def parse_metadata_files(
+    source_directory: str,
+    meta_file_names: List[str],
+    is_for_videos: bool,
+    workers: int = 1,
+) -> List[CsvEntry]:
+    """Parse sidecars, optionally across a process pool.
+
+    Rows come back in the same order as `meta_file_names` regardless of the
+    worker count, so the output does not depend on how the work was split.
+    """
+    if workers <= 1 or len(meta_file_names) < 2:
+        return parse_metadata_batch(source_directory, meta_file_names, is_for_videos)
+
+    chunks = pool_chunks(meta_file_names, workers, 500)
+    rows: List[CsvEntry] = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                parse_metadata_batch, source_directory, chunk, is_for_videos
+            )
+            for chunk in chunks
+        ]
+        for future in futures:
+            try:
+                rows.extend(future.result())
+            except MetadataParseError as ex:
+                logging.error(f"Failed to parse {ex.meta_file_name}: {ex.message}")
+                for pending in futures:
+                    pending.cancel()
+                raise
+    return rows
+
+
+def rows_without_sidecars(
+    source_directory: str,
+    is_for_videos: bool,
+    workers: int = 1,
+) -> List[CsvEntry]:
+    """Rows for media with no `.meta.json`, e.g. files imported with sync_directory.py.
+
+    The capture date and size come from the directory's media index, which
+    holds what the EXIF or MP4 header says; files without a usable date get
+    `default_date`. Only files without a sidecar have their headers read.
+    """
+    file_names = set(os.listdir(source_directory))
+    with_sidecars = {
+        file_name[: -len(".meta.json")]
+        for file_name in file_names
+        if file_name.endswith(".meta.json")
+    }
+    index = update_media_index(source_directory, workers, skip_probe=with_sidecars)
+    missing = sorted(
+        file_name
+        for file_name in index
+        if file_name not in with_sidecars
+        and (
+            file_name.lower().endswith(VIDEO_EXTENSIONS)
+            if is_for_videos
+            else not file_name.lower().endswith(SKIPPED_EXTENSIONS)
+        )
+    )
+    rows = []
+    undated = 0
+    for file_name in missing:
+        header = index[file_name]
+        if "error" in header:
+            continue
+        if header["created_date"] is None:
+            undated += 1
+            created_date = default_date
+        else:
+            created_date = dt.datetime.fromisoformat(header["created_date"])
+        rows.append(
+            CsvEntry(
+                file_name=file_name,
+                thumbnail_file_name=f"{file_name}.jpg" if is_for_videos else None,
+                aspect_ratio=header["width"] / header["height"],
+                created_date=created_date,
+            )
+        )
+    if missing:
+        print(
+            f"Added {len(rows)} of {len(missing)} files without sidecars, "
+            f"{undated} without a capture date"
+        )
+    return rows
+
+
+def load_metadata_cache(cache_file: str) -> Dict[str, dict]:
+    """Load the sidecar cache written by a previous incremental run.
+
+    Entries are keyed by sidecar file name and hold the sidecar's mtime/size
+    alongside the values parsed out of it. A missing or unreadable cache is
+    treated as empty, which just means everything gets reparsed.
+    """
+    return load_json_cache(cache_file, "metadata cache") or {}
+
+
+def save_metadata_cache(cache_file: str, cache: Dict[str, dict]) -> None:
+    save_json_cache(cache_file, cache)
+
+
+def format_csv_line(
+    row: CsvEntry, source_directory: str, thumbnail_directory: str, is_for_videos: bool
+) -> str:
+    if is_for_videos:
+        thumbnail_folder_name = os.path.basename(thumbnail_directory)
+        video_folder_name =  os.path.basename(source_directory)
+        return '"{}","{}",{:.3f},{}\n'.format(
+            os.path.join(video_folder_name, row.file_name),
+            os.path.join(thumbnail_folder_name, row.thumbnail_file_name),
+            row.aspect_ratio,
+            row.created_date,
+        )
+    if row.tokens:
+        return '"{}",{:.3f},{},{}\n'.format(
+            row.file_name, row.aspect_ratio, row.created_date, ";".join(row.tokens)
+        )
+    return '"{}",{:.3f},{}\n'.format(
+        row.file_name, row.aspect_ratio, row.created_date
+    )
+
+
+def write_csv(
+    metadata: List[CsvEntry],
+    source_directory: str,
+    thumbnail_directory: str,
+    csv_file: str,
+    is_for_videos: bool,
+) -> None:
+    with open(csv_file, "w") as csv_out:
+        for row in metadata:
+            csv_out.write(
+                format_csv_line(
+                    row, source_directory, thumbnail_directory, is_for_videos
+                )
+            )
+
+
+def manifest_sort_key(entry: CsvEntry) -> Tuple[int, dt.datetime, str]:
+    """Order of the rows in every manifest, applied newest first.
+
+    Rows are grouped by the year in their own timezone, the same key
+    `write_year_shards` splits on, before the absolute time. A photo taken
+    just before midnight on New Year's Eve west of UTC is then still the last
+    row of its year rather than sitting among the next year's rows, so
+    positions in photos.csv (the search ordinals) line up with the year shards.
+    """
+    return entry.created_date.year, entry.created_date, entry.file_name
+
+
+def write_year_shards(
+    metadata: List[CsvEntry],
+    source_directory: str,
+    thumbnail_directory: str,
+    shard_directory: str,
+    is_for_videos: bool,
+) -> None:
+    """Split the manifest into one CSV per year plus a small `index.json`.
+
+    For `photos/` this writes `photos/2024.csv`, `photos/2023.csv`, ... and
+    `photos/index.json` listing each year with its row count and a content
+    hash, so the page can fetch the index and then only the year it shows.
+    Shards whose content hasn't changed are left untouched.
+    """
+    shard_folder_name = os.path.basename(shard_directory)
+    os.makedirs(shard_directory, exist_ok=True)
+
+    # `metadata` is in `manifest_sort_key` order, so each year's rows are contiguous
+    lines_by_year: Dict[int, List[str]] = {}
+    for row in metadata:
+        lines_by_year.setdefault(row.created_date.year, []).append(
+            format_csv_line(row, source_directory, thumbnail_directory, is_for_videos)
+        )
+
+    index = []
+    for year in sorted(lines_by_year, reverse=True):
+        content = "".join(lines_by_year[year]).encode("utf-8")
+        shard_file = os.path.join(shard_directory, f"{year}.csv")
+        existing = None
+        if os.path.exists(shard_file):
+            with open(shard_file, "rb") as f:
+                existing = f.read()
+        if existing != content:
+            with open(shard_file, "wb") as f:
+                f.write(content)
+        index.append(
+            {
+                "year": year,
+                "count": len(lines_by_year[year]),
+                "hash": hashlib.sha256(content).hexdigest()[:16],
+                "file": f"{shard_folder_name}/{year}.csv",
+            }
+        )
+
+    for filename in os.listdir(shard_directory):
+        stem = filename[:-4]
+        if filename.endswith(".csv") and stem.isdigit() and int(stem) not in lines_by_year:
+            os.remove(os.path.join(shard_directory, filename))
+
+    with open(os.path.join(shard_directory, "index.json"), "w") as f:
+        json.dump({"years": index}, f, indent=2)
+
+
 def regenerate_csv(
-    source_directory: str, thumbnail_directory: str, csv_file: str, is_for_videos: bool
+    source_directory: str,
+    thumbnail_directory: str,
+    csv_file: str,
+    is_for_videos: bool,
+    cache_file: Optional[str] = None,
+    workers: int = 1,
+    shard_directory: Optional[str] = None,
+    compact_file: Optional[str] = None,
+    search_directory: Optional[str] = None,
+    search_tokens_file: Optional[str] = None,
+    tags: Optional[Dict[str, List[str]]] = None,
+    without_sidecars: bool = False,
 ) -> None:
-    images = os.listdir(source_directory)
+    """Rebuild `csv_file` from the `.meta.json` sidecars in `source_directory`.
+
+    When `cache_file` is given the rebuild is incremental: sidecars whose mtime
+    and size match the cache are not reopened, new or changed ones are parsed,
+    and sidecars that disappeared are dropped from the cache. Sidecars that do
+    need parsing are spread over `workers` processes. If `shard_directory` is
+    given, per-year shards and their index are written there as well, and
+    `compact_file` gets the same rows in the compact binary format.
+    """
     metadata: list[CsvEntry] = []
+    stale: List[str] = []
 
-    with open(csv_file, "w") as csv_out:
-        for filename in images:
+    if cache_file is None:
+        for filename in sorted(os.listdir(source_directory)):
             if not filename.endswith(".meta.json"):
                 # logging.info("Skipping JSON file: {}".format(f))
                 continue
-            meta_file_name = filename
-            file_name = filename.replace(".meta.json", "")
-            logging.info("regenerating {}".format(file_name))
-            json_path = f"{source_directory}/{meta_file_name}"
-            try:
-                gapi_metadata: GapisMetadata = None
-                with open(json_path) as raw_metadata:
-                    raw_metadata = json.load(raw_metadata)
-                    gapi_metadata = GapisMetadata(**raw_metadata)
-
-                created_date = get_date_from_meta(gapi_metadata)
-                aspect_ratio = float(gapi_metadata.mediaMetadata.width) / float(
-                    gapi_metadata.mediaMetadata.height
-                )
-
-                # metadata[file_name] = (aspect_ratio, created_date)
-                thumbnail_file_name = f"{file_name}.jpg" if is_for_videos else None
-                # logging.info(f"Instantiating meta: {file_name}, {thumbnail_file_name}, {aspect_ratio}, {created_date}")
+            stale.append(filename)
+    else:
+        previous_cache = load_metadata_cache(cache_file)
+        cache: Dict[str, dict] = {}
+        with os.scandir(source_directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".meta.json"):
+                    continue
+                stat = entry.stat()
+                cached = previous_cache.get(entry.name)
+                cache[entry.name] = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+                if (
+                    cached is None
+                    or cached["mtime"] != stat.st_mtime_ns
+                    or cached["size"] != stat.st_size
+                ):
+                    stale.append(entry.name)
+                    continue
+                file_name = entry.name.replace(".meta.json", "")
                 metadata.append(
                     CsvEntry(
                         file_name=file_name,
-                        thumbnail_file_name=thumbnail_file_name,
-                        aspect_ratio=aspect_ratio,
-                        created_date=created_date,
+                        thumbnail_file_name=(
+                            f"{file_name}.jpg" if is_for_videos else None
+                        ),
+                        aspect_ratio=cached["aspect_ratio"],
+                        created_date=dt.datetime.fromisoformat(
+                            cached["created_date"]
+                        ),
                     )
                 )
+                cache[entry.name].update(
+                    aspect_ratio=cached["aspect_ratio"],
+                    created_date=cached["created_date"],
+                )
+        dropped = len(set(previous_cache) - set(cache))
+        print(
+            f"Reparsing {len(stale)} of {len(cache)} sidecars, dropped {dropped} deleted"
+        )
 
-            except ValidationError as ve:
-                logging.error(f"Validation error while processing {meta_file_name}:")
-                for error in ve.errors():
-                    logging.error(
-                        f"  {error['loc'][0]}: {error['msg']} (type={error['type']})"
-                    )
-                raise ve
-            except Exception as ex:
-                logging.exception("{}: {}".format(meta_file_name, ex), exc_info=False)
-                raise ex
-
-        # metadata = {
-        #     k: v
-        #     for k, v in sorted(
-        #         metadata.items(), key=lambda item: item[1][1], reverse=True
-        #     )
-        # }
-        metadata = sorted(metadata, key=lambda entry: entry.created_date, reverse=True)
+    parsed = parse_metadata_files(source_directory, stale, is_for_videos, workers)
+    metadata.extend(parsed)
+    if cache_file is not None:
+        for meta_file_name, row in zip(stale, parsed):
+            cache[meta_file_name].update(
+                aspect_ratio=row.aspect_ratio,
+                created_date=row.created_date.isoformat(),
+            )
+
+    if without_sidecars:
+        metadata.extend(rows_without_sidecars(source_directory, is_for_videos, workers))
 
+    # Newest first; ties fall back to the file name so the order does not
+    # depend on directory listing order or on how parsing was split up.
+    metadata = sorted(metadata, key=manifest_sort_key, reverse=True)
+    if tags is not None:
         for row in metadata:
-            if is_for_videos:
-                thumbnail_folder_name = os.path.basename(thumbnail_directory)
-                video_folder_name =  os.path.basename(source_directory)
-                csv_out.write(
-                    '"{}","{}",{:.3f},{}\n'.format(
-                        os.path.join(video_folder_name, row.file_name),
-                        os.path.join(thumbnail_folder_name, row.thumbnail_file_name),
-                        row.aspect_ratio,
-                        row.created_date,
-                    )
-                )
-            else:
-                csv_out.write(
-                    '"{}",{:.3f},{}\n'.format(
-                        row.file_name, row.aspect_ratio, row.created_date
-                    )
-                )
-        csv_out.close()
+            row.tokens = tags.get(row.file_name, [])
+    write_csv(metadata, source_directory, thumbnail_directory, csv_file, is_for_videos)
+    if shard_directory is not None:
+        write_year_shards(
+            metadata,
+            source_directory,
+            thumbnail_directory,
+            shard_directory,
+            is_for_videos,
+        )
+    if compact_file is not None:
+        write_compact_manifest(metadata, compact_file, is_for_videos)
+    if search_directory is not None:
+        write_search_index(metadata, search_directory, search_tokens_file)
+
+    if cache_file is not None:
+        save_metadata_cache(cache_file, cache)
 
 
 @click.command()
-def main():
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Only reparse sidecars that changed since the last run (uses *.cache.json)",
+)
+@click.option(
+    "--workers",
+    default=1,
+    show_default=True,
+    help="Number of processes used to parse sidecars",
+)
+@click.option(
+    "--compact",
+    is_flag=True,
+    help="Also write photos.bin/videos.bin in the compact binary manifest format",
+)
+@click.option(
+    "--thumbnails/--no-thumbnails",
+    default=True,
+    show_default=True,
+    help="Build image thumbnails and video posters from the local files. On by default: the page needs them, as sync_from_photos.py no longer downloads =w640 thumbnails",
+)
+@click.option(
+    "--without-sidecars/--sidecars-only",
+    default=True,
+    show_default=True,
+    help="Also list media with no .meta.json, dated from their EXIF/MP4 headers",
+)
+@click.option(
+    "--tag",
+    is_flag=True,
+    help="Fill the tokens column by classifying the image thumbnails with a small torchvision model on CPU (cached in photos.tags.json)",
+)
+@click.option(
+    "--tag-batch-size",
+    default=64,
+    show_default=True,
+    help="Thumbnails per inference batch when tagging",
+)
+@click.option(
+    "--precompress",
+    is_flag=True,
+    help="Also write .gz/.br variants of the manifests for upload with Content-Encoding (requires --publish)",
+)
+@click.option(
+    "--publish",
+    is_flag=True,
+    help="Also copy the manifests to content-hashed names under manifests/ and update manifest.json",
+)
+def main(
+    incremental: bool,
+    workers: int,
+    compact: bool,
+    thumbnails: bool,
+    without_sidecars: bool,
+    tag: bool,
+    tag_batch_size: int,
+    precompress: bool,
+    publish: bool,
+):
+    # The page only asks for the variants when manifest.json lists them
+    if precompress and not publish:
+        raise click.UsageError("--precompress requires --publish")
+    if precompress:
+        try:
+            check_encoders()
+        except RuntimeError as ex:
+            raise click.UsageError(str(ex))
     script_directory = get_script_directory()
     parent_directory = os.path.dirname(script_directory)
     image_thumbnail_directory = os.path.join(parent_directory, "thumbnail")
     video_thumbnail_directory = os.path.join(parent_directory, "video_thumbnail")
     # web_directory = os.path.join(parent_directory, "web")
     image_metadata_file = os.path.join(parent_directory, "photos.csv")
+    image_shard_directory = os.path.join(parent_directory, "photos")
+    image_search_directory = os.path.join(parent_directory, "search")
+    search_tokens_file = os.path.join(parent_directory, "search-tokens.csv")
     video_metadata_file = os.path.join(parent_directory, "videos.csv")
     image_source_directory = os.path.join(parent_directory, "images")
     video_source_directory = os.path.join(parent_directory, "videos")
+    image_cache_file = (
+        os.path.join(parent_directory, "photos.cache.json") if incremental else None
+    )
+    video_cache_file = (
+        os.path.join(parent_directory, "videos.cache.json") if incremental else None
+    )
+    image_compact_file = (
+        os.path.join(parent_directory, "photos.bin") if compact else None
+    )
+    video_compact_file = (
+        os.path.join(parent_directory, "videos.bin") if compact else None
+    )
     
+    if thumbnails:
+        print("Generating image thumbnails...")
+        generate_thumbnails(
+            image_source_directory, image_thumbnail_directory, workers=workers
+        )
+    tags = None
+    tags_cache_file = os.path.join(parent_directory, "photos.tags.json")
+    if tag:
+        # torch takes seconds to import, so only load it when tagging
+        from image_tagging import tag_images
+
+        print("Tagging images...")
+        tags = tag_images(
+            image_thumbnail_directory,
+            tags_cache_file,
+            workers=workers,
+            batch_size=tag_batch_size,
+        )
+    elif os.path.exists(tags_cache_file):
+        # Keep the tags of an earlier --tag run rather than blanking the column
+        tags = cached_tags(tags_cache_file)
     print("Regenerating image metadata...")
     regenerate_csv(
-        image_source_directory, image_thumbnail_directory, image_metadata_file, False
+        image_source_directory,
+        image_thumbnail_directory,
+        image_metadata_file,
+        False,
+        cache_file=image_cache_file,
+        workers=workers,
+        shard_directory=image_shard_directory,
+        compact_file=image_compact_file,
+        search_directory=image_search_directory,
+        search_tokens_file=search_tokens_file,
+        tags=tags,
+        without_sidecars=without_sidecars,
     )
-    # print("Processing images...")
-    # process_images(image_source_directory, thumbnails_directory, image_metadata_file)
+    if thumbnails:
+        print("Extracting video posters...")
+        generate_posters(
+            video_source_directory, video_thumbnail_directory, workers=workers
+        )
     print("Regenerating video metadata...")
     regenerate_csv(
-        video_source_directory, video_thumbnail_directory, video_metadata_file, True
+        video_source_directory,
+        video_thumbnail_directory,
+        video_metadata_file,
+        True,
+        cache_file=video_cache_file,
+        workers=workers,
+        compact_file=video_compact_file,
+        without_sidecars=without_sidecars,
     )
+    if precompress:
+        print("Compressing manifests...")
+        remove_orphaned_variants(image_shard_directory)
+        remove_orphaned_variants(image_search_directory)
+        precompress_files(
+            [
+                image_metadata_file,
+                video_metadata_file,
+                search_tokens_file,
+                os.path.join(image_shard_directory, "index.json"),
+            ]
+            + sorted(
+                os.path.join(image_shard_directory, file_name)
+                for file_name in os.listdir(image_shard_directory)
+                if file_name.endswith(".csv")
+            )
+            + sorted(
+                os.path.join(image_search_directory, file_name)
+                for file_name in os.listdir(image_search_directory)
+                if file_name.endswith(".json")
+            )
+        )
+    if publish:
+        print("Publishing content-hashed manifests...")
+        publish_manifests(parent_directory, precompress=precompress)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+from torchvision.models import MobileNet_V3_Small_Weights, mobilenet_v3_small
+
+from tag_cache import file_content_hash, load_tag_cache, save_tag_cache
+
+# Tag from the 250px thumbnails: the model only sees 224px, and they decode far
+# faster than the originals.
+TAGGING_THUMBNAIL_HEIGHT = 250
+TOP_K = 5
+MIN_PROBABILITY = 0.15
+WORD = re.compile(r"[a-z0-9]+")
+
+
+class ThumbnailDataset(Dataset):
+    def __init__(self, paths: List[str], transform):
+        self.paths = paths
+        self.transform = transform
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, index: int) -> Tuple[torch.Tensor, bool]:
+        try:
+            with Image.open(self.paths[index]) as im:
+                return self.transform(im.convert("RGB")), True
+        except Exception as ex:
+            logging.error(f"Failed to load {self.paths[index]} for tagging: {ex}")
+            return torch.zeros(3, 224, 224), False
+
+
+def category_tokens(category: str) -> List[str]:
+    # "golden retriever" -> ["golden", "retriever"]; the CSV tokens column is
+    # ';'-separated and search matches single words
+    return WORD.findall(category.lower())
+
+
+def run_model(
+    paths: List[str], workers: int, batch_size: int
+) -> List[Optional[List[str]]]:
+    """Top categories above MIN_PROBABILITY per image, or None if it could not be read."""
+    weights = MobileNet_V3_Small_Weights.IMAGENET1K_V1
+    categories = weights.meta["categories"]
+    model = mobilenet_v3_small(weights=weights).eval()
+    loader = DataLoader(
+        ThumbnailDataset(paths, weights.transforms()),
+        batch_size=batch_size,
+        num_workers=workers,
+        # Workers decode the next batches while the main process runs the model
+        prefetch_factor=4 if workers > 0 else None,
+    )
+
+    results: List[Optional[List[str]]] = []
+    with torch.inference_mode():
+        for images, loaded in loader:
+            probabilities = model(images).softmax(dim=1)
+            top_probabilities, top_indices = probabilities.topk(TOP_K, dim=1)
+            for ok, row_probabilities, row_indices in zip(
+                loaded.tolist(), top_probabilities.tolist(), top_indices.tolist()
+            ):
+                if not ok:
+                    results.append(None)
+                    continue
+                tokens: List[str] = []
+                for probability, index in zip(row_probabilities, row_indices):
+                    if probability < MIN_PROBABILITY:
+                        break
+                    for token in category_tokens(categories[index]):
+                        if token not in tokens:
+                            tokens.append(token)
+                results.append(tokens)
+    return results
+
+
+def tag_images(
+    thumbnail_directory: str,
+    cache_file: str,
+    workers: int = 1,
+    batch_size: int = 64,
+) -> Dict[str, List[str]]:
+    """Classify every image thumbnail on CPU and return file name -> tokens.
+
+    Only thumbnails whose content hash is not in `cache_file` are run through
+    the model.
+    """
+    source_directory = os.path.join(thumbnail_directory, str(TAGGING_THUMBNAIL_HEIGHT))
+    cache = load_tag_cache(cache_file)
+    files: Dict[str, list] = {}
+    hashes: Dict[str, str] = {}
+    with os.scandir(source_directory) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            cached = cache["files"].get(entry.name)
+            if cached is not None and cached[:2] == [stat.st_mtime_ns, stat.st_size]:
+                content_hash = cached[2]
+            else:
+                content_hash = file_content_hash(entry.path)
+            files[entry.name] = [stat.st_mtime_ns, stat.st_size, content_hash]
+            hashes[entry.name] = content_hash
+
+    # Identical thumbnails only need to go through the model once
+    representatives: Dict[str, str] = {}
+    for name, content_hash in sorted(hashes.items()):
+        representatives.setdefault(content_hash, name)
+    untagged = [
+        (content_hash, name)
+        for content_hash, name in representatives.items()
+        if content_hash not in cache["tags"]
+    ]
+    print(f"Tagging {len(untagged)} of {len(hashes)} images")
+    if untagged:
+        start = time.monotonic()
+        results = run_model(
+            [os.path.join(source_directory, name) for _, name in untagged],
+            workers,
+            batch_size,
+        )
+        elapsed = max(time.monotonic() - start, 1e-9)
+        print(
+            f"Tagged {len(untagged)} images in {elapsed:.1f}s "
+            f"({len(untagged) / elapsed:.1f} images/s)"
+        )
+        for (content_hash, _), tokens in zip(untagged, results):
+            # Unreadable thumbnails are retried next time
+            if tokens is not None:
+                cache["tags"][content_hash] = tokens
+
+    live_hashes = set(hashes.values())
+    cache["files"] = files
+    cache["tags"] = {
+        content_hash: tokens
+        for content_hash, tokens in cache["tags"].items()
+        if content_hash in live_hashes
+    }
+    save_tag_cache(cache_file, cache)
+    return {
+        name: cache["tags"].get(content_hash, [])
+        for name, content_hash in hashes.items()
+    }
@@ -0,0 +1,299 @@
+import datetime as dt
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import click
+import coloredlogs
+
+from media_headers import IMAGE_EXTENSIONS, probe_file
+from video_posters import VIDEO_EXTENSIONS
+
+COPY_BUFFER_SIZE = 1024 * 1024
+# Takeout never writes sidecars anywhere near this big; album metadata is tiny too
+MAX_SIDECAR_SIZE = 1024 * 1024
+# Sidecar names are cut to this many characters before the (N) suffix and ".json"
+MAX_SIDECAR_STEM = 46
+SUPPLEMENTAL = ".supplemental-metadata"
+EDITED_SUFFIXES = ("-edited", "-bearbeitet", "-modifié", "-editado", "-modificato")
+DUPLICATE_SUFFIX = re.compile(r"^(.*)\((\d+)\)$")
+# Ends in .part so every other tool skips it, but is never mistaken for a
+# resumable download from sync_from_photos.py
+PARTIAL_SUFFIX = ".takeout.part"
+CLAIM_POLL_SECONDS = 0.05
+
+
+def iter_archive(archive_path: str) -> Iterator[Tuple[str, int, object]]:
+    """Yield (member name, size, open file) for every regular file, streaming from the archive."""
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as member:
+                        yield info.filename, info.file_size, member
+        return
+    # "r|*" reads the (compressed) tar strictly front to back, never seeking
+    with tarfile.open(archive_path, "r|*") as archive:
+        for info in archive:
+            if info.isfile():
+                yield info.name, info.size, archive.extractfile(info)
+
+
+def media_directory(
+    file_name: str, image_directory: str, video_directory: str
+) -> Optional[str]:
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension in VIDEO_EXTENSIONS:
+        return video_directory
+    if extension in IMAGE_EXTENSIONS:
+        return image_directory
+    return None
+
+
+def claim_output(directory: str, file_name: str, size: int) -> Tuple[str, bool]:
+    """Pick where a member goes: (path, True) to write it there, or (existing copy, False).
+
+    Takeout repeats a photo in every album folder it belongs to, and re-running
+    an import must not duplicate anything, so an existing file of the same name
+    and size is taken to be the same photo. That is a heuristic: contents are
+    never compared, so two different photos that happen to share a name and a
+    byte count keep only the first. A file with the same name and a different
+    size gets a `_1`, `_2`, ... suffix. While another archive reader is still
+    writing a name, this waits for it to finish and then compares against what
+    it wrote, so the same photo in two archives ends up in one file.
+    """
+    stem, extension = os.path.splitext(file_name)
+    attempt = 0
+    while True:
+        name = file_name if attempt == 0 else f"{stem}_{attempt}{extension}"
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            if os.path.getsize(path) == size:
+                return path, False
+            attempt += 1
+            continue
+        try:
+            # Exclusive create, so two archive readers never write the same file
+            fd = os.open(path + PARTIAL_SUFFIX, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(fd)
+        except FileExistsError:
+            time.sleep(CLAIM_POLL_SECONDS)
+            continue
+        if os.path.exists(path):
+            # The other reader finished between the check and the claim
+            os.remove(path + PARTIAL_SUFFIX)
+            continue
+        return path, True
+
+
+def remove_partial_files(directory: str) -> None:
+    """Delete what an interrupted import left half-written; nothing else is running yet."""
+    for file_name in os.listdir(directory):
+        if file_name.endswith(PARTIAL_SUFFIX):
+            logging.info(f"Removing {file_name} left by an interrupted import")
+            os.remove(os.path.join(directory, file_name))
+
+
+def read_archive(
+    archive_path: str, image_directory: str, video_directory: str
+) -> Tuple[
+    List[Tuple[str, str, dict]], List[Tuple[str, str, str, Optional[dict], bool]]
+]:
+    """Stream one archive: copy media straight to its output directory and keep sidecars in memory.
+
+    Returns the sidecars as (archive folder, name, parsed JSON) and the media
+    as (archive folder, name, output path, header probe, is video). Sidecars
+    are matched afterwards because a sidecar can sit in a different archive of
+    the same export than its photo.
+    """
+    sidecars = []
+    media = []
+    start = time.monotonic()
+    copied = 0
+    for member_name, size, member in iter_archive(archive_path):
+        folder, file_name = os.path.split(member_name)
+        if file_name.lower().endswith(".json"):
+            if size <= MAX_SIDECAR_SIZE:
+                try:
+                    data = json.load(member)
+                except ValueError:
+                    logging.warning(f"Skipping unreadable JSON {member_name}")
+                    continue
+                # Album metadata.json and friends have no photo time
+                if isinstance(data, dict) and "photoTakenTime" in data:
+                    sidecars.append((folder, file_name, data))
+            continue
+
+        directory = media_directory(file_name, image_directory, video_directory)
+        if directory is None:
+            continue
+        output, claimed = claim_output(directory, file_name, size)
+        if claimed:
+            try:
+                with open(output + PARTIAL_SUFFIX, "wb") as out:
+                    shutil.copyfileobj(member, out, COPY_BUFFER_SIZE)
+            except BaseException:
+                # Readers waiting on this name must not poll a dead claim forever
+                os.remove(output + PARTIAL_SUFFIX)
+                raise
+            os.replace(output + PARTIAL_SUFFIX, output)
+            copied += size
+        # Already imported copies still go through sidecar matching, so a run
+        # interrupted before the sidecars were written gets them on the next one
+        try:
+            # Read the header back while it is still in the page cache
+            header = probe_file(output)
+        except Exception as ex:
+            logging.warning(f"Could not read the size of {output}: {ex}")
+            header = None
+        media.append((folder, file_name, output, header, directory == video_directory))
+
+    elapsed = max(time.monotonic() - start, 1e-9)
+    print(
+        f"{os.path.basename(archive_path)}: {len(media)} media, {len(sidecars)} sidecars, "
+        f"{copied / 1e6:.1f} MB at {copied / 1e6 / elapsed:.1f} MB/s"
+    )
+    return sidecars, media
+
+
+def sidecar_candidates(file_name: str) -> Iterator[str]:
+    """Sidecar names Takeout may have used for `file_name`, most likely first.
+
+    - `IMG_1.JPG` -> `IMG_1.JPG.json` or `IMG_1.JPG.supplemental-metadata.json`,
+      either cut to 46 characters before ".json" (so `.supplemental-metad.json`
+      and friends)
+    - duplicates: `IMG_1(2).JPG` -> `IMG_1.JPG(2).json`
+    - edits share the original's sidecar: `IMG_1-edited.JPG` -> `IMG_1.JPG.json`
+    - some older exports drop the extension: `IMG_1.json`
+    """
+    stem, extension = os.path.splitext(file_name)
+    duplicate = ""
+    match = DUPLICATE_SUFFIX.match(stem)
+    if match:
+        stem, duplicate = match.group(1), f"({match.group(2)})"
+    for suffix in EDITED_SUFFIXES:
+        if stem.lower().endswith(suffix):
+            stem = stem[: -len(suffix)]
+            break
+    original = stem + extension
+
+    full = original + SUPPLEMENTAL
+    yield f"{original[:MAX_SIDECAR_STEM]}{duplicate}.json"
+    for length in range(len(full), len(original), -1):
+        yield f"{full[:min(length, MAX_SIDECAR_STEM)]}{duplicate}.json"
+    yield f"{stem}{duplicate}.json"
+    if duplicate:
+        # Occasionally the counter stays where it was in the media name
+        yield f"{file_name}.json"
+
+
+def find_sidecar(file_name: str, sidecar_names: Set[str]) -> Optional[str]:
+    for candidate in sidecar_candidates(file_name):
+        if candidate in sidecar_names:
+            return candidate
+    return None
+
+
+def normalized_sidecar(
+    takeout: dict, output: str, header: dict, is_video: bool
+) -> dict:
+    """Convert a Takeout sidecar to the Google Photos API shape `.meta.json` files use."""
+    taken = takeout.get("photoTakenTime") or takeout.get("creationTime")
+    created = dt.datetime.fromtimestamp(int(taken["timestamp"]), dt.timezone.utc)
+    file_name = os.path.basename(output)
+    media_metadata = {
+        "creationTime": created.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "width": str(header["width"]),
+        "height": str(header["height"]),
+    }
+    media_metadata["video" if is_video else "photo"] = {}
+    return {
+        "id": takeout.get("url") or file_name,
+        "productUrl": takeout.get("url", ""),
+        "baseUrl": "",
+        "mimeType": mimetypes.guess_type(file_name)[0]
+        or ("video/mp4" if is_video else "image/jpeg"),
+        "mediaMetadata": media_metadata,
+        "filename": file_name,
+    }
+
+
+def import_takeout(
+    archives: List[str], image_directory: str, video_directory: str, workers: int = 1
+) -> None:
+    os.makedirs(image_directory, exist_ok=True)
+    os.makedirs(video_directory, exist_ok=True)
+    remove_partial_files(image_directory)
+    remove_partial_files(video_directory)
+    if workers <= 1 or len(archives) < 2:
+        results = [
+            read_archive(archive, image_directory, video_directory)
+            for archive in archives
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(archives))) as executor:
+            results = list(
+                executor.map(
+                    read_archive,
+                    archives,
+                    [image_directory] * len(archives),
+                    [video_directory] * len(archives),
+                )
+            )
+
+    # Sidecar name index per archive folder, across every archive of the export
+    sidecar_names: Dict[str, Set[str]] = {}
+    sidecars: Dict[Tuple[str, str], dict] = {}
+    for archive_sidecars, _ in results:
+        for folder, name, data in archive_sidecars:
+            sidecar_names.setdefault(folder, set()).add(name)
+            sidecars[(folder, name)] = data
+
+    written = unmatched = 0
+    for _, archive_media in results:
+        for folder, file_name, output, header, is_video in archive_media:
+            sidecar = find_sidecar(file_name, sidecar_names.get(folder, set()))
+            meta_file = f"{output}.meta.json"
+            if sidecar is None or header is None:
+                # generate_photos_gallery.py falls back to the EXIF/MP4 header
+                unmatched += 1
+                continue
+            if os.path.exists(meta_file):
+                continue
+            with open(meta_file, "w") as f:
+                json.dump(
+                    normalized_sidecar(
+                        sidecars[(folder, sidecar)], output, header, is_video
+                    ),
+                    f,
+                    indent=2,
+                )
+            written += 1
+    print(f"Wrote {written} sidecars, {unmatched} media without a matching sidecar")
+
+
+@click.command()
+@click.argument("archives", nargs=-1, required=True)
+@click.option("--image-dir", default="images", show_default=True)
+@click.option("--video-dir", default="videos", show_default=True)
+@click.option(
+    "--workers",
+    default=1,
+    show_default=True,
+    help="Archives read at the same time",
+)
+def main(archives: Tuple[str, ...], image_dir: str, video_dir: str, workers: int):
+    import_takeout(list(archives), image_dir, video_dir, workers)
+
+
+if __name__ == "__main__":
+    coloredlogs.install(level="INFO")
+    main()
@@ -0,0 +1,275 @@
+import datetime as dt
+import logging
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from typing import Collection, Dict, List, Optional
+
+import exifread
+from PIL import Image
+
+from pipeline_utils import load_json_cache, pool_chunks, save_json_cache
+
+# Kept inside each media directory; .json files are never uploaded or thumbnailed
+MEDIA_INDEX_FILE_NAME = ".media_index.json"
+INDEX_SKIPPED_EXTENSIONS = (".json", ".part", ".tmp")
+# Stored in every probed entry; entries probed under an older version (or not
+# probed at all) have their headers read again
+INDEX_VERSION = 2
+# Still images, as opposed to the videos that share the index
+IMAGE_EXTENSIONS = (
+    ".jpg",
+    ".jpeg",
+    ".jfif",
+    ".png",
+    ".gif",
+    ".webp",
+    ".heic",
+    ".bmp",
+    ".tif",
+    ".tiff",
+    ".dng",
+    ".cr2",
+    ".nef",
+    ".arw",
+)
+# ISO base media files (MP4/QuickTime family) whose moov box we can read directly
+ISO_MEDIA_EXTENSIONS = (".mp4", ".mov", ".m4v", ".3gp")
+MP4_EPOCH = dt.datetime(1904, 1, 1, tzinfo=dt.timezone.utc)
+EXIF_DATE_TAGS = (
+    ("EXIF DateTimeOriginal", "EXIF OffsetTimeOriginal"),
+    ("EXIF DateTimeDigitized", "EXIF OffsetTimeDigitized"),
+    ("Image DateTime", "EXIF OffsetTime"),
+)
+
+# exifread logs a warning for every file without EXIF, which is most PNGs
+logging.getLogger("exifread").setLevel(logging.ERROR)
+
+
+def parse_exif_date(value: str, offset: Optional[str]) -> Optional[dt.datetime]:
+    """`2019:07:04 18:22:11` (+ `+02:00`) -> aware datetime.
+
+    Without an offset tag the time is taken to be in this machine's local
+    zone, as camera clocks are set to local time.
+    """
+    try:
+        date = dt.datetime.strptime(value.strip()[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+    if offset:
+        try:
+            return date.replace(
+                tzinfo=dt.datetime.strptime(offset.strip(), "%z").tzinfo
+            )
+        except ValueError:
+            pass
+    return date.astimezone()
+
+
+def probe_image(path: str) -> dict:
+    # Image.open only parses the header; pixels are never decoded here
+    with Image.open(path) as im:
+        width, height = im.size
+        image_format = im.format
+    with open(path, "rb") as f:
+        tags = exifread.process_file(f, details=False, extract_thumbnail=False)
+
+    orientation = tags.get("Image Orientation")
+    # Orientations 5-8 are rotated by 90 degrees: the displayed width is the stored height
+    if orientation is not None and orientation.values[:1] in ([5], [6], [7], [8]):
+        width, height = height, width
+
+    created = None
+    for date_tag, offset_tag in EXIF_DATE_TAGS:
+        if date_tag in tags:
+            offset = tags.get(offset_tag)
+            created = parse_exif_date(
+                str(tags[date_tag]), str(offset) if offset is not None else None
+            )
+            if created is not None:
+                break
+    return {
+        "width": width,
+        "height": height,
+        "format": image_format,
+        "created_date": created.isoformat() if created is not None else None,
+    }
+
+
+def iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None):
+    """Yield (type, payload start, payload end) for the ISO media boxes in `data`."""
+    position = start
+    end = len(data) if end is None else end
+    while position + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, position)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, position + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            return
+        yield box_type, position + header, min(position + size, end)
+        position += size
+
+
+def read_moov(path: str) -> Optional[bytes]:
+    """Read just the moov box, seeking over mdat wherever it sits in the file."""
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        position = 0
+        while position + 8 <= file_size:
+            f.seek(position)
+            header = f.read(16)
+            size, box_type = struct.unpack_from(">I4s", header)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from(">Q", header, 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = file_size - position
+            if size < header_size:
+                return None
+            if box_type == b"moov":
+                f.seek(position + header_size)
+                return f.read(size - header_size)
+            position += size
+    return None
+
+
+def probe_iso_media(path: str) -> dict:
+    moov = read_moov(path)
+    if moov is None:
+        raise Exception("No moov box")
+
+    created = None
+    width = height = 0
+    for box_type, start, end in iter_boxes(moov):
+        if box_type == b"mvhd":
+            version = moov[start]
+            seconds = (
+                struct.unpack_from(">Q", moov, start + 4)[0]
+                if version == 1
+                else struct.unpack_from(">I", moov, start + 4)[0]
+            )
+            if seconds:
+                created = MP4_EPOCH + dt.timedelta(seconds=seconds)
+        elif box_type == b"trak" and not width:
+            for child_type, child_start, child_end in iter_boxes(moov, start, end):
+                if child_type != b"tkhd":
+                    continue
+                # The transformation matrix sits 44 bytes before the 16.16 fixed
+                # point width and height that end the box
+                a, b = struct.unpack_from(">ii", moov, child_end - 44)
+                track_width, track_height = struct.unpack_from(
+                    ">II", moov, child_end - 8
+                )
+                track_width >>= 16
+                track_height >>= 16
+                if track_width and track_height:
+                    width, height = track_width, track_height
+                    if a == 0 and abs(b) == 1 << 16:
+                        # Portrait recordings are stored landscape and rotated on playback
+                        width, height = height, width
+    if not width:
+        raise Exception("No video track with dimensions")
+    return {
+        "width": width,
+        "height": height,
+        "format": "ISOBMFF",
+        "created_date": created.isoformat() if created is not None else None,
+    }
+
+
+def probe_file(path: str) -> dict:
+    if path.lower().endswith(ISO_MEDIA_EXTENSIONS):
+        return probe_iso_media(path)
+    return probe_image(path)
+
+
+def probe_chunk(source_directory: str, file_names: List[str]) -> List[dict]:
+    results = []
+    for file_name in file_names:
+        try:
+            results.append(probe_file(os.path.join(source_directory, file_name)))
+        except Exception as ex:
+            logging.warning(f"Failed to read the header of {file_name}: {ex}")
+            results.append({"error": str(ex)})
+    return results
+
+
+def media_index_path(directory: str) -> str:
+    return os.path.join(directory, MEDIA_INDEX_FILE_NAME)
+
+
+def load_media_index(directory: str) -> Dict[str, dict]:
+    return load_json_cache(media_index_path(directory), "media index") or {}
+
+
+def save_media_index(directory: str, index: Dict[str, dict]) -> None:
+    save_json_cache(media_index_path(directory), index)
+
+
+def update_media_index(
+    directory: str,
+    workers: int = 1,
+    save: bool = True,
+    skip_probe: Collection[str] = (),
+) -> Dict[str, dict]:
+    """Bring `<directory>/.media_index.json` up to date and return it.
+
+    The index maps every file in the directory to its mtime and size plus the
+    width, height, format and capture date read from its header, or an
+    "error" for files that aren't readable media. Only new or changed files
+    are probed, in parallel; entries for deleted files are dropped. Both
+    generate_photos_gallery.py and scripts/trim.py read it, so each file's
+    header is read once no matter which of them runs first. With `save`
+    false the updated index is only returned, not written back.
+
+    Files in `skip_probe` that have no current entry are indexed with just
+    their mtime and size, and probed by the first call that needs them.
+    """
+    previous = load_media_index(directory)
+    index: Dict[str, dict] = {}
+    stale = []
+    changed = False
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if (
+                not entry.is_file()
+                or entry.name.startswith(".")
+                or entry.name.lower().endswith(INDEX_SKIPPED_EXTENSIONS)
+            ):
+                continue
+            stat = entry.stat()
+            cached = previous.get(entry.name)
+            if (
+                cached is not None
+                and cached["mtime"] == stat.st_mtime_ns
+                and cached["size"] == stat.st_size
+                and (cached.get("version") == INDEX_VERSION or entry.name in skip_probe)
+            ):
+                index[entry.name] = cached
+                continue
+            index[entry.name] = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+            if entry.name in skip_probe:
+                changed = True
+            else:
+                stale.append(entry.name)
+
+    stale.sort()
+    print(f"Reading headers of {len(stale)} of {len(index)} files in {directory}")
+    chunks = pool_chunks(stale, workers, 200)
+    if workers <= 1:
+        results = [probe_chunk(directory, chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(probe_chunk, [directory] * len(chunks), chunks))
+    for chunk, chunk_results in zip(chunks, results):
+        for file_name, probe in zip(chunk, chunk_results):
+            index[file_name].update(probe, version=INDEX_VERSION)
+
+    if save and (stale or changed or len(index) != len(previous)):
+        save_media_index(directory, index)
+    return index
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import datetime as dt
 
 
@@ -8,3 +8,4 @@ class CsvEntry(BaseModel):
     thumbnail_file_name: Optional[str] = None
     aspect_ratio: float
     created_date: dt.datetime
+    tokens: List[str] = []
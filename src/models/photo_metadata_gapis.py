@@ -19,3 +19,30 @@ class GapisMetadata(BaseModel):
     mimeType: str
     mediaMetadata: Union[PhotoMetadata, VideoMetadata]
     filename: str
+
+class MediaTypeSummary(BaseModel):
+    """The `photo`/`video` block must be an object, but nothing in it is kept."""
+
+class MediaMetadataSummary(BaseModel):
+    creationTime: str
+    width: str
+    height: str
+
+class PhotoMetadataSummary(MediaMetadataSummary):
+    photo: MediaTypeSummary
+
+class VideoMetadataSummary(MediaMetadataSummary):
+    video: MediaTypeSummary
+
+class GapisMetadataSummary(BaseModel):
+    """Accepts exactly the sidecars GapisMetadata accepts, while building less.
+
+    The camera and video details under `photo`/`video` are skipped instead of
+    being copied into dicts, which is most of what GapisMetadata builds.
+    """
+    id: str
+    productUrl: str
+    baseUrl: str
+    mimeType: str
+    mediaMetadata: Union[PhotoMetadataSummary, VideoMetadataSummary]
+    filename: str
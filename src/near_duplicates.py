@@ -0,0 +1,291 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import click
+import numpy as np
+from PIL import Image, ImageFile
+
+from pipeline_utils import pool_chunks
+from thumbnails import is_image_file_name, thumbnail_path
+
+# Hash from the 100px thumbnails when they exist; the hash itself is 9x8 pixels
+HASH_THUMBNAIL_HEIGHT = 100
+DEFAULT_THRESHOLD = 4
+# Number of set bits in every byte value, for popcounts on uint64 arrays
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def difference_hash(path: str) -> int:
+    """64-bit dHash: whether each pixel of a 9x8 grayscale copy is brighter than its left neighbour.
+
+    Robust to re-encoding, resizing and small exposure changes, so burst shots
+    and re-exports of a photo land within a few bits of each other.
+    """
+    ImageFile.LOAD_TRUNCATED_IMAGES = True
+    with Image.open(path) as im:
+        im.draft("L", (64, 64))
+        pixels = np.asarray(
+            im.convert("L").resize((9, 8), Image.Resampling.BOX), dtype=np.int16
+        )
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hash_chunk(
+    source_directory: str, thumbnail_directory: str, file_names: List[str]
+) -> List[Optional[int]]:
+    hashes: List[Optional[int]] = []
+    for file_name in file_names:
+        path = thumbnail_path(thumbnail_directory, HASH_THUMBNAIL_HEIGHT, file_name)
+        if not os.path.exists(path):
+            path = os.path.join(source_directory, file_name)
+        try:
+            hashes.append(difference_hash(path))
+        except Exception as ex:
+            logging.error(f"Failed to hash {file_name}: {ex}")
+            hashes.append(None)
+    return hashes
+
+
+def load_hash_index(index_file: str) -> Dict[str, Tuple[int, int]]:
+    """file name -> (mtime_ns, hash) from an earlier run."""
+    if not os.path.exists(index_file):
+        return {}
+    with np.load(index_file) as index:
+        return {
+            str(name): (int(mtime), int(value))
+            for name, mtime, value in zip(
+                index["names"], index["mtimes"], index["hashes"]
+            )
+        }
+
+
+def build_hash_index(
+    source_directory: str,
+    thumbnail_directory: str,
+    index_file: str,
+    workers: int = 1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Hash every image in `source_directory`, reusing hashes whose source mtime is unchanged.
+
+    Returns the file names and a packed uint64 array of their hashes, and saves
+    both (with the mtimes) to `index_file` as a .npz.
+    """
+    previous = load_hash_index(index_file)
+    mtimes: Dict[str, int] = {}
+    with os.scandir(source_directory) as entries:
+        for entry in entries:
+            if entry.is_file() and is_image_file_name(entry.name):
+                mtimes[entry.name] = entry.stat().st_mtime_ns
+
+    names = sorted(mtimes)
+    hashes: Dict[str, int] = {}
+    stale = []
+    for name in names:
+        cached = previous.get(name)
+        if cached is not None and cached[0] == mtimes[name]:
+            hashes[name] = cached[1]
+        else:
+            stale.append(name)
+
+    print(f"Hashing {len(stale)} of {len(names)} images")
+    chunks = pool_chunks(stale, workers, 200)
+    if workers <= 1:
+        results = [
+            hash_chunk(source_directory, thumbnail_directory, chunk) for chunk in chunks
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    hash_chunk,
+                    [source_directory] * len(chunks),
+                    [thumbnail_directory] * len(chunks),
+                    chunks,
+                )
+            )
+    for chunk, chunk_hashes in zip(chunks, results):
+        for name, value in zip(chunk, chunk_hashes):
+            if value is not None:
+                hashes[name] = value
+
+    names = [name for name in names if name in hashes]
+    name_array = np.array(names, dtype=str)
+    hash_array = np.array([hashes[name] for name in names], dtype=np.uint64)
+    mtime_array = np.array([mtimes[name] for name in names], dtype=np.int64)
+    with open(f"{index_file}.tmp", "wb") as f:
+        np.savez(f, names=name_array, mtimes=mtime_array, hashes=hash_array)
+    os.replace(f"{index_file}.tmp", index_file)
+    return name_array, hash_array
+
+
+# Rows of a candidate group compared at once; bounds memory for huge groups
+COMPARE_ROWS = 1024
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    counts = POPCOUNT[np.ascontiguousarray(values).view(np.uint8)]
+    return counts.reshape(values.shape + (8,)).sum(axis=-1)
+
+
+def hamming_distances(value: np.uint64, hashes: np.ndarray) -> np.ndarray:
+    return popcount(np.bitwise_xor(hashes, value))
+
+
+def find_parent(parents: np.ndarray, index: int) -> int:
+    root = index
+    while parents[root] != root:
+        root = parents[root]
+    while parents[index] != root:
+        parents[index], index = root, parents[index]
+    return root
+
+
+def near_duplicate_pairs(hashes: np.ndarray, threshold: int) -> List[Tuple[int, int]]:
+    """Index pairs whose hashes differ in at most `threshold` bits.
+
+    Multi-index hashing: split the 64 bits into threshold + 1 blocks. Two hashes
+    within the threshold must agree exactly on at least one block, so only
+    hashes sharing a block value are compared, with one vectorized popcount per
+    candidate group instead of an all-pairs scan.
+    """
+    block_count = threshold + 1
+    block_bits = 64 // block_count
+    pairs = set()
+    for block in range(block_count):
+        shift = block * block_bits
+        width = 64 - shift if block == block_count - 1 else block_bits
+        keys = (hashes >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+        order = np.argsort(keys, kind="stable")
+        boundaries = np.flatnonzero(np.diff(keys[order])) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(order)]))
+        for group_number in np.flatnonzero(ends - starts > 1):
+            group = order[starts[group_number] : ends[group_number]]
+            group_hashes = hashes[group]
+            for row_start in range(0, len(group), COMPARE_ROWS):
+                rows = group_hashes[row_start : row_start + COMPARE_ROWS]
+                distances = popcount(rows[:, None] ^ group_hashes[None, :])
+                row_indices, column_indices = np.nonzero(distances <= threshold)
+                row_indices = row_indices + row_start
+                # Each unordered pair once, and never an image with itself
+                upper = column_indices > row_indices
+                for first, second in zip(
+                    group[row_indices[upper]], group[column_indices[upper]]
+                ):
+                    pairs.add((int(min(first, second)), int(max(first, second))))
+    return sorted(pairs)
+
+
+def find_clusters(hashes: np.ndarray, threshold: int) -> List[List[int]]:
+    """Group indices into `hashes` whose hashes are connected by near-duplicate pairs.
+
+    Identical hashes (for example a burst of black frames) are collapsed first,
+    so only the distinct values go through the pair search.
+    """
+    unique_hashes, inverse = np.unique(hashes, return_inverse=True)
+    parents = np.arange(len(unique_hashes))
+    for first, second in near_duplicate_pairs(unique_hashes, threshold):
+        first_root = find_parent(parents, first)
+        second_root = find_parent(parents, second)
+        if first_root != second_root:
+            parents[max(first_root, second_root)] = min(first_root, second_root)
+    clusters: Dict[int, List[int]] = {}
+    for index, unique_index in enumerate(inverse):
+        clusters.setdefault(find_parent(parents, unique_index), []).append(index)
+    return [cluster for cluster in clusters.values() if len(cluster) > 1]
+
+
+def write_report(
+    source_directory: str,
+    names: np.ndarray,
+    hashes: np.ndarray,
+    clusters: List[List[int]],
+    threshold: int,
+    report_file: str,
+) -> None:
+    """Write `{"clusters": [{"keep": name, "duplicates": [...]}, ...]}`.
+
+    The largest file in each cluster is kept, as the least recompressed copy;
+    `scripts/trim.py --duplicates_report` moves the rest to the trash.
+    """
+    report = []
+    for cluster in clusters:
+        members = sorted(
+            cluster,
+            key=lambda index: (
+                -os.path.getsize(os.path.join(source_directory, str(names[index]))),
+                str(names[index]),
+            ),
+        )
+        report.append(
+            {
+                "keep": str(names[members[0]]),
+                "duplicates": [str(names[index]) for index in members[1:]],
+                # Chained pairs can put the farthest member beyond the threshold
+                "maxDistance": int(
+                    hamming_distances(hashes[members[0]], hashes[members]).max()
+                ),
+            }
+        )
+    report.sort(key=lambda entry: (-len(entry["duplicates"]), entry["keep"]))
+    with open(report_file, "w") as f:
+        json.dump(
+            {
+                "threshold": threshold,
+                "sourceDirectory": source_directory,
+                "clusters": report,
+            },
+            f,
+            indent=2,
+        )
+
+
+@click.command()
+@click.option("--image-dir", default="images", show_default=True)
+@click.option("--thumbnail-dir", default="thumbnail", show_default=True)
+@click.option(
+    "--index-file",
+    default="photos.dhash.npz",
+    show_default=True,
+    help="Hashes from earlier runs, reused for unchanged files",
+)
+@click.option(
+    "--threshold",
+    default=DEFAULT_THRESHOLD,
+    show_default=True,
+    help="Maximum number of differing bits (out of 64) for two photos to count as duplicates",
+)
+@click.option(
+    "--report",
+    "report_file",
+    default="near_duplicates.json",
+    show_default=True,
+)
+@click.option("--workers", default=1, show_default=True)
+def main(
+    image_dir: str,
+    thumbnail_dir: str,
+    index_file: str,
+    threshold: int,
+    report_file: str,
+    workers: int,
+):
+    start = time.monotonic()
+    names, hashes = build_hash_index(image_dir, thumbnail_dir, index_file, workers)
+    hashed = time.monotonic()
+    clusters = find_clusters(hashes, threshold)
+    write_report(image_dir, names, hashes, clusters, threshold, report_file)
+    print(
+        f"Hashed {len(names)} images in {hashed - start:.1f}s, found "
+        f"{len(clusters)} clusters covering {sum(map(len, clusters))} images in "
+        f"{time.monotonic() - hashed:.1f}s, wrote {report_file}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import json
+import logging
+import os
+from typing import Any, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+def pool_chunks(
+    items: Sequence[T], workers: int, max_chunk_size: int
+) -> List[Sequence[T]]:
+    """Split `items` into in-order chunks for a process pool.
+
+    Aims for about four chunks per worker so slow chunks even out, but keeps
+    chunks small enough that progress and failures stay fine-grained.
+    """
+    chunk_size = max(1, min(max_chunk_size, len(items) // (max(1, workers) * 4)))
+    return [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def load_json_cache(path: str, description: str) -> Optional[Any]:
+    """Load a JSON cache, or None when it is missing or unreadable.
+
+    Caches only save work, so a damaged one is logged and rebuilt rather
+    than stopping the run.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as ex:
+        logging.warning(f"Ignoring unreadable {description} {path}: {ex}")
+        return None
+
+
+def save_json_cache(path: str, data: Any) -> None:
+    """Write via a temporary file so an interrupted run never leaves half a cache."""
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(f"{path}.tmp", path)
@@ -0,0 +1,85 @@
+import gzip
+import os
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import brotli
+except ImportError:  # Only needed for --precompress, which refuses to run without it
+    brotli = None
+
+# File suffix -> Content-Encoding the uploader stores it with
+ENCODINGS = {".gz": "gzip", ".br": "br"}
+BROTLI_MISSING = "--precompress needs the brotli package (pip install -r requirements.txt)"
+
+
+def available_encodings() -> List[str]:
+    return ["br", "gzip"]
+
+
+def check_encoders() -> None:
+    """Fail before any work is done instead of publishing gzip-only manifests."""
+    if brotli is None:
+        raise RuntimeError(BROTLI_MISSING)
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        # mtime=0 keeps the output byte-identical for identical input
+        return gzip.compress(content, compresslevel=9, mtime=0)
+    if encoding == "br":
+        check_encoders()
+        return brotli.compress(content, mode=brotli.MODE_TEXT, quality=11)
+    raise ValueError(f"Unknown encoding {encoding}")
+
+
+def suffix_for(encoding: str) -> str:
+    return next(suffix for suffix, name in ENCODINGS.items() if name == encoding)
+
+
+def write_variants(path: str, content: Optional[bytes] = None) -> Dict[str, int]:
+    """Write `<path>.gz` and `<path>.br` at maximum compression.
+
+    Variants already newer than `path` are left alone. Returns the size of the
+    original and of each variant, keyed by encoding ("identity" for the original).
+    """
+    sizes = {"identity": os.path.getsize(path)}
+    for encoding in available_encodings():
+        output = path + suffix_for(encoding)
+        if not os.path.exists(output) or os.path.getmtime(output) < os.path.getmtime(
+            path
+        ):
+            if content is None:
+                with open(path, "rb") as f:
+                    content = f.read()
+            with open(f"{output}.tmp", "wb") as f:
+                f.write(compress(content, encoding))
+            os.replace(f"{output}.tmp", output)
+        sizes[encoding] = os.path.getsize(output)
+    return sizes
+
+
+def remove_orphaned_variants(directory: str) -> None:
+    """Delete `.gz`/`.br` files whose uncompressed original no longer exists."""
+    for file_name in os.listdir(directory):
+        base, suffix = os.path.splitext(file_name)
+        if suffix in ENCODINGS and not os.path.exists(os.path.join(directory, base)):
+            os.remove(os.path.join(directory, file_name))
+
+
+def precompress_files(paths: Sequence[str]) -> List[Dict[str, int]]:
+    """Write compressed variants for every existing file in `paths` and print a ratio report."""
+    check_encoders()
+    reports = []
+    for path in paths:
+        if os.path.exists(path):
+            reports.append({"path": path, **write_variants(path)})
+
+    for report in reports:
+        line = f"{os.path.basename(report['path']):>24} {report['identity'] / 1e3:10.1f} kB"
+        for encoding in available_encodings():
+            line += (
+                f"  {encoding} {report[encoding] / 1e3:10.1f} kB"
+                f" ({report['identity'] / max(1, report[encoding]):5.2f}x)"
+            )
+        print(line)
+    return reports
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional, Set
+
+from precompress import ENCODINGS, available_encodings, write_variants
+
+# Served with a long-lived immutable Cache-Control: every name embeds its content hash
+PUBLISHED_FOLDER_NAME = "manifests"
+# Small, never cached, and the only fixed name the page needs to know
+POINTER_FILE_NAME = "manifest.json"
+# Pointer key -> manifest written by generate_photos_gallery.py, relative to the gallery root
+PUBLISHED_MANIFESTS = {
+    "photos": "photos.csv",
+    "videos": "videos.csv",
+    "searchTokens": "search-tokens.csv",
+}
+YEAR_INDEX_FILE = os.path.join("photos", "index.json")
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()[:16]
+
+
+def publish_file(
+    gallery_directory: str, content: bytes, file_name: str, precompress: bool = False
+) -> str:
+    """Write `content` as `manifests/<stem>.<hash><ext>` and return its URL path."""
+    stem, extension = os.path.splitext(os.path.basename(file_name))
+    published_name = f"{stem}.{content_hash(content)}{extension}"
+    output = os.path.join(gallery_directory, PUBLISHED_FOLDER_NAME, published_name)
+    # Same name means same bytes, so an existing file never needs rewriting
+    if not os.path.exists(output):
+        with open(f"{output}.tmp", "wb") as f:
+            f.write(content)
+        os.replace(f"{output}.tmp", output)
+    if precompress:
+        write_variants(output, content)
+    return f"{PUBLISHED_FOLDER_NAME}/{published_name}"
+
+
+def publish_year_index(gallery_directory: str, precompress: bool) -> Optional[str]:
+    """Publish every year shard, then an index.json that points at the hashed shards."""
+    index_file = os.path.join(gallery_directory, YEAR_INDEX_FILE)
+    if not os.path.exists(index_file):
+        return None
+    with open(index_file) as f:
+        index = json.load(f)
+    for entry in index["years"]:
+        with open(os.path.join(gallery_directory, entry["file"]), "rb") as f:
+            entry["file"] = publish_file(
+                gallery_directory, f.read(), entry["file"], precompress
+            )
+    content = json.dumps(index, indent=2).encode("utf-8")
+    return publish_file(gallery_directory, content, "years.json", precompress)
+
+
+def referenced_files(gallery_directory: str, pointer: Dict[str, object]) -> Set[str]:
+    """Every published file a pointer reaches, including the shards in its year index."""
+    referenced = {
+        pointer[key] for key in (*PUBLISHED_MANIFESTS, "years") if key in pointer
+    }
+    years = pointer.get("years")
+    if years is not None and os.path.exists(os.path.join(gallery_directory, years)):
+        with open(os.path.join(gallery_directory, years)) as f:
+            referenced.update(entry["file"] for entry in json.load(f)["years"])
+    return {os.path.basename(path) for path in referenced}
+
+
+def publish_manifests(
+    gallery_directory: str, precompress: bool = False
+) -> Dict[str, object]:
+    """Copy the current manifests to content-hashed names and update the pointer file.
+
+    A hashed name never changes content, so the uploader can give everything in
+    `manifests/` an immutable Cache-Control; only `manifest.json` has to be
+    fetched on every visit. Files from the previous publish are kept so pages
+    that already read the old pointer can still finish loading; anything older
+    is removed.
+
+    With `precompress`, each published file also gets `.gz`/`.br` variants and
+    the pointer lists the encodings available, most preferred first.
+    """
+    os.makedirs(os.path.join(gallery_directory, PUBLISHED_FOLDER_NAME), exist_ok=True)
+    pointer_file = os.path.join(gallery_directory, POINTER_FILE_NAME)
+    previous: Dict[str, object] = {}
+    if os.path.exists(pointer_file):
+        with open(pointer_file) as f:
+            previous = json.load(f)
+
+    pointer: Dict[str, object] = {}
+    for key, file_name in PUBLISHED_MANIFESTS.items():
+        path = os.path.join(gallery_directory, file_name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                pointer[key] = publish_file(
+                    gallery_directory, f.read(), file_name, precompress
+                )
+    years = publish_year_index(gallery_directory, precompress)
+    if years is not None:
+        pointer["years"] = years
+    if precompress:
+        pointer["encodings"] = available_encodings()
+
+    with open(f"{pointer_file}.tmp", "w") as f:
+        json.dump(pointer, f, indent=2)
+    os.replace(f"{pointer_file}.tmp", pointer_file)
+
+    keep = referenced_files(gallery_directory, pointer) | referenced_files(
+        gallery_directory, previous
+    )
+    published_directory = os.path.join(gallery_directory, PUBLISHED_FOLDER_NAME)
+    for file_name in os.listdir(published_directory):
+        base, suffix = os.path.splitext(file_name)
+        if (base if suffix in ENCODINGS else file_name) not in keep:
+            os.remove(os.path.join(published_directory, file_name))
+
+    for key, path in pointer.items():
+        print(f"Published {key}: {path}")
+    return pointer
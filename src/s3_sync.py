@@ -0,0 +1,264 @@
+import fnmatch
+import mimetypes
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+
+from pipeline_utils import load_json_cache, save_json_cache
+
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 16 * 1024 * 1024
+DELETE_BATCH_SIZE = 1000  # DeleteObjects accepts at most 1000 keys
+MAX_COPY_SIZE = (
+    5 * 1024 * 1024 * 1024
+)  # Larger objects can't be copied in one CopyObject
+
+
+class LocalFile(NamedTuple):
+    path: str
+    key: str
+    size: int
+    mtime: float
+
+
+class UploadManifest:
+    """Keys this machine has uploaded to a bucket, with the size/mtime/ETag at upload time.
+
+    Stored as JSON next to the gallery. Comparing against it instead of
+    listing the bucket is what lets a sync upload only the delta.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, dict] = load_json_cache(path, "upload manifest") or {}
+        self.lock = threading.Lock()
+
+    def has_content(self, local: LocalFile) -> bool:
+        entry = self.entries.get(local.key)
+        return (
+            entry is not None
+            and entry["size"] == local.size
+            and entry["mtime"] == local.mtime
+        )
+
+    def is_current(self, local: LocalFile, cache_control: Optional[str] = None) -> bool:
+        # A different Cache-Control alone makes the object stale; S3Syncer.upload
+        # then rewrites the headers with a copy_object instead of re-sending it
+        return (
+            self.has_content(local)
+            and self.entries[local.key].get("cache_control") == cache_control
+        )
+
+    def record(
+        self, local: LocalFile, etag: str, cache_control: Optional[str] = None
+    ) -> None:
+        with self.lock:
+            self.entries[local.key] = {
+                "size": local.size,
+                "mtime": local.mtime,
+                "etag": etag,
+            }
+            if cache_control is not None:
+                self.entries[local.key]["cache_control"] = cache_control
+
+    def forget(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def keys_under(self, prefix: str) -> List[str]:
+        return [key for key in self.entries if key.startswith(prefix)]
+
+    def save(self) -> None:
+        with self.lock:
+            save_json_cache(self.path, self.entries)
+
+
+def list_local_files(
+    local_path: str, key_prefix: str, excludes: Tuple[str, ...] = ()
+) -> List[LocalFile]:
+    """Files under `local_path` (a directory, or a single file) mapped to S3 keys."""
+    files = []
+    if os.path.isfile(local_path):
+        stat = os.stat(local_path)
+        return [LocalFile(local_path, key_prefix, stat.st_size, stat.st_mtime)]
+    for root, _, names in os.walk(local_path, followlinks=True):
+        for name in names:
+            if any(fnmatch.fnmatch(name, pattern) for pattern in excludes):
+                continue
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, local_path).replace(os.sep, "/")
+            stat = os.stat(path)
+            files.append(
+                LocalFile(path, f"{key_prefix}{relative}", stat.st_size, stat.st_mtime)
+            )
+    return files
+
+
+def bootstrap_manifest(
+    client, bucket: str, key_prefix: str, local_files: List[LocalFile], manifest
+):
+    """Seed the manifest from one bucket listing, the way `aws s3 sync` compares.
+
+    An object counts as uploaded if its size matches and it is newer than the
+    local file. Only needed the first time a prefix is synced.
+    """
+    local_by_key = {local.key: local for local in local_files}
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=key_prefix):
+        for obj in page.get("Contents", []):
+            local = local_by_key.get(obj["Key"])
+            if local is None:
+                # Not ours locally; remember it so --delete semantics still apply
+                manifest.entries[obj["Key"]] = {
+                    "size": obj["Size"],
+                    "mtime": None,
+                    "etag": obj["ETag"],
+                }
+            elif (
+                obj["Size"] == local.size
+                and obj["LastModified"].timestamp() >= local.mtime
+            ):
+                manifest.record(local, obj["ETag"])
+
+
+class S3Syncer:
+    """In-process replacement for `aws s3 sync --delete`, driven by an UploadManifest."""
+
+    def __init__(
+        self,
+        bucket: str,
+        manifest: UploadManifest,
+        workers: int = 16,
+        client=None,
+        extra_args_for_key=None,
+    ):
+        self.bucket = bucket
+        self.manifest = manifest
+        self.workers = workers
+        self.client = client or boto3.client("s3")
+        # Optional hook returning extra put arguments (e.g. CacheControl) per key
+        self.extra_args_for_key = extra_args_for_key or (lambda key: {})
+        self.transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_CHUNKSIZE,
+            max_concurrency=4,
+            use_threads=True,
+        )
+
+    def upload(self, local: LocalFile) -> None:
+        extra_args = dict(self.extra_args_for_key(local.key))
+        content_type, _ = mimetypes.guess_type(local.path)
+        if content_type is not None:
+            extra_args.setdefault("ContentType", content_type)
+        cache_control = extra_args.get("CacheControl")
+
+        if self.manifest.has_content(local) and local.size <= MAX_COPY_SIZE:
+            # Only the headers changed: rewrite them server-side instead of re-sending the bytes
+            response = self.client.copy_object(
+                Bucket=self.bucket,
+                Key=local.key,
+                CopySource={"Bucket": self.bucket, "Key": local.key},
+                MetadataDirective="REPLACE",
+                **extra_args,
+            )
+            etag = response["CopyObjectResult"]["ETag"]
+        elif local.size < MULTIPART_THRESHOLD:
+            with open(local.path, "rb") as f:
+                response = self.client.put_object(
+                    Bucket=self.bucket, Key=local.key, Body=f, **extra_args
+                )
+            etag = response["ETag"]
+        else:
+            self.client.upload_file(
+                local.path,
+                self.bucket,
+                local.key,
+                ExtraArgs=extra_args,
+                Config=self.transfer_config,
+            )
+            etag = self.client.head_object(Bucket=self.bucket, Key=local.key)["ETag"]
+        self.manifest.record(local, etag, cache_control)
+
+    def delete(self, keys: List[str]) -> None:
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[start : start + DELETE_BATCH_SIZE]
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+            for key in batch:
+                self.manifest.forget(key)
+
+    def sync(
+        self,
+        targets: List[Tuple[str, str, Tuple[str, ...]]],
+        delete: bool = True,
+        rescan: bool = False,
+    ) -> None:
+        """Sync every (local path, key prefix, exclude patterns) target concurrently."""
+        start = time.monotonic()
+        uploads: List[LocalFile] = []
+        deletions: List[str] = []
+        for local_path, key_prefix, excludes in targets:
+            if not os.path.exists(local_path):
+                print(f"Skipping missing {local_path}")
+                continue
+            local_files = list_local_files(local_path, key_prefix, excludes)
+            if rescan or not self.manifest.keys_under(key_prefix):
+                print(
+                    f"Listing s3://{self.bucket}/{key_prefix} to seed the manifest..."
+                )
+                bootstrap_manifest(
+                    self.client, self.bucket, key_prefix, local_files, self.manifest
+                )
+            changed = [
+                local
+                for local in local_files
+                if not self.manifest.is_current(
+                    local, self.extra_args_for_key(local.key).get("CacheControl")
+                )
+            ]
+            uploads.extend(changed)
+            if delete and os.path.isdir(local_path):
+                local_keys = {local.key for local in local_files}
+                deletions.extend(
+                    key
+                    for key in self.manifest.keys_under(key_prefix)
+                    if key not in local_keys
+                )
+            print(f"{key_prefix}: {len(changed)} of {len(local_files)} files to upload")
+
+        uploaded_bytes = 0
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.upload, local): local for local in uploads}
+            for done, (future, local) in enumerate(futures.items(), start=1):
+                try:
+                    future.result()
+                    uploaded_bytes += local.size
+                    print(
+                        f"[{done}/{len(uploads)}] upload: {local.path} to s3://{self.bucket}/{local.key}"
+                    )
+                except Exception as ex:
+                    print(f"[{done}/{len(uploads)}] failed: {local.path}: {ex}")
+                    failed.append(local.path)
+                if done % 500 == 0:
+                    self.manifest.save()
+
+        if deletions:
+            print(f"Deleting {len(deletions)} objects no longer present locally...")
+            self.delete(deletions)
+        self.manifest.save()
+
+        elapsed = max(time.monotonic() - start, 1e-9)
+        print(
+            f"Uploaded {len(uploads) - len(failed)} files ({uploaded_bytes / 1e6:.1f} MB) "
+            f"in {elapsed:.1f}s, deleted {len(deletions)}"
+        )
+        if failed:
+            raise Exception(f"Failed to upload {len(failed)} files")
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Iterable, List
+
+from models.csv_entry import CsvEntry
+
+# Postings are grouped into one shard per token prefix of this length
+PREFIX_LENGTH = 2
+SAFE_PREFIX = re.compile(r"^[a-z0-9]+$")
+
+
+def normalize_token(token: str) -> str:
+    return token.strip().lower()
+
+
+def row_search_tokens(row: CsvEntry) -> List[str]:
+    """Tokens a row can be found by, normalized and deduplicated.
+
+    Years are browsed through the per-year manifest shards, so dates are not
+    indexed: a year token on every row would put the whole library in one shard.
+    """
+    tokens = set()
+    for token in row.tokens:
+        normalized = normalize_token(token)
+        if normalized:
+            tokens.add(normalized)
+    return sorted(tokens)
+
+
+def delta_encode(ordinals: Iterable[int]) -> List[int]:
+    """[3, 7, 8, 20] -> [3, 4, 1, 12]: small gaps keep the shards compact."""
+    encoded = []
+    previous = 0
+    for ordinal in ordinals:
+        encoded.append(ordinal - previous)
+        previous = ordinal
+    return encoded
+
+
+def delta_decode(gaps: Iterable[int]) -> List[int]:
+    ordinals = []
+    current = 0
+    for gap in gaps:
+        current += gap
+        ordinals.append(current)
+    return ordinals
+
+
+def shard_file_name(prefix: str) -> str:
+    """`ca` -> `ca.json`; prefixes that aren't plain lowercase ASCII are hex-encoded.
+
+    Naming shards by their prefix, not their position, means a new prefix only
+    adds a file instead of renaming (and re-uploading) every later shard.
+    """
+    if SAFE_PREFIX.match(prefix):
+        return f"{prefix}.json"
+    return f"_{prefix.encode('utf-8').hex()}.json"
+
+
+def build_postings(metadata: List[CsvEntry]) -> Dict[str, List[int]]:
+    """Token -> ascending row ordinals, where an ordinal is a row's line number in photos.csv."""
+    postings: Dict[str, List[int]] = {}
+    for ordinal, row in enumerate(metadata):
+        for token in row_search_tokens(row):
+            postings.setdefault(token, []).append(ordinal)
+    return postings
+
+
+def write_search_index(
+    metadata: List[CsvEntry], search_directory: str, tokens_file: str
+) -> None:
+    """Write an inverted index of `metadata` sharded by token prefix.
+
+    `search/index.json` maps each prefix to its shard file, a content hash and
+    the number of rows indexed; each `search/<prefix>.json` shard maps the tokens
+    with that prefix to their delta-encoded ordinals. `tokens_file` gets one
+    token per line, most common first, for autocomplete. A query then fetches
+    the small index once and a single shard per token instead of scanning
+    every row of the manifest.
+    """
+    os.makedirs(search_directory, exist_ok=True)
+    postings = build_postings(metadata)
+
+    by_prefix: Dict[str, Dict[str, List[int]]] = {}
+    for token in sorted(postings):
+        by_prefix.setdefault(token[:PREFIX_LENGTH], {})[token] = delta_encode(
+            postings[token]
+        )
+
+    shards = {}
+    written_files = set()
+    for prefix in sorted(by_prefix):
+        content = json.dumps(by_prefix[prefix], separators=(",", ":")).encode("utf-8")
+        file_name = shard_file_name(prefix)
+        shard_file = os.path.join(search_directory, file_name)
+        existing = None
+        if os.path.exists(shard_file):
+            with open(shard_file, "rb") as f:
+                existing = f.read()
+        if existing != content:
+            with open(shard_file, "wb") as f:
+                f.write(content)
+        written_files.add(file_name)
+        shards[prefix] = {
+            "file": f"{os.path.basename(search_directory)}/{file_name}",
+            "hash": hashlib.sha256(content).hexdigest()[:16],
+        }
+
+    # The directory only holds the index, so any other stale .json is an old shard
+    for file_name in os.listdir(search_directory):
+        if (
+            file_name.endswith(".json")
+            and file_name != "index.json"
+            and file_name not in written_files
+        ):
+            os.remove(os.path.join(search_directory, file_name))
+
+    with open(os.path.join(search_directory, "index.json"), "w") as f:
+        json.dump(
+            {"count": len(metadata), "prefixLength": PREFIX_LENGTH, "shards": shards},
+            f,
+            indent=2,
+        )
+
+    with open(tokens_file, "w") as f:
+        for token in sorted(postings, key=lambda token: (-len(postings[token]), token)):
+            f.write(f"{token}\n")
+
+    print(f"Indexed {len(postings)} search tokens in {len(shards)} shards")
@@ -4,40 +4,101 @@ from googleapiclient.discovery import build
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from concurrent.futures import ThreadPoolExecutor
+
 import click
+import contextlib
+import functools
+import hashlib
 import json
 import os
 import pickle
+import queue
+import re
 import requests
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import sync_state
+from sync_state import SyncState
 
 # The scope needed to access Google Photos
 SCOPES = ["https://www.googleapis.com/auth/photoslibrary.readonly"]
 CREDENTIALS_FILE = "credentials.json"
 TOKEN_FILE = "token.pickle"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+METADATA_BATCH_SIZE = 50  # mediaItems.batchGet accepts at most 50 ids
+# baseUrls expire after about an hour; refresh items listed longer ago than this
+DEFAULT_MAX_URL_AGE = 50 * 60
+# Downloads in progress; renamed to the real name once complete
+PARTIAL_SUFFIX = ".part"
+# "bytes 100-199/200", "bytes 100-199/*" (length unknown) or "bytes */200" (on a 416)
+CONTENT_RANGE = re.compile(r"^bytes (?:(\d+)-\d+|\*)/(\d+|\*)$")
 
 
 class SessionManager:
     _session = None  # Private class variable to hold the singleton session
+    _pool_size = 10  # Connections kept open per host, urllib3's default
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, pool_size: int):
+        """Size the connection pool to match the number of download threads."""
+        with cls._lock:
+            cls._pool_size = max(pool_size, 10)
+            cls._session = None
 
     @classmethod
     def get_session(cls):
-        if cls._session is None:
-            session = requests.Session()
-            retries = Retry(
-                total=5,  # Total number of retries
-                backoff_factor=3,  # Exponential
-                status_forcelist=[
-                    500,
-                    502,
-                    503,
-                    504,
-                ],  # Status codes to retry
-                allowed_methods=frozenset(["GET", "POST"]),
-            )  # HTTP methods to retry
-            adapter = HTTPAdapter(max_retries=retries)
-            session.mount("https://", adapter)
-            cls._session = session  # Initialize the session if it hasn't been already
-        return cls._session
+        with cls._lock:
+            if cls._session is None:
+                session = requests.Session()
+                retries = Retry(
+                    total=5,  # Total number of retries
+                    backoff_factor=3,  # Exponential
+                    status_forcelist=[
+                        500,
+                        502,
+                        503,
+                        504,
+                    ],  # Status codes to retry
+                    allowed_methods=frozenset(["GET", "POST"]),
+                )  # HTTP methods to retry
+                adapter = HTTPAdapter(max_retries=retries, pool_maxsize=cls._pool_size)
+                session.mount("https://", adapter)
+                cls._session = (
+                    session  # Initialize the session if it hasn't been already
+                )
+            return cls._session
+
+
+class PathLocks:
+    """One lock per destination path, kept only while someone holds or waits for it.
+
+    Album items with the same filename resolve to the same file (and the same
+    `.part`), so their downloads must not overlap.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks: Dict[str, Tuple[threading.Lock, int]] = {}
+
+    @contextlib.contextmanager
+    def hold(self, path: str):
+        with self._lock:
+            lock, users = self._locks.get(path, (threading.Lock(), 0))
+            self._locks[path] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, users = self._locks[path]
+                if users == 1:
+                    del self._locks[path]
+                else:
+                    self._locks[path] = (lock, users - 1)
 
 
 def authenticate():
@@ -61,66 +122,370 @@ def authenticate():
     return creds
 
 
-def list_album_items(service, album_id):
+def iter_album_pages(service, album_id) -> Iterator[List[dict]]:
+    """Yield the album's media items one `mediaItems().search` page at a time."""
     request_body = {
         "albumId": album_id,
         "pageSize": 100,  # Max is 100
     }
-    items = []  # Initialize an empty list to store all items
     while True:
         response = service.mediaItems().search(body=request_body).execute()
-        items.extend(response.get("mediaItems", []))
+        yield response.get("mediaItems", [])
 
         # Check for nextPageToken in the response and update request_body to include it
         if "nextPageToken" in response:
-            print("Fetching next page of results...")
             request_body["pageToken"] = response["nextPageToken"]
         else:
             break  # Exit loop if no more pages
 
+
+def list_album_items(service, album_id):
+    items = [item for page in iter_album_pages(service, album_id) for item in page]
     if len(items) == 0:
         print("No items found in album.")
     else:
-        print(f"Found {len(items)} items in album:")
-        for item in items:
-            print(f"Item {item['filename']} found in album.")
+        print(f"Found {len(items)} items in album")
     return items
 
 
+def list_album_pages_in_background(
+    creds, album_id, max_queued_pages: int = 2
+) -> Iterator[Tuple[float, List[dict]]]:
+    """Run `iter_album_pages` on a producer thread, yielding (listed_at, items).
+
+    At most `max_queued_pages` pages wait in the queue, so listing stays only
+    a little ahead of downloading and page N+1 is fetched while page N is
+    being downloaded. `listed_at` is a time.monotonic() timestamp used to tell
+    when the page's baseUrls are getting old.
+    """
+    pages: queue.Queue = queue.Queue(maxsize=max_queued_pages)
+    done = object()
+
+    def produce():
+        try:
+            # Own service: httplib2 connections can't be shared across threads
+            service = build(
+                "photoslibrary", "v1", credentials=creds, static_discovery=False
+            )
+            for page_number, page in enumerate(
+                iter_album_pages(service, album_id), start=1
+            ):
+                print(f"Listed page {page_number} ({len(page)} items)")
+                pages.put((time.monotonic(), page))
+            pages.put(done)
+        except Exception as ex:
+            pages.put(ex)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        page = pages.get()
+        if page is done:
+            return
+        if isinstance(page, Exception):
+            raise page
+        yield page
+
+
+def refresh_stale_item(service, item, listed_at: float, max_url_age: float):
+    """Re-fetch `item` if its baseUrl was listed more than `max_url_age` seconds ago."""
+    if time.monotonic() - listed_at < max_url_age:
+        return item
+    print(f"Refreshing baseUrl for {item['filename']}")
+    return service.mediaItems().get(mediaItemId=item["id"]).execute()
+
+
+def refresh_stale_items(
+    service, items: List[dict], listed_at: float, max_url_age: float
+) -> List[Tuple[float, dict]]:
+    """Pair `items` with when they were listed, re-fetching them first if that is too long ago.
+
+    Stale items are refreshed with mediaItems.batchGet, METADATA_BATCH_SIZE
+    ids per call. Items batchGet doesn't return keep their old listing time, so
+    `refresh_stale_item` still refreshes them one by one.
+    """
+    if time.monotonic() - listed_at < max_url_age:
+        return [(listed_at, item) for item in items]
+    print(f"Refreshing baseUrls for {len(items)} items")
+    refreshed_at = time.monotonic()
+    refreshed = batch_get_metadata(service, [item["id"] for item in items])
+    return [
+        (
+            (refreshed_at, refreshed[item["id"]])
+            if item["id"] in refreshed
+            else (listed_at, item)
+        )
+        for item in items
+    ]
+
+
+def iter_items_to_sync(
+    service, pages, max_url_age: float
+) -> Iterator[Tuple[float, dict, Optional[dict]]]:
+    """Yield (listed_at, item, prefetched metadata) from `pending_pages`-style pages.
+
+    baseUrls are checked METADATA_BATCH_SIZE items at a time just before those
+    items are handed out, so a page that waited behind slow downloads is
+    refreshed in batches rather than one call per item.
+    """
+    for listed_at, page, metadata in pages:
+        for start in range(0, len(page), METADATA_BATCH_SIZE):
+            for item_listed_at, item in refresh_stale_items(
+                service,
+                page[start : start + METADATA_BATCH_SIZE],
+                listed_at,
+                max_url_age,
+            ):
+                yield item_listed_at, item, metadata.get(item["id"])
+
+
 def file_does_not_exist(file_path: str):
     return not os.path.exists(file_path)
 
 
+def parse_content_range(value: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """(first byte, complete length) of a Content-Range header; None where it gives `*`."""
+    match = CONTENT_RANGE.match(value.strip()) if value else None
+    if match is None:
+        return None, None
+    first_byte, length = match.groups()
+    return (
+        int(first_byte) if first_byte is not None else None,
+        int(length) if length != "*" else None,
+    )
+
+
 def download_item(download_url, local_path):
+    """Stream `download_url` to `local_path`.
+
+    Bytes go to `<local_path>.part` first and are only renamed into place once
+    the full length has arrived, so a killed run never leaves a truncated file
+    that later counts as done. A leftover `.part` is resumed with a Range
+    request when the server supports it. Returns the size and SHA-256 of the
+    finished file.
+    """
     print(f"Downloading {local_path}")
     session = SessionManager.get_session()
-    response = session.get(download_url)
-    if response.status_code == 200:
-        with open(local_path, "wb") as f:
-            f.write(response.content)
-            print(f"Downloaded {local_path}")
-    else:
-        print(f"Failed to download {download_url}, status code: {response.status_code}")
+    temp_path = f"{local_path}{PARTIAL_SUFFIX}"
+    offset = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+
+    with session.get(download_url, headers=headers, stream=True) as response:
+        first_byte, length = parse_content_range(response.headers.get("Content-Range"))
+        if response.status_code == 416 and offset > 0:
+            if length != offset:
+                # The partial file doesn't line up with what the server has; start over
+                os.remove(temp_path)
+                return download_item(download_url, local_path)
+            # Every byte arrived last time; only the rename was missed
+            expected_size = length
+            mode = None
+        elif response.status_code == 206:
+            if first_byte != offset:
+                os.remove(temp_path)
+                return download_item(download_url, local_path)
+            expected_size = length
+            mode = "ab"
+            print(f"Resuming {local_path} at {offset} bytes")
+        elif response.status_code == 200:
+            expected_size = (
+                int(response.headers["Content-Length"])
+                if "Content-Length" in response.headers
+                and "Content-Encoding" not in response.headers
+                else None
+            )
+            mode = "wb"
+        else:
+            print(
+                f"Failed to download {download_url}, status code: {response.status_code}"
+            )
+            raise Exception(
+                f"Failed to download {download_url}, status code: {response.status_code}"
+            )
+
+        content_hash = hashlib.sha256()
+        if mode != "wb":
+            with open(temp_path, "rb") as f:
+                for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                    content_hash.update(chunk)
+        if mode is not None:
+            with open(temp_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    content_hash.update(chunk)
+
+    actual_size = os.path.getsize(temp_path)
+    if expected_size is not None and actual_size != expected_size:
         raise Exception(
-            f"Failed to download {download_url}, status code: {response.status_code}"
+            f"Incomplete download of {download_url}: got {actual_size} of {expected_size} bytes"
         )
+    os.replace(temp_path, local_path)
+    print(f"Downloaded {local_path}")
+    return actual_size, content_hash.hexdigest()
 
 
 def write_metadata(metadata, local_meta_path):
-    with open(local_meta_path, "w") as json_file:
+    temp_path = f"{local_meta_path}{PARTIAL_SUFFIX}"
+    with open(temp_path, "w") as json_file:
         json.dump(metadata, json_file, indent=2)
+    os.replace(temp_path, local_meta_path)
+
+
+def get_item_path(item, image_dir: str, video_dir: str) -> str:
+    return (
+        f"{image_dir}/{item['filename']}"
+        if item["mimeType"].startswith("image")
+        else f"{video_dir}/{item['filename']}"
+    )
+
+
+def batch_get_metadata(service, media_item_ids: List[str]) -> Dict[str, dict]:
+    """Fetch metadata with mediaItems.batchGet, METADATA_BATCH_SIZE ids per call.
+
+    Ids the API doesn't return a media item for are left out, so the caller
+    falls back to a single mediaItems().get for them.
+    """
+    metadata = {}
+    for start in range(0, len(media_item_ids), METADATA_BATCH_SIZE):
+        batch = media_item_ids[start : start + METADATA_BATCH_SIZE]
+        response = service.mediaItems().batchGet(mediaItemIds=batch).execute()
+        for result in response.get("mediaItemResults", []):
+            if "mediaItem" in result:
+                metadata[result["mediaItem"]["id"]] = result["mediaItem"]
+            else:
+                print(f"batchGet returned no item: {result.get('status')}")
+    return metadata
+
+
+def prefetch_metadata(
+    service, items, image_dir: str, video_dir: str, metadata_source: str
+) -> Dict[str, dict]:
+    """Collect sidecar contents for every item that doesn't have a sidecar yet.
+
+    "search" reuses the media items `list_album_items` already received,
+    "batch" refreshes them with mediaItems.batchGet, and "get" prefetches
+    nothing so each item is fetched on its own.
+    """
+    missing = [
+        item
+        for item in items
+        if file_does_not_exist(f"{get_item_path(item, image_dir, video_dir)}.meta.json")
+    ]
+    if metadata_source == "search":
+        return {item["id"]: item for item in missing}
+    if metadata_source == "batch":
+        return batch_get_metadata(service, [item["id"] for item in missing])
+    return {}
+
+
+def item_files_missing(item, image_dir: str, video_dir: str) -> bool:
+    file_path = get_item_path(item, image_dir, video_dir)
+    return file_does_not_exist(file_path) or file_does_not_exist(
+        f"{file_path}.meta.json"
+    )
+
+
+def step_is_done(state: Optional[SyncState], status, step: str, path: str) -> bool:
+    """Whether `step` can be skipped for an item.
+
+    With a state database the recorded status decides, except that a step
+    recorded as done is redone when its file has been deleted since. The disk
+    is checked for rows the database hasn't confirmed yet.
+    """
+    if state is not None and status is not None:
+        if status[f"{step}_status"] == sync_state.NOT_APPLICABLE:
+            return True
+        if status[f"{step}_status"] == sync_state.DONE:
+            return not file_does_not_exist(path)
+        if status[f"{step}_status"] != sync_state.UNKNOWN:
+            return False
+    exists = not file_does_not_exist(path)
+    if exists and state is not None:
+        state.record(status["id"], step, sync_state.DONE, os.path.getsize(path))
+    return exists
+
+
+def run_step(state: Optional[SyncState], media_item_id: str, step: str, fetch):
+    """Run `fetch`, recording its (size, hash) result or failure in `state`."""
+    try:
+        size, content_hash = fetch()
+    except Exception as ex:
+        if state is not None:
+            state.record(media_item_id, step, sync_state.FAILED, error=str(ex))
+        raise
+    if state is not None:
+        state.record(media_item_id, step, sync_state.DONE, size, content_hash)
+
+
+def sync_item(
+    service,
+    item,
+    image_dir: str,
+    video_dir: str,
+    prefetched_metadata: Optional[dict] = None,
+    state: Optional[SyncState] = None,
+):
+    """Fetch the sidecar and original for one item, skipping what exists."""
+    base_url = item["baseUrl"]
+    file_path = get_item_path(item, image_dir, video_dir)
+    meta_file_path = f"{file_path}.meta.json"
+    status = state.get(item["id"]) if state is not None else None
+
+    # Grab metadata
+    if not step_is_done(state, status, "sidecar", meta_file_path):
+
+        def fetch_metadata():
+            item_metadata = prefetched_metadata
+            if item_metadata is None:
+                item_metadata = (
+                    service.mediaItems().get(mediaItemId=item["id"]).execute()
+                )
+            write_metadata(item_metadata, meta_file_path)
+            return os.path.getsize(meta_file_path), None
+
+        run_step(state, item["id"], "sidecar", fetch_metadata)
+    else:
+        print(f"Skipped {meta_file_path}")
+
+    if item["mimeType"].startswith("image"):
+        # Download full resolution image
+        if not step_is_done(state, status, "original", file_path):
+            download_url = f"{base_url}=d"  # =d for full resolution
+            run_step(
+                state,
+                item["id"],
+                "original",
+                lambda: download_item(download_url, file_path),
+            )
+        else:
+            print(f"Skipped {file_path}")
+        # Thumbnails are built locally by generate_photos_gallery.py
+    elif item["mimeType"].startswith("video"):
+        # Download video
+        if not step_is_done(state, status, "original", file_path):
+            download_url = f"{base_url}=dv"  # =dv for bytes
+            run_step(
+                state,
+                item["id"],
+                "original",
+                lambda: download_item(download_url, file_path),
+            )
+        else:
+            print(f"Skipped {file_path}")
+        # The poster is extracted locally by generate_photos_gallery.py
 
 
 def download_album(
     album_id: str,
     image_dir: str,
-    image_thumbnail_dir: str,
     video_dir: str,
     video_thumbnail_dir: str,
+    concurrency: int = 1,
+    metadata_source: str = "search",
+    max_url_age: float = DEFAULT_MAX_URL_AGE,
+    state_db: Optional[str] = None,
 ):
     creds = authenticate()
     service = build("photoslibrary", "v1", credentials=creds, static_discovery=False)
-    items = list_album_items(service, album_id)
 
     if not os.path.exists(image_dir):
         os.makedirs(image_dir)
@@ -129,52 +494,126 @@ def download_album(
     if not os.path.exists(video_thumbnail_dir):
         os.makedirs(video_thumbnail_dir)
 
-    for item in items:
-        base_url = item["baseUrl"]
-        file_path = (
-            f"{image_dir}/{item['filename']}"
-            if item["mimeType"].startswith("image")
-            else f"{video_dir}/{item['filename']}"
-        )
-        meta_file_path = f"{file_path}.meta.json"
+    state = SyncState(state_db) if state_db else None
+    run_id = state.start_run(album_id) if state is not None else None
+    progress = {"listed": 0, "done": 0}
+    progress_lock = threading.Lock()
 
-        # Grab metadata
-        item_metadata = None
-        if file_does_not_exist(meta_file_path):
-            item_metadata = service.mediaItems().get(mediaItemId=item["id"]).execute()
-            write_metadata(item_metadata, meta_file_path)
-        else:
-            item_metadata = json.load(open(meta_file_path))
-            print(f"Skipped {meta_file_path}")
-
-        if item_metadata is not None and item_metadata["mimeType"].startswith("image"):
-            # Download full resolution image
-            if file_does_not_exist(file_path):
-                download_url = f"{base_url}=d"  # =d for full resolution
-                download_item(download_url, file_path)
-            else:
-                print(f"Skipped {file_path}")
-            # Download thumbnail
-            thumbnail_path = f"{image_thumbnail_dir}/{item['filename']}"
-            if file_does_not_exist(thumbnail_path):
-                thumbnail_url = f"{base_url}=w640-h640"
-                download_item(thumbnail_url, thumbnail_path)
-            else:
-                print(f"Skipped {thumbnail_path}")
-        elif item_metadata is not None and item_metadata["mimeType"].startswith("video"):
-            # Download video
-            if file_does_not_exist(file_path):
-                download_url = f"{base_url}=dv"  # =dv for bytes
-                download_item(download_url, file_path)
-            else:
-                print(f"Skipped {file_path}")
-            # Download thumbnail
-            thumbnail_path = f"{video_thumbnail_dir}/{item['filename']}.jpg"
-            if file_does_not_exist(thumbnail_path):
-                thumbnail_url = f"{base_url}=d-w640-h640"
-                download_item(thumbnail_url, thumbnail_path)
-            else:
-                print(f"Skipped {thumbnail_path}")
+    def pending_pages():
+        """Yield (listed_at, items still needing work, prefetched metadata) per page."""
+        for listed_at, page in list_album_pages_in_background(creds, album_id):
+            if state is not None:
+                state.mark_listed(page, run_id)
+                pending = state.pending_ids([item["id"] for item in page])
+                # Files deleted from disk since the database recorded them
+                pending.update(
+                    item["id"]
+                    for item in page
+                    if item["id"] not in pending
+                    and item_files_missing(item, image_dir, video_dir)
+                )
+            with progress_lock:
+                progress["listed"] += len(page)
+                if state is not None:
+                    progress["done"] += len(page) - len(pending)
+            if state is not None:
+                page = [item for item in page if item["id"] in pending]
+            metadata = prefetch_metadata(
+                service, page, image_dir, video_dir, metadata_source
+            )
+            yield listed_at, page, metadata
+
+    if concurrency <= 1:
+        for listed_at, item, item_metadata in iter_items_to_sync(
+            service, pending_pages(), max_url_age
+        ):
+            item = refresh_stale_item(service, item, listed_at, max_url_age)
+            sync_item(
+                service,
+                item,
+                image_dir,
+                video_dir,
+                item_metadata,
+                state,
+            )
+        finish_album_sync(state, run_id, progress["listed"], [])
+        return
+
+    # The googleapiclient service wraps an httplib2 connection, which is not
+    # thread safe, so every worker thread builds its own.
+    SessionManager.configure(concurrency)
+    thread_state = threading.local()
+    path_locks = PathLocks()
+
+    def sync_item_in_thread(item, listed_at, item_metadata):
+        if not hasattr(thread_state, "service"):
+            thread_state.service = build(
+                "photoslibrary", "v1", credentials=creds, static_discovery=False
+            )
+        # Same-named items then run one after the other, as they do without threads
+        with path_locks.hold(get_item_path(item, image_dir, video_dir)):
+            item = refresh_stale_item(
+                thread_state.service, item, listed_at, max_url_age
+            )
+            sync_item(
+                thread_state.service,
+                item,
+                image_dir,
+                video_dir,
+                item_metadata,
+                state,
+            )
+
+    failed = []
+    # Items handed to the pool but not finished yet. Waiting on this keeps the
+    # bounded listing queue full, so listing only runs a little ahead of the
+    # downloads and baseUrls don't go stale in the executor's own queue.
+    in_flight = threading.BoundedSemaphore(2 * concurrency)
+
+    def report(item, future):
+        try:
+            with progress_lock:
+                progress["done"] += 1
+                position = f"[{progress['done']}/{progress['listed']}]"
+                try:
+                    future.result()
+                    print(f"{position} Finished {item['filename']}")
+                except Exception as ex:
+                    print(f"{position} Failed {item['filename']}: {ex}")
+                    failed.append(item["filename"])
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for listed_at, item, item_metadata in iter_items_to_sync(
+            service, pending_pages(), max_url_age
+        ):
+            in_flight.acquire()
+            future = executor.submit(
+                sync_item_in_thread, item, listed_at, item_metadata
+            )
+            future.add_done_callback(functools.partial(report, item))
+
+    finish_album_sync(state, run_id, progress["listed"], failed)
+
+
+def finish_album_sync(
+    state: Optional[SyncState], run_id: Optional[int], listed: int, failed: List[str]
+):
+    if listed == 0:
+        print("No items found in album.")
+    if state is not None:
+        removed = state.removed_items(run_id)
+        for _, filename in removed:
+            print(f"No longer in album: {filename}")
+        summary = state.summary(run_id)
+        print(
+            f"{summary['listed']} items in album, {summary['failed']} failed, "
+            f"{len(removed)} removed, {summary['original_bytes']} bytes of originals"
+        )
+        state.close()
+    if failed:
+        raise Exception(f"Failed to sync {len(failed)} items: {', '.join(failed)}")
 
 
 @click.command()
@@ -187,9 +626,9 @@ def download_album(
 )
 @click.option(
     "--image_thumbnail_dir",
-    required=True,
     default="thumbnail",
-    help="Destination directory for image thumbnails",
+    hidden=True,
+    help="Ignored; thumbnails are built from the originals by generate_photos_gallery.py",
 )
 @click.option(
     "--video_dir",
@@ -203,15 +642,51 @@ def download_album(
     default="video_thumbnail",
     help="Destination directory for video thumbnails",
 )
+@click.option(
+    "--concurrency",
+    default=1,
+    show_default=True,
+    help="Number of items to download at the same time",
+)
+@click.option(
+    "--metadata-source",
+    type=click.Choice(["search", "batch", "get"]),
+    default="search",
+    show_default=True,
+    help="Write new sidecars from the album listing, refresh them with batchGet, or fetch each one individually",
+)
+@click.option(
+    "--max-url-age",
+    default=DEFAULT_MAX_URL_AGE,
+    show_default=True,
+    help="Seconds after which a listed item's baseUrl is refreshed before downloading",
+)
+@click.option(
+    "--state-db",
+    default="sync_state.db",
+    show_default=True,
+    help="SQLite database tracking what has been synced; pass an empty string to only check the disk",
+)
 def main(
     album_id: str,
     image_dir: str,
     image_thumbnail_dir: str,
     video_dir: str,
     video_thumbnail_dir: str,
+    concurrency: int,
+    metadata_source: str,
+    max_url_age: int,
+    state_db: str,
 ):
     download_album(
-        album_id, image_dir, image_thumbnail_dir, video_dir, video_thumbnail_dir
+        album_id,
+        image_dir,
+        video_dir,
+        video_thumbnail_dir,
+        concurrency,
+        metadata_source,
+        max_url_age,
+        state_db,
     )
 
 
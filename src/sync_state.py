@@ -0,0 +1,215 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+# Per-step statuses. "unknown" is a row the database hasn't confirmed yet (for
+# example files downloaded before the database existed); the first sync checks
+# the disk once and records what it finds.
+UNKNOWN = "unknown"
+DONE = "done"
+FAILED = "failed"
+NOT_APPLICABLE = "n/a"
+STEPS = ("sidecar", "original", "thumbnail")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    album_id TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    mime_type TEXT NOT NULL,
+    listed_at REAL NOT NULL,
+    last_seen_run INTEGER NOT NULL,
+    sidecar_status TEXT NOT NULL DEFAULT 'unknown',
+    original_status TEXT NOT NULL DEFAULT 'unknown',
+    thumbnail_status TEXT NOT NULL DEFAULT 'unknown',
+    sidecar_bytes INTEGER,
+    original_bytes INTEGER,
+    thumbnail_bytes INTEGER,
+    content_hash TEXT,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS items_last_seen_run ON items (last_seen_run);
+-- An item can be in several albums sharing one database; removals are
+-- judged per album from this table
+CREATE TABLE IF NOT EXISTS album_items (
+    album_id TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    last_seen_run INTEGER NOT NULL,
+    PRIMARY KEY (album_id, item_id)
+);
+"""
+
+
+class SyncState:
+    """SQLite record of what sync_from_photos has fetched, keyed by media item id.
+
+    The connection is shared between download threads, so every call takes a
+    lock. Deleting the database file is always safe: the next sync rebuilds it
+    from what is on disk.
+    """
+
+    def __init__(self, db_path: str):
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+            columns = {
+                row["name"]
+                for row in self._connection.execute("PRAGMA table_info(runs)")
+            }
+            if "album_id" not in columns:
+                # Databases from before runs were tied to an album
+                self._connection.execute("ALTER TABLE runs ADD COLUMN album_id TEXT")
+
+    def start_run(self, album_id: Optional[str] = None) -> int:
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO runs (started_at, album_id) VALUES (?, ?)",
+                (time.time(), album_id),
+            )
+            return cursor.lastrowid
+
+    def mark_listed(self, items: List[dict], run_id: int) -> None:
+        now = time.time()
+        rows = [
+            (
+                item["id"],
+                item["filename"],
+                item["mimeType"],
+                now,
+                run_id,
+                # Thumbnails and video posters are built by generate_photos_gallery.py
+                NOT_APPLICABLE,
+            )
+            for item in items
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                """
+                INSERT INTO items (id, filename, mime_type, listed_at, last_seen_run, thumbnail_status)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    thumbnail_status = excluded.thumbnail_status,
+                    filename = excluded.filename,
+                    mime_type = excluded.mime_type,
+                    listed_at = excluded.listed_at,
+                    last_seen_run = excluded.last_seen_run
+                """,
+                rows,
+            )
+            # The run knows its album; runs without one record no membership
+            self._connection.executemany(
+                """
+                INSERT INTO album_items (album_id, item_id, last_seen_run)
+                SELECT album_id, ?, id FROM runs WHERE id = ? AND album_id IS NOT NULL
+                ON CONFLICT (album_id, item_id) DO UPDATE SET
+                    last_seen_run = excluded.last_seen_run
+                """,
+                [(item["id"], run_id) for item in items],
+            )
+
+    def pending_ids(self, media_item_ids: List[str]) -> Set[str]:
+        """Ids among `media_item_ids` with any step not yet done."""
+        if not media_item_ids:
+            return set()
+        placeholders = ",".join("?" * len(media_item_ids))
+        with self._lock:
+            rows = self._connection.execute(
+                f"""
+                SELECT id FROM items
+                WHERE id IN ({placeholders})
+                AND (sidecar_status != 'done'
+                     OR original_status != 'done'
+                     OR thumbnail_status NOT IN ('done', 'n/a'))
+                """,
+                media_item_ids,
+            ).fetchall()
+        return {row["id"] for row in rows}
+
+    def get(self, media_item_id: str) -> Optional[Dict[str, object]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT * FROM items WHERE id = ?", (media_item_id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def record(
+        self,
+        media_item_id: str,
+        step: str,
+        status: str,
+        size: Optional[int] = None,
+        content_hash: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        if step not in STEPS:
+            raise ValueError(f"Unknown sync step {step}")
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"""
+                UPDATE items SET
+                    {step}_status = ?,
+                    {step}_bytes = COALESCE(?, {step}_bytes),
+                    content_hash = COALESCE(?, content_hash),
+                    error = ?,
+                    updated_at = ?
+                WHERE id = ?
+                """,
+                (status, size, content_hash, error, time.time(), media_item_id),
+            )
+
+    def removed_items(self, run_id: int) -> List[Tuple[str, str]]:
+        """Items an earlier run saw in this run's album that the listing in `run_id` no longer has.
+
+        Only the album `run_id` synced is considered, so items of other albums
+        kept in the same database are never reported. Each removal is
+        reported once: the item's membership of the album is forgotten, and
+        is recorded again if it comes back.
+        """
+        with self._lock, self._connection:
+            rows = self._connection.execute(
+                """
+                SELECT items.id, items.filename
+                FROM album_items
+                JOIN runs ON runs.id = ? AND album_items.album_id = runs.album_id
+                JOIN items ON items.id = album_items.item_id
+                WHERE album_items.last_seen_run < runs.id
+                ORDER BY items.filename
+                """,
+                (run_id,),
+            ).fetchall()
+            self._connection.execute(
+                """
+                DELETE FROM album_items
+                WHERE album_id = (SELECT album_id FROM runs WHERE id = ?)
+                AND last_seen_run < ?
+                """,
+                (run_id, run_id),
+            )
+        return [(row["id"], row["filename"]) for row in rows]
+
+    def summary(self, run_id: int) -> Dict[str, int]:
+        with self._lock:
+            row = self._connection.execute(
+                """
+                SELECT
+                    COUNT(*) AS listed,
+                    SUM(sidecar_status = 'failed' OR original_status = 'failed'
+                        OR thumbnail_status = 'failed') AS failed,
+                    COALESCE(SUM(original_bytes), 0) AS original_bytes
+                FROM items WHERE last_seen_run = ?
+                """,
+                (run_id,),
+            ).fetchone()
+        return {key: row[key] or 0 for key in row.keys()}
+
+    def close(self) -> None:
+        self._connection.close()
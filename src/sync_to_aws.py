@@ -1,5 +1,64 @@
+import mimetypes
+import os
 import subprocess
 import sys
+import click
+import boto3
+from precompress import ENCODINGS
+from s3_sync import S3Syncer, UploadManifest
+
+# (local path, key prefix, excluded file name patterns), all synced with --delete
+SYNC_TARGETS = [
+    ("thumbnail", "thumbnail/", ()),
+    ("images", "images/", ("*.json", "*.part")),
+    ("video_thumbnail", "video_thumbnail/", ()),
+    ("videos", "videos/", ("*.json", "*.part")),
+    ("photos", "photos/", ()),
+    ("search", "search/", ()),
+]
+# Each manifest plus the .gz/.br variants `generate_photos_gallery.py --precompress` writes
+UPLOADED_FILES = [
+    (f"{file_name}{suffix}", f"{file_name}{suffix}", ())
+    for file_name in ("photos.csv", "videos.csv", "search-tokens.csv")
+    for suffix in ("", *ENCODINGS)
+]
+# Written by `generate_photos_gallery.py --publish`
+PUBLISHED_TARGETS = [
+    ("manifests", "manifests/", ("*.tmp",)),
+]
+# Uploaded on its own once everything else is in the bucket, so a client never
+# follows it to hashed manifests that are missing or still being written
+POINTER_TARGET = ("manifest.json", "manifest.json", ())
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# Media keys are named after the Google Photos file name, which never gets
+# reused for different content, and everything in manifests/ is named by hash.
+IMMUTABLE_PREFIXES = (
+    "thumbnail/",
+    "images/",
+    "video_thumbnail/",
+    "videos/",
+    "manifests/",
+)
+
+
+def publish_cache_control(key):
+    if key.startswith(IMMUTABLE_PREFIXES):
+        return {"CacheControl": IMMUTABLE_CACHE_CONTROL}
+    return {"CacheControl": REVALIDATE_CACHE_CONTROL}
+
+
+def content_encoding(key):
+    """Precompressed variants keep the original's Content-Type and declare their encoding."""
+    base, suffix = os.path.splitext(key)
+    if suffix not in ENCODINGS:
+        return {}
+    content_type, _ = mimetypes.guess_type(base)
+    return {
+        "ContentEncoding": ENCODINGS[suffix],
+        "ContentType": content_type or "application/octet-stream",
+    }
 
 
 def run_command(command):
@@ -10,15 +69,7 @@ def run_command(command):
         sys.exit(1)
 
 
-def main():
-    if len(sys.argv) < 1:
-        print("Usage: python src/scripts/sync_to_aws.py <bucket_name>")
-        sys.exit(1)
-
-    s3bucketname = sys.argv[1]
-
-    print(f"s3bucketname {s3bucketname}")
-
+def sync_with_aws_cli(s3bucketname):
     # Sync directories with AWS
     print("Syncing with AWS...")
     # These are taken care of in the frontend repo
@@ -36,10 +87,10 @@ def main():
     print("Syncing images...")
     run_command(
         # Do this normally:
-        # f'aws s3 sync --follow-symlinks --exclude "*.json" images s3://{s3bucketname}/images/'
+        # f'aws s3 sync --follow-symlinks --exclude "*.json" --exclude "*.part" images s3://{s3bucketname}/images/'
         
         # Cleanup with "--delete", don't normally do this:
-        f'aws s3 sync --delete --follow-symlinks --exclude "*.json" images s3://{s3bucketname}/images/'
+        f'aws s3 sync --delete --follow-symlinks --exclude "*.json" --exclude "*.part" images s3://{s3bucketname}/images/'
     )
     
     print("Syncing video thumbnails...")
@@ -49,13 +100,81 @@ def main():
     )
     print("Syncing videos...")
     run_command(
-        # f'aws s3 sync --follow-symlinks --exclude "*.json" videos s3://{s3bucketname}/videos/'
-        f'aws s3 sync --delete --follow-symlinks --exclude "*.json" videos s3://{s3bucketname}/videos/'
+        # f'aws s3 sync --follow-symlinks --exclude "*.json" --exclude "*.part" videos s3://{s3bucketname}/videos/'
+        f'aws s3 sync --delete --follow-symlinks --exclude "*.json" --exclude "*.part" videos s3://{s3bucketname}/videos/'
     )
     print("Uploading CSVs...")
     run_command(f"aws s3 cp photos.csv s3://{s3bucketname}/photos.csv")
     run_command(f"aws s3 cp videos.csv s3://{s3bucketname}/videos.csv")
 
 
+@click.command()
+@click.argument("s3bucketname")
+@click.option(
+    "--workers",
+    default=16,
+    show_default=True,
+    help="Files uploaded concurrently across all prefixes",
+)
+@click.option(
+    "--manifest",
+    "manifest_file",
+    default=None,
+    help="Record of uploaded keys, defaults to .s3_manifest.<bucket>.json",
+)
+@click.option(
+    "--rescan",
+    is_flag=True,
+    help="List the bucket again instead of trusting the local manifest",
+)
+@click.option(
+    "--endpoint-url",
+    default=None,
+    help="Alternative S3 endpoint, e.g. a local S3-compatible server",
+)
+@click.option(
+    "--publish",
+    is_flag=True,
+    help="Upload manifests/ and manifest.json and set Cache-Control headers for long-lived caching. "
+    "Switching this on or off rewrites the headers of every object once (server-side copies)",
+)
+@click.option(
+    "--use-aws-cli",
+    is_flag=True,
+    help="Shell out to `aws s3 sync` for each prefix like before",
+)
+def main(
+    s3bucketname, workers, manifest_file, rescan, endpoint_url, publish, use_aws_cli
+):
+    print(f"s3bucketname {s3bucketname}")
+    if use_aws_cli:
+        sync_with_aws_cli(s3bucketname)
+        return
+
+    manifest = UploadManifest(manifest_file or f".s3_manifest.{s3bucketname}.json")
+    client = boto3.client("s3", endpoint_url=endpoint_url)
+    syncer = S3Syncer(
+        s3bucketname,
+        manifest,
+        workers=workers,
+        client=client,
+        extra_args_for_key=lambda key: {
+            **(publish_cache_control(key) if publish else {}),
+            **content_encoding(key),
+        },
+    )
+    targets = SYNC_TARGETS + UPLOADED_FILES
+    if publish:
+        targets += PUBLISHED_TARGETS
+    print("Syncing with AWS...")
+    try:
+        syncer.sync(targets, rescan=rescan)
+        if publish:
+            syncer.sync([POINTER_TARGET], rescan=rescan)
+    except Exception as ex:
+        print(f"Error syncing: {ex}")
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,45 @@
+import hashlib
+from typing import Dict, List
+
+from pipeline_utils import load_json_cache, save_json_cache
+
+# Tags from another model are not reused
+MODEL_NAME = "mobilenet_v3_small/IMAGENET1K_V1"
+
+
+def file_content_hash(path: str) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def load_tag_cache(cache_file: str) -> dict:
+    """Load `{"model", "files": {name: [mtime_ns, size, hash]}, "tags": {hash: [...]}}`.
+
+    Tags are keyed by content hash so renamed or re-downloaded images are not
+    run through the model again; `files` only saves rehashing unchanged
+    thumbnails. A cache written by a different model is discarded.
+    """
+    cache = load_json_cache(cache_file, "tag cache")
+    if cache is None or cache.get("model") != MODEL_NAME:
+        return {"model": MODEL_NAME, "files": {}, "tags": {}}
+    return cache
+
+
+def save_tag_cache(cache_file: str, cache: dict) -> None:
+    save_json_cache(cache_file, cache)
+
+
+def cached_tags(cache_file: str) -> Dict[str, List[str]]:
+    """File name -> tokens from the last tagging run, without loading torch.
+
+    Lets a run without `--tag` keep the tags an earlier run computed instead of
+    writing an empty tokens column. Images tagged since are simply untagged.
+    """
+    cache = load_tag_cache(cache_file)
+    return {
+        name: cache["tags"].get(content_hash, [])
+        for name, (_, _, content_hash) in cache["files"].items()
+    }
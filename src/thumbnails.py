@@ -0,0 +1,198 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Sequence, Set, Tuple
+from PIL import ExifTags, Image, ImageFile, ImageOps
+
+from pipeline_utils import pool_chunks
+
+# Heights pig.js asks for through urlForSize: the blurred placeholder
+# (thumbnailSize) and the three getImageSize buckets.
+THUMBNAIL_HEIGHTS = (20, 100, 250, 500)
+SKIPPED_EXTENSIONS = (
+    ".json",
+    ".part",
+    ".tmp",
+    ".mp4",
+    ".mov",
+    ".avi",
+    ".mpg",
+    ".cr2",
+)
+
+
+def is_image_file_name(file_name: str) -> bool:
+    """Whether a name in images/ is a photo, not a sidecar, index or partial download."""
+    return not file_name.startswith(".") and not file_name.lower().endswith(
+        SKIPPED_EXTENSIONS
+    )
+
+
+def thumbnail_path(thumbnail_directory: str, height: int, file_name: str) -> str:
+    return os.path.join(thumbnail_directory, str(height), file_name)
+
+
+def stale_heights(
+    source_path: str, thumbnail_directory: str, file_name: str, heights: Sequence[int]
+) -> List[int]:
+    source_mtime = os.path.getmtime(source_path)
+    stale = []
+    for height in heights:
+        output = thumbnail_path(thumbnail_directory, height, file_name)
+        if not os.path.exists(output) or os.path.getmtime(output) < source_mtime:
+            stale.append(height)
+    return stale
+
+
+def make_thumbnails(
+    source_directory: str,
+    thumbnail_directory: str,
+    file_name: str,
+    heights: Sequence[int],
+) -> int:
+    """Write every stale thumbnail size for one image, largest first.
+
+    JPEGs are opened with `draft` so libjpeg decodes at 1/2, 1/4 or 1/8 scale
+    straight away, and each smaller size is reduced from the previous one
+    instead of from the original.
+    """
+    ImageFile.LOAD_TRUNCATED_IMAGES = True
+    source_path = os.path.join(source_directory, file_name)
+    heights = sorted(
+        stale_heights(source_path, thumbnail_directory, file_name, heights),
+        reverse=True,
+    )
+    if not heights:
+        return 0
+
+    with Image.open(source_path) as im:
+        width, height = im.size
+        orientation = im.getexif().get(ExifTags.Base.Orientation, 1)
+        # Orientations 5-8 are rotated by 90 degrees, so the displayed height
+        # is the stored width.
+        displayed_height = width if orientation in (5, 6, 7, 8) else height
+        scale = min(1.0, heights[0] / displayed_height)
+        im.draft(
+            "RGB", (max(1, int(width * scale) + 1), max(1, int(height * scale) + 1))
+        )
+        thumbnail = ImageOps.exif_transpose(im)
+
+    is_jpeg = file_name.lower().endswith((".jpg", ".jpeg"))
+    # The temporary name hides the extension from PIL
+    image_format = Image.registered_extensions()[os.path.splitext(file_name)[1].lower()]
+    if is_jpeg and thumbnail.mode != "RGB":
+        thumbnail = thumbnail.convert("RGB")
+
+    for target_height in heights:
+        if thumbnail.height > target_height:
+            target_width = max(
+                1, round(thumbnail.width * target_height / thumbnail.height)
+            )
+            thumbnail = thumbnail.resize(
+                (target_width, target_height),
+                Image.Resampling.LANCZOS,
+                reducing_gap=2.0,
+            )
+        output = thumbnail_path(thumbnail_directory, target_height, file_name)
+        # A thumbnail cut short by a crash would be newer than its source and
+        # never rebuilt, so only complete files take the final name
+        temporary = f"{output}.tmp"
+        try:
+            if is_jpeg:
+                thumbnail.save(temporary, image_format, quality=85, optimize=True)
+            else:
+                thumbnail.save(temporary, image_format)
+            os.replace(temporary, output)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+    return len(heights)
+
+
+def prune_thumbnails(
+    thumbnail_directory: str, file_names: Set[str], heights: Sequence[int]
+) -> int:
+    """Remove thumbnails (and leftover .tmp files) with no source in `file_names`."""
+    removed = 0
+    for height in heights:
+        directory = os.path.join(thumbnail_directory, str(height))
+        for file_name in os.listdir(directory):
+            if file_name not in file_names:
+                os.remove(os.path.join(directory, file_name))
+                removed += 1
+    return removed
+
+
+def make_thumbnails_chunk(
+    source_directory: str,
+    thumbnail_directory: str,
+    file_names: List[str],
+    heights: Sequence[int],
+) -> Tuple[int, List[str]]:
+    written = 0
+    failed = []
+    for file_name in file_names:
+        try:
+            written += make_thumbnails(
+                source_directory, thumbnail_directory, file_name, heights
+            )
+        except Exception as ex:
+            logging.error(f"Failed to make thumbnails for {file_name}: {ex}")
+            failed.append(file_name)
+    return written, failed
+
+
+def generate_thumbnails(
+    source_directory: str,
+    thumbnail_directory: str,
+    heights: Sequence[int] = THUMBNAIL_HEIGHTS,
+    workers: int = 1,
+) -> None:
+    """Build `thumbnail/<height>/<file name>` for every image in `source_directory`.
+
+    Thumbnails that are already newer than their source are left alone, and
+    thumbnails whose source is gone are removed.
+    """
+    for height in heights:
+        os.makedirs(os.path.join(thumbnail_directory, str(height)), exist_ok=True)
+
+    file_names = sorted(
+        file_name
+        for file_name in os.listdir(source_directory)
+        if is_image_file_name(file_name)
+    )
+    removed = prune_thumbnails(thumbnail_directory, set(file_names), heights)
+
+    chunks = pool_chunks(file_names, workers, 100)
+    written = 0
+    failed: List[str] = []
+    if workers <= 1:
+        results = (
+            make_thumbnails_chunk(source_directory, thumbnail_directory, chunk, heights)
+            for chunk in chunks
+        )
+        for chunk_written, chunk_failed in results:
+            written += chunk_written
+            failed.extend(chunk_failed)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    make_thumbnails_chunk,
+                    source_directory,
+                    thumbnail_directory,
+                    chunk,
+                    heights,
+                )
+                for chunk in chunks
+            ]
+            for future in futures:
+                chunk_written, chunk_failed = future.result()
+                written += chunk_written
+                failed.extend(chunk_failed)
+
+    print(
+        f"Wrote {written} thumbnails for {len(file_names)} images, {len(failed)} "
+        f"failed, removed {removed} of deleted images"
+    )
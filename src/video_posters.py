@@ -0,0 +1,119 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import cv2
+import numpy as np
+
+VIDEO_EXTENSIONS = (
+    ".mp4",
+    ".mov",
+    ".avi",
+    ".mpg",
+    ".mpeg",
+    ".m4v",
+    ".3gp",
+    ".mkv",
+    ".webm",
+)
+# Same bounding box as the `=d-w640-h640` posters Google hands out
+POSTER_SIZE = 640
+# Seek this far into the video; the very first frame is often black
+POSTER_POSITION = 0.1
+
+
+def poster_path(thumbnail_directory: str, file_name: str) -> str:
+    # regenerate_csv(..., is_for_videos=True) expects `<video file name>.jpg`
+    return os.path.join(thumbnail_directory, f"{file_name}.jpg")
+
+
+def read_poster_frame(source_path: str) -> Optional[np.ndarray]:
+    capture = cv2.VideoCapture(source_path)
+    try:
+        if not capture.isOpened():
+            return None
+        frame_count = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+        if frame_count > 1:
+            # Setting the position seeks to the nearest keyframe and decodes
+            # forward from there, not from the start of the stream.
+            capture.set(cv2.CAP_PROP_POS_FRAMES, int(frame_count * POSTER_POSITION))
+        ok, frame = capture.read()
+        if not ok and frame_count > 1:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = capture.read()
+        return frame if ok else None
+    finally:
+        capture.release()
+
+
+def make_poster(
+    source_directory: str, thumbnail_directory: str, file_name: str
+) -> bool:
+    """Write the poster for one video unless it is already newer than the video."""
+    source_path = os.path.join(source_directory, file_name)
+    output = poster_path(thumbnail_directory, file_name)
+    if os.path.exists(output) and os.path.getmtime(output) >= os.path.getmtime(
+        source_path
+    ):
+        return False
+
+    frame = read_poster_frame(source_path)
+    if frame is None:
+        raise Exception(f"Could not read a frame from {source_path}")
+
+    height, width = frame.shape[:2]
+    scale = min(1.0, POSTER_SIZE / max(width, height))
+    if scale < 1.0:
+        frame = cv2.resize(
+            frame,
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+    if not cv2.imwrite(output, frame, [cv2.IMWRITE_JPEG_QUALITY, 85]):
+        raise Exception(f"Could not write {output}")
+    return True
+
+
+def make_poster_safely(
+    source_directory: str, thumbnail_directory: str, file_name: str
+) -> Optional[bool]:
+    try:
+        return make_poster(source_directory, thumbnail_directory, file_name)
+    except Exception as ex:
+        logging.error(f"Failed to extract poster for {file_name}: {ex}")
+        return None
+
+
+def generate_posters(
+    source_directory: str, thumbnail_directory: str, workers: int = 1
+) -> None:
+    """Extract a poster frame for every video in `source_directory`."""
+    os.makedirs(thumbnail_directory, exist_ok=True)
+    file_names = sorted(
+        file_name
+        for file_name in os.listdir(source_directory)
+        if file_name.lower().endswith(VIDEO_EXTENSIONS)
+    )
+
+    if workers <= 1:
+        results = [
+            make_poster_safely(source_directory, thumbnail_directory, file_name)
+            for file_name in file_names
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    make_poster_safely,
+                    [source_directory] * len(file_names),
+                    [thumbnail_directory] * len(file_names),
+                    file_names,
+                    chunksize=max(1, min(20, len(file_names) // (workers * 4))),
+                )
+            )
+
+    written = sum(1 for result in results if result)
+    failed = sum(1 for result in results if result is None)
+    print(
+        f"Wrote {written} video posters for {len(file_names)} videos, {failed} failed"
+    )
@@ -1,14 +1,27 @@
 import sys
 import os
+import time
+import hashlib
+import threading
 import click
-from shutil import copy2
-from typing import List, Callable, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from shutil import copy2, copyfileobj, copystat
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from typing import List, Callable, Dict, Optional, Set, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from pipeline_utils import load_json_cache, save_json_cache  # noqa: E402
 
 class FileDesc():
-    def __init__(self, root: str, file_name: str):
+    def __init__(self, root: str, file_name: str, filesize: int = 0, mtime: float = 0):
         self.root = root
         self.filename = file_name
-        self.filesize = 0
+        self.filesize = filesize
+        self.mtime = mtime
         self.full = root + '/' + file_name
 
     def __str__(self):
@@ -19,14 +32,213 @@ class FileDesc():
 
 
 def recursive_full_path(directory: str) -> List[FileDesc]:
+    """Index every file under `directory` with its size and mtime.
+
+    Uses os.scandir so the directory entries supply the file type, and each
+    file is stat'ed exactly once here instead of again by every comparison.
+    """
     ret: List[FileDesc] = []
+    pending = [os.path.abspath(directory)]
 
-    for root, dirs, files in os.walk(os.path.abspath(directory)):
-        for f in files:
-            ret.append(FileDesc(root, f))
+    while pending:
+        root = pending.pop()
+        try:
+            entries = list(os.scandir(root))
+        except OSError:
+            continue
+        for entry in sorted(entries, key=lambda e: e.name):
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    ret.append(FileDesc(root, entry.name, stat.st_size, stat.st_mtime))
+            except OSError:
+                continue
     return ret
 
 
+class TreeComparison():
+    # missing: copy as-is; duplicate_different_size: name taken, copy renamed;
+    # duplicate_same_size: already in the destination, skip
+    def __init__(self):
+        self.missing: List[FileDesc] = []
+        self.duplicate_different_size: List[FileDesc] = []
+        self.duplicate_same_size: List[FileDesc] = []
+
+
+def classify(source_list: List[FileDesc], destination_list: List[FileDesc]) -> TreeComparison:
+    """Sort every source file into missing / same-size / different-size duplicate in one pass."""
+    destination: Dict[str, FileDesc] = {}
+    for d in destination_list:
+        destination[d.filename] = d
+
+    result = TreeComparison()
+    for source in source_list:
+        dest = destination.get(source.filename)
+        if dest is None:
+            result.missing.append(source)
+        elif source.filesize != dest.filesize:
+            result.duplicate_different_size.append(source)
+        else:
+            result.duplicate_same_size.append(source)
+    return result
+
+
+def compare_directories(source_directory: str, dest_directory: str) -> TreeComparison:
+    return classify(recursive_full_path(source_directory),
+                    recursive_full_path(dest_directory))
+
+
+HASH_CACHE_NAME = '.sync_directory_hashes.json'
+PARTIAL_HASH_BYTES = 64 * 1024
+HASH_BUFFER_BYTES = 8 * 1024 * 1024
+
+
+def partial_hash(f: FileDesc) -> str:
+    """Hash of the first and last PARTIAL_HASH_BYTES; cheap to compute, good enough to rule files out."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(f.full, 'rb') as fh:
+        h.update(fh.read(PARTIAL_HASH_BYTES))
+        if f.filesize > 2 * PARTIAL_HASH_BYTES:
+            fh.seek(f.filesize - PARTIAL_HASH_BYTES)
+            h.update(fh.read(PARTIAL_HASH_BYTES))
+    return h.hexdigest()
+
+
+def full_hash(f: FileDesc) -> str:
+    h = hashlib.blake2b(digest_size=32)
+    with open(f.full, 'rb', buffering=0) as fh:
+        for chunk in iter(lambda: fh.read(HASH_BUFFER_BYTES), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class HashCache():
+    """Partial and full hashes of destination files, stored in the destination root.
+
+    Entries are keyed by path relative to the destination and only reused
+    while the file's size and mtime still match.
+    """
+
+    def __init__(self, dest_directory: str):
+        self.root = os.path.abspath(dest_directory)
+        self.path = os.path.join(self.root, HASH_CACHE_NAME)
+        self.entries: Dict[str, dict] = load_json_cache(self.path, 'hash cache') or {}
+
+    def _entry(self, f: FileDesc) -> dict:
+        key = os.path.relpath(f.full, self.root)
+        entry = self.entries.get(key)
+        if entry is None or entry['size'] != f.filesize or entry['mtime'] != f.mtime:
+            entry = {'size': f.filesize, 'mtime': f.mtime}
+            self.entries[key] = entry
+        return entry
+
+    def get(self, f: FileDesc, kind: str) -> Optional[str]:
+        return self._entry(f).get(kind)
+
+    def put(self, f: FileDesc, kind: str, value: str):
+        self._entry(f)[kind] = value
+
+    def prune(self, destination_list: List[FileDesc]):
+        """Forget files that are no longer in the destination."""
+        keep = {os.path.relpath(d.full, self.root) for d in destination_list}
+        self.entries = {key: entry for key, entry in self.entries.items() if key in keep}
+
+    def save(self):
+        save_json_cache(self.path, self.entries)
+
+
+def hash_files(files: List[FileDesc],
+               kind: str,
+               func: Callable[[FileDesc], str],
+               cache: HashCache,
+               cached: Dict[str, bool],
+               workers: int) -> Dict[str, str]:
+    """Hash `files` in parallel, reusing cached hashes for destination files."""
+    hashes: Dict[str, str] = {}
+    todo = []
+    for f in files:
+        value = cache.get(f, kind) if cached[f.full] else None
+        if value is None:
+            todo.append(f)
+        else:
+            hashes[f.full] = value
+
+    # hashlib releases the GIL while hashing large buffers, so threads scale
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for f, value in zip(todo, executor.map(func, todo)):
+            hashes[f.full] = value
+            if cached[f.full]:
+                cache.put(f, kind, value)
+    return hashes
+
+
+def classify_by_content(source_list: List[FileDesc],
+                        destination_list: List[FileDesc],
+                        cache: HashCache,
+                        workers: int = 8) -> TreeComparison:
+    """Like classify(), but a duplicate means identical bytes rather than name and size.
+
+    Files are bucketed by size; only sizes shared by a source file and at least
+    one other file get a head/tail partial hash, and only partial-hash
+    collisions involving a source file get a full hash.
+    Source files whose content already exists (in the destination, or earlier
+    in the source) go to duplicate_same_size; new content whose name is taken
+    goes to duplicate_different_size to be copied under a new name.
+    """
+    destination_list = [d for d in destination_list if d.filename != HASH_CACHE_NAME]
+    cached = {d.full: True for d in destination_list}
+    cached.update({f.full: False for f in source_list})
+
+    def may_duplicate_source(group: List[FileDesc]) -> bool:
+        # Destination files that only match each other never decide anything
+        return len(group) > 1 and any(not cached[f.full] for f in group)
+
+    by_size: Dict[int, List[FileDesc]] = {}
+    for f in source_list + destination_list:
+        by_size.setdefault(f.filesize, []).append(f)
+    same_size = [f for group in by_size.values() if may_duplicate_source(group) for f in group]
+
+    partial = hash_files(same_size, 'partial', partial_hash, cache, cached, workers)
+    by_partial: Dict[Tuple[int, str], List[FileDesc]] = {}
+    for f in same_size:
+        by_partial.setdefault((f.filesize, partial[f.full]), []).append(f)
+    collisions = [f for group in by_partial.values() if may_duplicate_source(group) for f in group]
+
+    full = hash_files(collisions, 'full', full_hash, cache, cached, workers)
+    cache.prune(destination_list)
+
+    def content_key(f: FileDesc) -> str:
+        # Files without a full hash matched nothing, so their path identifies them
+        return full.get(f.full, f.full)
+
+    dest_names = {d.filename for d in destination_list}
+    dest_contents = {content_key(d) for d in destination_list}
+    seen = set()
+    result = TreeComparison()
+    for source in source_list:
+        key = content_key(source)
+        if key in dest_contents or key in seen:
+            result.duplicate_same_size.append(source)
+            continue
+        seen.add(key)
+        if source.filename in dest_names:
+            result.duplicate_different_size.append(source)
+        else:
+            result.missing.append(source)
+    return result
+
+
+def numbered_name(filename: str, taken: Set[str]) -> str:
+    """First 'name (N).ext' with N >= 1 that isn't in `taken`."""
+    stem, extension = os.path.splitext(filename)
+    n = 1
+    while '{} ({}){}'.format(stem, n, extension) in taken:
+        n += 1
+    return '{} ({}){}'.format(stem, n, extension)
+
+
 def comparison(source_list: List[FileDesc],
                destination_list: List[FileDesc],
                func: Callable[[FileDesc, Dict[str, FileDesc]], bool]) -> List[FileDesc]:
@@ -68,38 +280,109 @@ def get_duplicate_files(source_directory: str, dest_directory: str) -> List[File
 
 
 def get_duplicate_different_size(source_directory: str, dest_directory: str) -> List[FileDesc]:
-    duplicates = get_duplicate_files(source_directory, dest_directory)
-
-    different_dup = []
-    for dup in duplicates:
-        try:
-            source_size = os.path.getsize(dup.root + '/' + dup.filename)
-            dest_size = os.path.getsize(dest_directory + '/' + dup.filename)
-            if source_size != dest_size:
-                different_dup.append(dup)
-        except OSError as e:
-            continue
-
-    return different_dup
+    return compare_directories(source_directory, dest_directory).duplicate_different_size
 
 
 def get_duplicate_same_size(source_directory: str, dest_directory: str) -> List[FileDesc]:
-    duplicates = get_duplicate_files(source_directory, dest_directory)
-
-    exact_dup = []
-    for dup in duplicates:
-        try:
-            source_size = os.path.getsize(dup.root + '/' + dup.filename)
-            dest_size = os.path.getsize(dest_directory + '/' + dup.filename)
-            if source_size == dest_size:
-                exact_dup.append(dup)
-        except OSError as e:
-            continue
-
-    return exact_dup
-
-
-def copy_source_recursive_to_destination(source_directory: str, dest_directory: str, test: bool = False):
+    return compare_directories(source_directory, dest_directory).duplicate_same_size
+
+
+FICLONE = 0x40049409  # from linux/fs.h
+COPY_CHUNK_BYTES = 64 * 1024 * 1024
+LOG_BUFFER_BYTES = 1024 * 1024
+LOG_FLUSH_FILES = 100
+
+
+def copy_contents(src: str, dst: str, size: int):
+    """Copy file contents, letting the kernel do the work where it can.
+
+    Tries a reflink (copy-on-write clone on btrfs/XFS), then copy_file_range
+    (server-side copies on NFS 4.2/SMB), then sendfile, then a plain buffered
+    copy.
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return
+            except OSError:
+                pass
+
+        for kernel_copy in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+            if kernel_copy is None:
+                continue
+            try:
+                offset = 0
+                while offset < size:
+                    if kernel_copy is os.sendfile:
+                        copied = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, min(COPY_CHUNK_BYTES, size - offset))
+                    else:
+                        copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(COPY_CHUNK_BYTES, size - offset), offset, offset)
+                    if copied == 0:
+                        break
+                    offset += copied
+                if offset == size:
+                    return
+            except OSError:
+                pass
+            fdst.seek(0)
+            fdst.truncate()
+
+        fsrc.seek(0)
+        copyfileobj(fsrc, fdst, COPY_CHUNK_BYTES)
+
+
+def fast_copy2(f: FileDesc, dst: str):
+    """copy2() equivalent built on copy_contents(); `dst` may be a directory."""
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, f.filename)
+    copy_contents(f.full, dst, f.filesize)
+    copystat(f.full, dst)
+
+
+def run_copies(copies: List[Tuple[FileDesc, str]], logfile, workers: int):
+    """Run (source, destination) copies on a thread pool and report throughput."""
+    log_lock = threading.Lock()
+    logged = 0
+    copied_bytes = 0
+    start = time.monotonic()
+
+    def copy_one(copy: Tuple[FileDesc, str]) -> int:
+        nonlocal logged
+        f, dst = copy
+        if workers <= 1:
+            copy2(f.full, dst)
+        else:
+            fast_copy2(f, dst)
+        with log_lock:
+            logfile.write('{},{}\n'.format(f.full, dst))
+            logged += 1
+            # Buffered for speed, but flushed often enough that a crash
+            # loses at most one batch of entries
+            if logged % LOG_FLUSH_FILES == 0:
+                logfile.flush()
+        return f.filesize
+
+    if workers <= 1:
+        for copy in copies:
+            copied_bytes += copy_one(copy)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for size in executor.map(copy_one, copies):
+                copied_bytes += size
+
+    elapsed = max(time.monotonic() - start, 1e-9)
+    if copies:
+        print('copied {} files, {:.1f} MB in {:.1f}s ({:.1f} MB/s)'
+              .format(len(copies), copied_bytes / 1e6, elapsed, copied_bytes / 1e6 / elapsed))
+
+
+def copy_source_recursive_to_destination(source_directory: str,
+                                         dest_directory: str,
+                                         test: bool = False,
+                                         dedup: str = 'name',
+                                         hash_workers: int = 8,
+                                         copy_workers: int = 1):
     extensions = ['.jpg', '.png', '.jpeg', '.gif', '.avi', '.mov', '.mpg', '.mp4', '.cr2']
 
     def is_extension(f: FileDesc):
@@ -109,39 +392,85 @@ def copy_source_recursive_to_destination(source_directory: str, dest_directory:
                 return True
         return False
 
-    logfile = open('sync_directory.log', 'a')
+    # Both trees are scanned once; everything below works off that index
+    source_list = list(filter(is_extension, recursive_full_path(source_directory)))
+    destination_list = recursive_full_path(dest_directory)
+    if dedup == 'hash':
+        cache = HashCache(dest_directory)
+        comparison = classify_by_content(source_list, destination_list, cache, hash_workers)
+        if not test:
+            cache.save()
+    else:
+        comparison = classify(source_list, destination_list)
+
+    difference = 'contents' if dedup == 'hash' else 'file size'
+
+    # Names in the destination plus names claimed by earlier copies in this run
+    taken = {d.filename for d in destination_list}
+
+    # Keyed by destination so two sources with the same name don't race. By
+    # name the later one wins, as it did when copies ran one after another;
+    # by hash they hold different contents, so the later one is renamed.
+    copies: Dict[str, Tuple[FileDesc, str]] = {}
+    messages: Dict[str, str] = {}
+    dropped: List[Tuple[FileDesc, str]] = []
+
+    def plan(f: FileDesc, dst: str, path: str, message: str):
+        if path in copies:
+            dropped.append((copies[path][0], path))
+        copies[path] = (f, dst)
+        messages[path] = message
 
     # copy missing files first
-    missing_files = get_missing_files(source_directory, dest_directory)
-    missing_files = list(filter(is_extension, missing_files))
+    missing_files = comparison.missing
     for f in missing_files:
-        print('cp {} to {}'.format(f.full, dest_directory))
-        if not test:
-            copy2(f.full, dest_directory)
-            logfile.write('{},{}\n'.format(f.full, dest_directory))
+        if f.filename in taken and dedup == 'hash':
+            diff_filename = numbered_name(f.filename, taken)
+            taken.add(diff_filename)
+            path = dest_directory + '/' + diff_filename
+            plan(f, path, path, 'duplicate filename but different {}: cp {} to {}'
+                 .format(difference, f.full, path))
+            continue
+        taken.add(f.filename)
+        plan(f, dest_directory, dest_directory + '/' + f.filename,
+             'cp {} to {}'.format(f.full, dest_directory))
 
-    dupes_different_size = get_duplicate_different_size(source_directory, dest_directory)
-    dupes_different_size = list(filter(is_extension, dupes_different_size))
+    dupes_different_size = comparison.duplicate_different_size
     for f in dupes_different_size:
-        diff_filename = f.filename[:f.filename.index('.')] + ' (1)' + f.filename[f.filename.index('.'):]
-        print('duplicate filename but different file size: cp {} to {}'
-              .format(f.full, dest_directory + '/' + diff_filename))
-        if not test:
-            copy2(f.full, dest_directory + '/' + diff_filename)
-            logfile.write('{},{}\n'.format(f.full, dest_directory + '/' + diff_filename))
-
-    dupes_same_size = get_duplicate_same_size(source_directory, dest_directory)
-    dupes_same_size = list(filter(is_extension, dupes_same_size))
+        diff_filename = numbered_name(f.filename, taken)
+        taken.add(diff_filename)
+        path = dest_directory + '/' + diff_filename
+        plan(f, path, path, 'duplicate filename but different {}: cp {} to {}'
+             .format(difference, f.full, path))
+
+    # Only the copies that will actually run are announced
+    for path in copies:
+        print(messages[path])
+    for f, path in dropped:
+        print('skipping {}: a later source with the same name is copied to {}'.format(f.full, path))
+
+    dupes_same_size = comparison.duplicate_same_size
     for f in dupes_same_size:
-        print('skipping duplicate (same file size): {}'.format(f))
+        print('skipping duplicate (same {}): {}'.format(difference, f))
+
+    if not test:
+        with open('sync_directory.log', 'a', buffering=LOG_BUFFER_BYTES) as logfile:
+            run_copies(list(copies.values()), logfile, copy_workers)
+    if dropped:
+        print('{} files skipped because a later source has the same name'.format(len(dropped)))
 
 
 @click.command()
 @click.option('--source_dir', required=True, help='Source directory of images to import')
 @click.option('--destination_dir', required=True, help='Destination directory of images')
 @click.option('--test_run', is_flag=True, help='Show actions without importing files')
-def main(source_dir: str, destination_dir: str, test_run: bool):
-    copy_source_recursive_to_destination(source_dir, destination_dir, test_run)
+@click.option('--dedup', type=click.Choice(['name', 'hash']), default='name',
+              help='Treat files as duplicates by name and size, or by identical contents')
+@click.option('--hash_workers', default=8, help='Threads used to hash files in --dedup hash mode')
+@click.option('--copy_workers', default=1,
+              help='Copy this many files at once using reflink/copy_file_range/sendfile (1 copies serially with copy2)')
+def main(source_dir: str, destination_dir: str, test_run: bool, dedup: str, hash_workers: int, copy_workers: int):
+    copy_source_recursive_to_destination(source_dir, destination_dir, test_run, dedup, hash_workers, copy_workers)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,141 @@
+"""Local stand-ins for the Google Photos API and its download URLs.
+
+Used by the tests and by scripts/benchmark_pipeline.py, so sync_from_photos.py
+can run end to end without credentials or network access.
+"""
+
+import collections
+import http.server
+import re
+import threading
+from typing import Callable, List, Optional
+
+ALBUM_PAGE_SIZE = 100
+RANGE = re.compile(r"^bytes=(\d+)-$")
+
+
+class StubRequest:
+    def __init__(self, response: dict):
+        self.response = response
+
+    def execute(self) -> dict:
+        return self.response
+
+
+class StubMediaItems:
+    """`mediaItems()` of the discovery client; counts calls by method in `calls`."""
+
+    def __init__(self, items: List[dict]):
+        self.items = items
+        self.by_id = {item["id"]: item for item in items}
+        self.calls = collections.Counter()
+        self.lock = threading.Lock()
+
+    def count(self, method: str) -> None:
+        with self.lock:
+            self.calls[method] += 1
+
+    def search(self, body: dict) -> StubRequest:
+        self.count("search")
+        start = int(body.get("pageToken", 0))
+        end = start + body.get("pageSize", ALBUM_PAGE_SIZE)
+        response = {"mediaItems": self.items[start:end]}
+        if end < len(self.items):
+            response["nextPageToken"] = str(end)
+        return StubRequest(response)
+
+    def get(self, mediaItemId: str) -> StubRequest:
+        self.count("get")
+        return StubRequest(self.by_id[mediaItemId])
+
+    def batchGet(self, mediaItemIds: List[str]) -> StubRequest:
+        self.count("batchGet")
+        if len(mediaItemIds) > 50:
+            raise ValueError("batchGet accepts at most 50 ids")
+        return StubRequest(
+            {
+                "mediaItemResults": [
+                    (
+                        {"mediaItem": self.by_id[i]}
+                        if i in self.by_id
+                        else {"status": {"code": 5, "message": "NOT_FOUND"}}
+                    )
+                    for i in mediaItemIds
+                ]
+            }
+        )
+
+
+class StubPhotosService:
+    """Stands in for the `photoslibrary` v1 discovery client, serving one album.
+
+    Every service built from the same StubMediaItems shares its call counts,
+    as the per-thread services of sync_from_photos.py share one account.
+    """
+
+    def __init__(self, media_items: StubMediaItems):
+        self.media_items = media_items
+
+    def mediaItems(self) -> StubMediaItems:
+        return self.media_items
+
+
+def serve_stub_downloads(
+    content_for: Callable[[str], Optional[bytes]],
+) -> http.server.ThreadingHTTPServer:
+    """Serve `content_for(media item id)` for every `<baseUrl>=d`/`=dv` request on localhost.
+
+    `Range: bytes=N-` gets a 206 like Google's download servers, or a 416
+    with `Content-Range: bytes */<size>` past the end. Every request's path
+    and Range header are appended to `server.requests`. An id added to
+    `server.cut_short` with a byte count has its next response dropped after
+    that many body bytes, like a connection lost mid-download.
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out separately; without this every keep-alive
+        # response waits out a delayed ACK
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            server.requests.append((self.path, self.headers.get("Range")))
+            media_item_id = self.path.strip("/").split("=")[0]
+            content = content_for(media_item_id)
+            if content is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            match = RANGE.match(self.headers.get("Range") or "")
+            if match is not None and int(match.group(1)) >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            start = int(match.group(1)) if match is not None else 0
+            self.send_response(200 if match is None else 206)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(content) - start))
+            if match is not None:
+                self.send_header(
+                    "Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}"
+                )
+            self.end_headers()
+            cut_after = server.cut_short.pop(media_item_id, None)
+            if cut_after is not None:
+                self.wfile.write(content[start : start + cut_after])
+                self.close_connection = True
+                return
+            self.wfile.write(content[start:])
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.requests = []
+    server.cut_short = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
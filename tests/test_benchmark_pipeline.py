@@ -0,0 +1,63 @@
+import hashlib
+import os
+
+import pytest
+
+import benchmark_pipeline
+import sync_from_photos
+from benchmark_pipeline import STAGES, library_is_current, write_synthetic_library
+
+
+def tree_digest(directory):
+    """Relative path -> SHA-256 of every file under `directory`."""
+    digest = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                digest[os.path.relpath(path, directory)] = hashlib.sha256(
+                    f.read()
+                ).hexdigest()
+    return digest
+
+
+def test_libraries_are_reproducible_from_their_seed(tmp_path):
+    write_synthetic_library(str(tmp_path / "a"), 60, 10, seed=3)
+    write_synthetic_library(str(tmp_path / "b"), 60, 10, seed=3)
+    write_synthetic_library(str(tmp_path / "c"), 60, 10, seed=4)
+
+    a = tree_digest(tmp_path / "a")
+    assert a == tree_digest(tmp_path / "b")
+    assert a != tree_digest(tmp_path / "c")
+
+    images = os.listdir(tmp_path / "a" / "images")
+    sidecars = [name for name in images if name.endswith(".meta.json")]
+    assert len(images) - len(sidecars) == 60
+    assert len(sidecars) == 60 - int(60 * benchmark_pipeline.WITHOUT_SIDECARS_FRACTION)
+    assert sum(1 for path in a if path.startswith("source")) == 10
+
+    assert library_is_current(str(tmp_path / "a"), 60, 10, 3)
+    assert not library_is_current(str(tmp_path / "a"), 60, 10, 4)
+    assert not library_is_current(str(tmp_path / "missing"), 60, 10, 3)
+
+
+def test_every_stage_runs_on_a_small_library(tmp_path, monkeypatch):
+    pytest.importorskip("moto")
+    library = tmp_path / "library"
+    write_synthetic_library(str(library), 40, 10)
+    monkeypatch.chdir(library)
+    # The sync stages swap in the stubbed Google Photos client; put it back after
+    monkeypatch.setattr(sync_from_photos, "authenticate", sync_from_photos.authenticate)
+    monkeypatch.setattr(sync_from_photos, "build", sync_from_photos.build)
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"):
+        monkeypatch.setenv(name, "testing")
+
+    for stage in STAGES.values():
+        stage(1)
+
+    with open("photos.csv") as f:
+        assert len(f.readlines()) == 40
+    assert len(os.listdir("thumbnail/100")) == 40
+    assert len(os.listdir("imported")) == 10
+    downloaded = os.listdir(os.path.join("google", "images"))
+    assert len([name for name in downloaded if name.endswith(".jpg")]) == 10
@@ -0,0 +1,106 @@
+import datetime as dt
+
+import pytest
+
+from compact_manifest import read_compact_manifest, write_compact_manifest
+from generate_photos_gallery import open_metadata_file, write_csv
+from models.csv_entry import CsvEntry
+
+ROWS = [
+    CsvEntry(
+        file_name="PXL_20240101_000001.jpg",
+        aspect_ratio=1.333,
+        created_date=dt.datetime(
+            2024, 1, 1, 8, 30, tzinfo=dt.timezone(dt.timedelta(hours=-8))
+        ),
+    ),
+    CsvEntry(
+        file_name="IMG_0002.jpg",
+        aspect_ratio=0.75,
+        created_date=dt.datetime(
+            2023, 6, 1, 12, tzinfo=dt.timezone(dt.timedelta(hours=5, minutes=30))
+        ),
+    ),
+    CsvEntry(
+        file_name="café.jpg",
+        aspect_ratio=1.777,
+        created_date=dt.datetime(2019, 12, 31, 23, 59, 59, tzinfo=dt.timezone.utc),
+    ),
+]
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_round_trip_matches_csv(tmp_path, use_mmap):
+    csv_file = str(tmp_path / "photos.csv")
+    compact_file = str(tmp_path / "photos.bin")
+    write_csv(ROWS, str(tmp_path), str(tmp_path), csv_file, False)
+    write_compact_manifest(ROWS, compact_file, False)
+    from_csv = open_metadata_file(csv_file)
+
+    manifest = read_compact_manifest(compact_file, use_mmap=use_mmap)
+    assert len(manifest) == len(ROWS)
+    for index, row in enumerate(ROWS):
+        entry = manifest.entry(index)
+        aspect_ratio, created_date, _ = from_csv[row.file_name]
+        assert entry.file_name == row.file_name
+        assert entry.created_date == created_date
+        assert entry.created_date.utcoffset() == created_date.utcoffset()
+        assert f"{entry.aspect_ratio:.3f}" == aspect_ratio
+    manifest.close()
+
+
+def test_close_while_caller_holds_columns(tmp_path):
+    compact_file = str(tmp_path / "photos.bin")
+    write_compact_manifest(ROWS, compact_file, False)
+
+    manifest = read_compact_manifest(compact_file)
+    timestamps = manifest.timestamps
+    name = manifest.strings[: len(ROWS[0].file_name)]
+    manifest.close()
+
+    assert int(timestamps[0]) == int(ROWS[0].created_date.timestamp())
+    assert bytes(name).decode("utf-8") == ROWS[0].file_name
+
+
+def test_round_trips_the_edges_of_each_column(tmp_path):
+    compact_file = str(tmp_path / "photos.bin")
+    rows = [
+        ROWS[0].model_copy(
+            update={
+                "aspect_ratio": 65.535,
+                "created_date": dt.datetime(2038, 1, 1, tzinfo=dt.timezone.utc),
+            }
+        ),
+        ROWS[1].model_copy(
+            update={
+                "aspect_ratio": 0.001,
+                "created_date": dt.datetime(1902, 1, 1, tzinfo=dt.timezone.utc),
+            }
+        ),
+    ]
+    write_compact_manifest(rows, compact_file, False)
+
+    manifest = read_compact_manifest(compact_file, use_mmap=False)
+    assert [entry.aspect_ratio for entry in manifest] == [65.535, 0.001]
+    assert [entry.created_date for entry in manifest] == [
+        row.created_date for row in rows
+    ]
+    manifest.close()
+
+
+@pytest.mark.parametrize(
+    "update",
+    [
+        {"aspect_ratio": 65.536},
+        {"aspect_ratio": 0.0004},
+        {"created_date": dt.datetime(2039, 1, 1, tzinfo=dt.timezone.utc)},
+        {"created_date": dt.datetime(1850, 1, 1, tzinfo=dt.timezone.utc)},
+    ],
+)
+def test_values_the_format_cant_store_are_rejected(tmp_path, update):
+    compact_file = tmp_path / "photos.bin"
+    rows = [ROWS[0], ROWS[1].model_copy(update=update)]
+
+    with pytest.raises(ValueError, match="IMG_0002.jpg"):
+        write_compact_manifest(rows, str(compact_file), False)
+    assert not compact_file.exists()
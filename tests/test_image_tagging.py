@@ -0,0 +1,130 @@
+import os
+
+import pytest
+from PIL import Image
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+
+import image_tagging  # noqa: E402
+from tag_cache import cached_tags, load_tag_cache  # noqa: E402
+
+# More than TOP_K categories, like the real ImageNet list
+CATEGORIES = ["golden retriever", "tabby", "seashore", "pizza", "volcano", "canoe"]
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+
+
+def red_channel_transform(im):
+    """Stands in for the weights' preprocessing: a 224px tensor of the image's red level."""
+    return torch.full((3, 224, 224), im.getpixel((0, 0))[0] / 255.0)
+
+
+class FakeWeights:
+    meta = {"categories": CATEGORIES}
+
+    def transforms(self):
+        return red_channel_transform
+
+
+class FakeModel(torch.nn.Module):
+    """Red images are golden retrievers, everything else is a tabby."""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_sizes = []
+
+    def forward(self, images):
+        self.batch_sizes.append(len(images))
+        red = images[:, 0, 0, 0]
+        logits = torch.zeros(len(images), len(CATEGORIES))
+        logits[:, 0] = red * 20
+        logits[:, 1] = (1 - red) * 20
+        return logits
+
+
+@pytest.fixture
+def model(monkeypatch):
+    fake = FakeModel()
+
+    class Weights:
+        IMAGENET1K_V1 = FakeWeights()
+
+    monkeypatch.setattr(image_tagging, "MobileNet_V3_Small_Weights", Weights)
+    monkeypatch.setattr(image_tagging, "mobilenet_v3_small", lambda weights: fake)
+    return fake
+
+
+def write_image(path, color):
+    Image.new("RGB", (32, 24), color).save(path, "JPEG", quality=95)
+
+
+def thumbnail_directory(tmp_path):
+    directory = tmp_path / "thumbnail" / str(image_tagging.TAGGING_THUMBNAIL_HEIGHT)
+    directory.mkdir(parents=True)
+    return directory
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_run_model_batches_and_skips_unreadable_images(tmp_path, model, workers):
+    paths = []
+    for i, color in enumerate([RED, BLUE, RED, BLUE]):
+        paths.append(str(tmp_path / f"{i}.jpg"))
+        write_image(paths[-1], color)
+    paths.append(str(tmp_path / "broken.jpg"))
+    with open(paths[-1], "wb") as f:
+        f.write(b"not a jpeg")
+
+    results = image_tagging.run_model(paths, workers=workers, batch_size=2)
+
+    assert model.batch_sizes == [2, 2, 1]
+    assert results == [
+        ["golden", "retriever"],
+        ["tabby"],
+        ["golden", "retriever"],
+        ["tabby"],
+        None,
+    ]
+
+
+def test_tag_images_reuses_the_cache(tmp_path, model):
+    directory = thumbnail_directory(tmp_path)
+    write_image(directory / "red.jpg", RED)
+    write_image(directory / "blue.jpg", BLUE)
+    # Identical content only goes through the model once
+    with open(directory / "red.jpg", "rb") as f:
+        (directory / "red-copy.jpg").write_bytes(f.read())
+    (directory / "broken.jpg").write_bytes(b"not a jpeg")
+    cache_file = str(tmp_path / "photos.tags.json")
+
+    tags = image_tagging.tag_images(
+        str(tmp_path / "thumbnail"), cache_file, workers=0, batch_size=2
+    )
+
+    assert sum(model.batch_sizes) == 3
+    assert tags == {
+        "red.jpg": ["golden", "retriever"],
+        "red-copy.jpg": ["golden", "retriever"],
+        "blue.jpg": ["tabby"],
+        "broken.jpg": [],
+    }
+    assert cached_tags(cache_file) == tags
+
+    # Only the unreadable thumbnail, which was not cached, is tried again
+    model.batch_sizes.clear()
+    assert (
+        image_tagging.tag_images(
+            str(tmp_path / "thumbnail"), cache_file, workers=0, batch_size=2
+        )
+        == tags
+    )
+    assert model.batch_sizes == [1]
+
+    # Removed thumbnails drop out of the cache along with tags nothing uses
+    os.remove(directory / "blue.jpg")
+    image_tagging.tag_images(
+        str(tmp_path / "thumbnail"), cache_file, workers=0, batch_size=2
+    )
+    cache = load_tag_cache(cache_file)
+    assert "blue.jpg" not in cache["files"]
+    assert len(cache["tags"]) == 1
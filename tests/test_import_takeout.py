@@ -0,0 +1,73 @@
+import io
+import json
+import os
+import zipfile
+
+import pytest
+from PIL import Image
+
+from import_takeout import PARTIAL_SUFFIX, claim_output, import_takeout, read_archive
+
+
+def jpeg_bytes(color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 6), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def write_zip(path, members):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+
+
+def test_corrupt_member_releases_its_claim(tmp_path):
+    archive = str(tmp_path / "takeout-001.zip")
+    photo = jpeg_bytes("red")
+    write_zip(archive, {"Takeout/Google Photos/Trip/IMG_1.JPG": photo})
+    # Flip a byte inside the stored member so reading it fails the CRC check
+    raw = bytearray(open(archive, "rb").read())
+    raw[raw.index(photo) + len(photo) // 2] ^= 0xFF
+    open(archive, "wb").write(bytes(raw))
+    images, videos = tmp_path / "images", tmp_path / "videos"
+    images.mkdir()
+    videos.mkdir()
+
+    with pytest.raises(zipfile.BadZipFile):
+        read_archive(archive, str(images), str(videos))
+
+    assert os.listdir(images) == []
+    # Another archive with the same photo can claim the name instead of waiting
+    assert claim_output(str(images), "IMG_1.JPG", len(photo)) == (
+        str(images / "IMG_1.JPG"),
+        True,
+    )
+
+
+def test_import_writes_media_once_with_normalized_sidecars(tmp_path):
+    photo = jpeg_bytes("blue")
+    sidecar = json.dumps(
+        {"title": "IMG_1.JPG", "photoTakenTime": {"timestamp": "1700000000"}}
+    )
+    archives = []
+    for index, folder in enumerate(["Trip", "Photos from 2023"]):
+        archive = str(tmp_path / f"takeout-00{index}.zip")
+        write_zip(
+            archive,
+            {
+                f"Takeout/Google Photos/{folder}/IMG_1.JPG": photo,
+                f"Takeout/Google Photos/{folder}/IMG_1.JPG.supplemental-metad.json": sidecar,
+            },
+        )
+        archives.append(archive)
+    images, videos = str(tmp_path / "images"), str(tmp_path / "videos")
+
+    import_takeout(archives, images, videos, workers=2)
+    import_takeout(archives, images, videos, workers=2)
+
+    assert sorted(os.listdir(images)) == ["IMG_1.JPG", "IMG_1.JPG.meta.json"]
+    with open(os.path.join(images, "IMG_1.JPG.meta.json")) as f:
+        meta = json.load(f)
+    assert meta["mediaMetadata"]["width"] == "8"
+    assert meta["mediaMetadata"]["height"] == "6"
+    assert not any(name.endswith(PARTIAL_SUFFIX) for name in os.listdir(images))
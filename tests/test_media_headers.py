@@ -0,0 +1,90 @@
+import datetime as dt
+import json
+import os
+import time
+
+import pytest
+from PIL import Image
+
+import media_headers
+from generate_photos_gallery import rows_without_sidecars
+from media_headers import load_media_index, parse_exif_date, update_media_index
+
+
+@pytest.fixture
+def probed(monkeypatch):
+    """Names of the files whose headers were read."""
+    names = []
+    original_probe_file = media_headers.probe_file
+
+    def probe_file(path):
+        names.append(os.path.basename(path))
+        return original_probe_file(path)
+
+    monkeypatch.setattr(media_headers, "probe_file", probe_file)
+    return names
+
+
+@pytest.fixture
+def images(tmp_path):
+    for name in ("synced.jpg", "imported.jpg"):
+        Image.new("RGB", (40, 30)).save(tmp_path / name)
+    (tmp_path / "synced.jpg.meta.json").write_text("{}")
+    return tmp_path
+
+
+def test_only_files_without_sidecars_are_probed(images, probed):
+    rows = rows_without_sidecars(str(images), False)
+
+    assert [row.file_name for row in rows] == ["imported.jpg"]
+    assert rows[0].aspect_ratio == pytest.approx(40 / 30)
+    assert probed == ["imported.jpg"]
+    assert sorted(load_media_index(str(images))) == ["imported.jpg", "synced.jpg"]
+
+    rows_without_sidecars(str(images), False)
+    assert probed == ["imported.jpg"]
+
+    # trim.py needs every header, so it reads the ones skipped above
+    index = update_media_index(str(images))
+    assert probed == ["imported.jpg", "synced.jpg"]
+    assert index["synced.jpg"]["width"] == 40
+
+
+def test_entries_from_an_older_index_version_are_probed_again(images, probed):
+    update_media_index(str(images))
+    index_path = media_headers.media_index_path(str(images))
+    with open(index_path) as f:
+        index = json.load(f)
+    del index["imported.jpg"]["version"]
+    with open(index_path, "w") as f:
+        json.dump(index, f)
+
+    update_media_index(str(images))
+
+    assert probed == ["imported.jpg", "synced.jpg", "imported.jpg"]
+    assert load_media_index(str(images))["imported.jpg"]["version"] == (
+        media_headers.INDEX_VERSION
+    )
+
+
+@pytest.fixture
+def new_york(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_exif_dates_without_an_offset_are_local_time(new_york):
+    date = parse_exif_date("2019:07:04 18:22:11", None)
+
+    assert date == dt.datetime(2019, 7, 4, 22, 22, 11, tzinfo=dt.timezone.utc)
+    assert date.utcoffset() == dt.timedelta(hours=-4)
+
+
+def test_exif_offsets_are_kept(new_york):
+    date = parse_exif_date("2019:07:04 18:22:11", "+02:00")
+
+    assert date.isoformat() == "2019-07-04T18:22:11+02:00"
+    assert parse_exif_date("not a date", None) is None
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from generate_photos_gallery import MetadataParseError, parse_metadata_batch
+
+SIDECAR = {
+    "id": "abc",
+    "productUrl": "https://photos.google.com/lr/photo/abc",
+    "baseUrl": "https://lh3.googleusercontent.com/abc",
+    "mimeType": "image/jpeg",
+    "mediaMetadata": {
+        "creationTime": "2024-01-01T08:30:00Z",
+        "width": "4000",
+        "height": "3000",
+        "photo": {},
+    },
+    "filename": "PXL_20240101.jpg",
+}
+
+
+def write_sidecar(directory, name, sidecar):
+    (directory / f"{name}.meta.json").write_text(json.dumps(sidecar))
+    return f"{name}.meta.json"
+
+
+def test_batch_parses_complete_sidecars(tmp_path):
+    meta_file_name = write_sidecar(tmp_path, "PXL_20240101.jpg", SIDECAR)
+
+    [row] = parse_metadata_batch(str(tmp_path), [meta_file_name], False)
+
+    assert row.file_name == "PXL_20240101.jpg"
+    assert row.aspect_ratio == pytest.approx(4000 / 3000)
+    assert row.created_date.isoformat() == "2024-01-01T08:30:00+00:00"
+
+
+@pytest.mark.parametrize("missing", ["id", "productUrl", "filename"])
+def test_batch_rejects_sidecars_missing_required_fields(tmp_path, missing):
+    sidecar = {key: value for key, value in SIDECAR.items() if key != missing}
+    meta_file_name = write_sidecar(tmp_path, "PXL_20240101.jpg", sidecar)
+
+    with pytest.raises(MetadataParseError):
+        parse_metadata_batch(str(tmp_path), [meta_file_name], False)
+
+
+def test_batch_rejects_media_without_photo_or_video(tmp_path):
+    media = {k: v for k, v in SIDECAR["mediaMetadata"].items() if k != "photo"}
+    meta_file_name = write_sidecar(
+        tmp_path, "PXL_20240101.jpg", dict(SIDECAR, mediaMetadata=media)
+    )
+
+    with pytest.raises(MetadataParseError):
+        parse_metadata_batch(str(tmp_path), [meta_file_name], False)
+
+
+def test_batch_wraps_unreadable_sidecars_like_invalid_ones(tmp_path):
+    with pytest.raises(MetadataParseError) as error:
+        parse_metadata_batch(str(tmp_path), ["missing.jpg.meta.json"], False)
+
+    assert error.value.meta_file_name == "missing.jpg.meta.json"
+
+
+@pytest.mark.parametrize(
+    "creation_time, expected",
+    [
+        ("2024-01-01T08:30:00Z", "2024-01-01T08:30:00+00:00"),
+        ("2024-01-01T08:30:00.250Z", "2024-01-01T08:30:00.250000+00:00"),
+        ("2024-01-01T08:30:00.5Z", "2024-01-01T08:30:00.500000+00:00"),
+    ],
+)
+def test_batch_dates_match_the_full_path(tmp_path, creation_time, expected):
+    media = dict(SIDECAR["mediaMetadata"], creationTime=creation_time)
+    meta_file_name = write_sidecar(
+        tmp_path, "PXL_20240101.jpg", dict(SIDECAR, mediaMetadata=media)
+    )
+
+    [row] = parse_metadata_batch(str(tmp_path), [meta_file_name], False)
+
+    assert row.created_date.isoformat() == expected
@@ -0,0 +1,24 @@
+from pipeline_utils import load_json_cache, pool_chunks, save_json_cache
+
+
+def test_pool_chunks_keep_order_and_cover_everything():
+    items = list(range(1003))
+
+    chunks = pool_chunks(items, workers=4, max_chunk_size=100)
+
+    assert [item for chunk in chunks for item in chunk] == items
+    assert max(len(chunk) for chunk in chunks) <= 100
+    assert pool_chunks([], workers=4, max_chunk_size=100) == []
+    assert pool_chunks([1, 2], workers=0, max_chunk_size=100) == [[1], [2]]
+
+
+def test_json_cache_round_trip_and_unreadable_file(tmp_path):
+    cache_file = str(tmp_path / "cache.json")
+    assert load_json_cache(cache_file, "test cache") is None
+
+    save_json_cache(cache_file, {"a.jpg": [1, 2]})
+    assert load_json_cache(cache_file, "test cache") == {"a.jpg": [1, 2]}
+    assert not (tmp_path / "cache.json.tmp").exists()
+
+    (tmp_path / "cache.json").write_text("{truncated")
+    assert load_json_cache(cache_file, "test cache") is None
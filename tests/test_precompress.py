@@ -0,0 +1,38 @@
+import gzip
+
+import pytest
+from click.testing import CliRunner
+
+import generate_photos_gallery
+import precompress
+from precompress import precompress_files
+
+brotli = pytest.importorskip("brotli")
+
+
+def test_writes_gzip_and_brotli_variants(tmp_path):
+    manifest = tmp_path / "photos.csv"
+    content = b'"IMG_0001.jpg",1.333,2024-01-01 08:30:00+00:00,\n' * 200
+    manifest.write_bytes(content)
+
+    [report] = precompress_files([str(manifest)])
+
+    assert gzip.decompress((tmp_path / "photos.csv.gz").read_bytes()) == content
+    assert brotli.decompress((tmp_path / "photos.csv.br").read_bytes()) == content
+    assert report["identity"] == len(content)
+    assert report["br"] < report["gzip"] < report["identity"]
+
+
+def test_precompress_refuses_to_run_without_brotli(tmp_path, monkeypatch):
+    monkeypatch.setattr(precompress, "brotli", None)
+    manifest = tmp_path / "photos.csv"
+    manifest.write_bytes(b"x")
+
+    with pytest.raises(RuntimeError, match="brotli"):
+        precompress_files([str(manifest)])
+    result = CliRunner().invoke(
+        generate_photos_gallery.main, ["--precompress", "--publish"]
+    )
+    assert result.exit_code == 2
+    assert "brotli" in result.output
+    assert not (tmp_path / "photos.csv.gz").exists()
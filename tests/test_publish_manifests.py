@@ -0,0 +1,133 @@
+import json
+import os
+import types
+
+import boto3
+import pytest
+from click.testing import CliRunner
+from moto import mock_aws
+
+import sync_to_aws
+from publish_manifests import content_hash, publish_manifests
+
+BUCKET = "gallery"
+
+
+def write_gallery(directory, photos=b'"a.jpg",1.333,2024-01-01 08:30:00+00:00\n'):
+    (directory / "photos.csv").write_bytes(photos)
+    (directory / "search-tokens.csv").write_text("dog\n")
+    shards = directory / "photos"
+    shards.mkdir(exist_ok=True)
+    (shards / "2024.csv").write_bytes(photos)
+    (shards / "index.json").write_text(
+        json.dumps({"years": [{"year": 2024, "count": 1, "file": "photos/2024.csv"}]})
+    )
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_manifests_are_published_under_their_content_hash(tmp_path):
+    write_gallery(tmp_path)
+
+    pointer = publish_manifests(str(tmp_path))
+
+    photos = (tmp_path / "photos.csv").read_bytes()
+    assert pointer["photos"] == f"manifests/photos.{content_hash(photos)}.csv"
+    assert (tmp_path / pointer["photos"]).read_bytes() == photos
+    assert "videos" not in pointer
+    assert read_json(tmp_path / "manifest.json") == pointer
+    # The published year index points at hashed shards too
+    [year] = read_json(tmp_path / pointer["years"])["years"]
+    assert year["file"] == f"manifests/2024.{content_hash(photos)}.csv"
+    assert (tmp_path / year["file"]).read_bytes() == photos
+
+
+def test_previous_publish_is_kept_and_older_ones_removed(tmp_path):
+    write_gallery(tmp_path, b"first\n")
+    first = publish_manifests(str(tmp_path))
+    write_gallery(tmp_path, b"second\n")
+    second = publish_manifests(str(tmp_path))
+
+    assert (tmp_path / first["photos"]).exists()
+
+    write_gallery(tmp_path, b"third\n")
+    publish_manifests(str(tmp_path))
+
+    assert not (tmp_path / first["photos"]).exists()
+    assert not (tmp_path / first["years"]).exists()
+    assert (tmp_path / second["photos"]).exists()
+    assert (tmp_path / second["years"]).exists()
+
+
+class RecordingClient:
+    """Passes calls through to the moto client, recording put keys in order."""
+
+    def __init__(self, client, fail_prefix=None):
+        self.client = client
+        self.fail_prefix = fail_prefix
+        self.put_keys = []
+
+    def put_object(self, **kwargs):
+        if self.fail_prefix and kwargs["Key"].startswith(self.fail_prefix):
+            raise Exception("connection reset")
+        self.put_keys.append(kwargs["Key"])
+        return self.client.put_object(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+@pytest.fixture
+def bucket(monkeypatch, tmp_path):
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"):
+        monkeypatch.setenv(name, "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.chdir(tmp_path)
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def upload(client, monkeypatch, fail_prefix=None):
+    recording = RecordingClient(client, fail_prefix)
+    monkeypatch.setattr(
+        sync_to_aws,
+        "boto3",
+        types.SimpleNamespace(client=lambda *args, **kwargs: recording),
+    )
+    result = CliRunner().invoke(sync_to_aws.main, [BUCKET, "--publish"])
+    return result, recording.put_keys
+
+
+def test_pointer_is_uploaded_last_with_no_cache(bucket, tmp_path, monkeypatch):
+    write_gallery(tmp_path)
+    pointer = publish_manifests(str(tmp_path))
+
+    result, put_keys = upload(bucket, monkeypatch)
+
+    assert result.exit_code == 0, result.output
+    assert put_keys[-1] == "manifest.json"
+    years = read_json(tmp_path / pointer["years"])["years"]
+    for key in (pointer["photos"], pointer["years"], years[0]["file"]):
+        assert key in put_keys[:-1]
+        head = bucket.head_object(Bucket=BUCKET, Key=key)
+        assert head["CacheControl"] == sync_to_aws.IMMUTABLE_CACHE_CONTROL
+    head = bucket.head_object(Bucket=BUCKET, Key="manifest.json")
+    assert head["CacheControl"] == sync_to_aws.REVALIDATE_CACHE_CONTROL
+
+
+def test_pointer_is_not_uploaded_when_a_manifest_fails(bucket, tmp_path, monkeypatch):
+    write_gallery(tmp_path)
+    publish_manifests(str(tmp_path))
+
+    result, put_keys = upload(bucket, monkeypatch, fail_prefix="manifests/photos.")
+
+    assert result.exit_code == 1
+    assert "manifest.json" not in put_keys
+    response = bucket.list_objects_v2(Bucket=BUCKET, Prefix="manifest.json")
+    assert response["KeyCount"] == 0
+    assert os.path.exists(tmp_path / "manifest.json")
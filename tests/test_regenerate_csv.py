@@ -0,0 +1,205 @@
+import datetime as dt
+import json
+import os
+
+import pytest
+
+import generate_photos_gallery
+from generate_photos_gallery import (
+    MetadataParseError,
+    manifest_sort_key,
+    open_metadata_file,
+    regenerate_csv,
+)
+from models.csv_entry import CsvEntry
+
+
+def sidecar(name, creation_time="2024-01-01T08:30:00Z", width=4000, height=3000):
+    return {
+        "id": name,
+        "productUrl": f"https://photos.google.com/lr/photo/{name}",
+        "baseUrl": f"https://lh3.googleusercontent.com/{name}",
+        "mimeType": "image/jpeg",
+        "mediaMetadata": {
+            "creationTime": creation_time,
+            "width": str(width),
+            "height": str(height),
+            "photo": {},
+        },
+        "filename": name,
+    }
+
+
+def write_sidecar(directory, name, **kwargs):
+    path = directory / f"{name}.meta.json"
+    path.write_text(json.dumps(sidecar(name, **kwargs)))
+    return path
+
+
+@pytest.fixture
+def library(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    for i in range(6):
+        write_sidecar(
+            images, f"IMG_{i:04d}.jpg", creation_time=f"202{i}-03-01T10:00:00Z"
+        )
+    return images
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """Sidecar names handed to the parser, per call."""
+    calls = []
+    original = generate_photos_gallery.parse_metadata_files
+
+    def parse_metadata_files(source_directory, meta_file_names, *args):
+        calls.append(sorted(meta_file_names))
+        return original(source_directory, meta_file_names, *args)
+
+    monkeypatch.setattr(
+        generate_photos_gallery, "parse_metadata_files", parse_metadata_files
+    )
+    return calls
+
+
+def regenerate(library, csv_file, cache_file=None, **kwargs):
+    regenerate_csv(
+        str(library),
+        str(library.parent / "thumbnail"),
+        str(csv_file),
+        False,
+        cache_file=str(cache_file) if cache_file else None,
+        **kwargs,
+    )
+    return csv_file.read_text()
+
+
+def test_incremental_rebuild_only_reparses_changed_sidecars(library, parsed, tmp_path):
+    cache_file = tmp_path / "photos.cache.json"
+    full = regenerate(library, tmp_path / "full.csv")
+
+    assert regenerate(library, tmp_path / "photos.csv", cache_file) == full
+    assert regenerate(library, tmp_path / "photos.csv", cache_file) == full
+    assert parsed[1:] == [sorted(os.listdir(library)), []]
+
+    changed = write_sidecar(
+        library, "IMG_0002.jpg", creation_time="2019-05-05T05:05:05Z"
+    )
+    os.utime(changed, ns=(0, os.stat(changed).st_mtime_ns + 1))
+    regenerate(library, tmp_path / "photos.csv", cache_file)
+
+    assert parsed[-1] == ["IMG_0002.jpg.meta.json"]
+    rows = open_metadata_file(str(tmp_path / "photos.csv"))
+    assert rows["IMG_0002.jpg"][1].isoformat() == "2019-05-05T05:05:05+00:00"
+
+
+def test_incremental_rebuild_drops_deleted_sidecars(library, tmp_path):
+    cache_file = tmp_path / "photos.cache.json"
+    regenerate(library, tmp_path / "photos.csv", cache_file)
+    (library / "IMG_0003.jpg.meta.json").unlink()
+
+    regenerate(library, tmp_path / "photos.csv", cache_file)
+
+    assert "IMG_0003.jpg" not in open_metadata_file(str(tmp_path / "photos.csv"))
+    with open(cache_file) as f:
+        assert "IMG_0003.jpg.meta.json" not in json.load(f)
+
+
+def test_unreadable_cache_means_a_full_rebuild(library, parsed, tmp_path):
+    cache_file = tmp_path / "photos.cache.json"
+    cache_file.write_text("{not json")
+
+    regenerate(library, tmp_path / "photos.csv", cache_file)
+
+    assert parsed == [sorted(os.listdir(library))]
+    with open(cache_file) as f:
+        assert len(json.load(f)) == 6
+
+
+def test_workers_write_the_same_manifest_as_one_process(library, tmp_path):
+    for i in range(6, 40):
+        write_sidecar(
+            library, f"IMG_{i:04d}.jpg", creation_time=f"2023-01-01T00:00:{i:02d}Z"
+        )
+    serial = regenerate(library, tmp_path / "serial.csv")
+
+    assert regenerate(library, tmp_path / "pooled.csv", workers=3) == serial
+
+
+def test_worker_errors_name_the_sidecar(library, tmp_path):
+    (library / "IMG_0004.jpg.meta.json").write_text("{}")
+
+    with pytest.raises(MetadataParseError) as error:
+        regenerate(library, tmp_path / "photos.csv", workers=2)
+
+    assert error.value.meta_file_name == "IMG_0004.jpg.meta.json"
+
+
+def test_rows_are_newest_first_grouped_by_their_own_year():
+    new_years_eve = CsvEntry(
+        file_name="eve.jpg",
+        aspect_ratio=1.0,
+        # 2024-01-01 02:00 UTC, but still 2023 where it was taken
+        created_date=dt.datetime(
+            2023, 12, 31, 21, tzinfo=dt.timezone(dt.timedelta(hours=-5))
+        ),
+    )
+    new_years_day = CsvEntry(
+        file_name="day.jpg",
+        aspect_ratio=1.0,
+        created_date=dt.datetime(2024, 1, 1, 1, tzinfo=dt.timezone.utc),
+    )
+    ties = [
+        CsvEntry(
+            file_name=name,
+            aspect_ratio=1.0,
+            created_date=dt.datetime(2022, 6, 1, tzinfo=dt.timezone.utc),
+        )
+        for name in ("b.jpg", "a.jpg", "c.jpg")
+    ]
+
+    rows = sorted(
+        [ties[0], new_years_eve, ties[1], new_years_day, ties[2]],
+        key=manifest_sort_key,
+        reverse=True,
+    )
+
+    assert [row.file_name for row in rows] == [
+        "day.jpg",
+        "eve.jpg",
+        "c.jpg",
+        "b.jpg",
+        "a.jpg",
+    ]
+
+
+def test_year_shards_and_index(library, tmp_path):
+    shards = tmp_path / "photos"
+    regenerate(library, tmp_path / "photos.csv", shard_directory=str(shards))
+
+    with open(shards / "index.json") as f:
+        index = json.load(f)["years"]
+    assert [entry["year"] for entry in index] == [2025, 2024, 2023, 2022, 2021, 2020]
+    assert all(entry["count"] == 1 for entry in index)
+    assert index[0]["file"] == "photos/2025.csv"
+    # The shards concatenated newest first are photos.csv line for line
+    assert (
+        "".join((shards / f"{entry['year']}.csv").read_text() for entry in index)
+        == (tmp_path / "photos.csv").read_text()
+    )
+
+    untouched = os.stat(shards / "2024.csv").st_mtime_ns
+    hashes = {entry["year"]: entry["hash"] for entry in index}
+    (library / "IMG_0005.jpg.meta.json").unlink()
+    write_sidecar(library, "IMG_0100.jpg", creation_time="2020-07-01T00:00:00Z")
+    regenerate(library, tmp_path / "photos.csv", shard_directory=str(shards))
+
+    with open(shards / "index.json") as f:
+        index = {entry["year"]: entry for entry in json.load(f)["years"]}
+    assert not (shards / "2025.csv").exists()
+    assert 2025 not in index
+    assert index[2020]["count"] == 2
+    assert index[2020]["hash"] != hashes[2020]
+    assert index[2024]["hash"] == hashes[2024]
+    assert os.stat(shards / "2024.csv").st_mtime_ns == untouched
@@ -0,0 +1,141 @@
+import os
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from s3_sync import S3Syncer, UploadManifest
+
+BUCKET = "gallery"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"):
+        monkeypatch.setenv(name, "testing")
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def images(tmp_path):
+    directory = tmp_path / "images"
+    directory.mkdir()
+    (directory / "a.jpg").write_bytes(b"a" * 10)
+    (directory / "b.jpg").write_bytes(b"b" * 20)
+    (directory / "a.jpg.meta.json").write_text("{}")
+    # Older than anything uploaded during the test, as photos on disk usually are
+    for path in directory.iterdir():
+        os.utime(path, (1_600_000_000, 1_600_000_000))
+    return directory
+
+
+class CountingClient:
+    """Passes calls through to the moto client and counts the writes."""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if name in ("put_object", "copy_object", "upload_file", "delete_objects"):
+            self.calls.append(name)
+        return attribute
+
+
+def syncer(client, tmp_path, extra_args_for_key=None):
+    manifest = UploadManifest(str(tmp_path / ".s3_manifest.json"))
+    return S3Syncer(
+        BUCKET,
+        manifest,
+        workers=4,
+        client=CountingClient(client),
+        extra_args_for_key=extra_args_for_key,
+    )
+
+
+def bucket_keys(client):
+    response = client.list_objects_v2(Bucket=BUCKET)
+    return sorted(obj["Key"] for obj in response.get("Contents", []))
+
+
+def targets(images):
+    return [(str(images), "images/", ("*.json",))]
+
+
+def test_uploads_new_files_with_their_content_type(client, tmp_path, images):
+    s3 = syncer(client, tmp_path)
+
+    s3.sync(targets(images))
+
+    assert bucket_keys(client) == ["images/a.jpg", "images/b.jpg"]
+    head = client.head_object(Bucket=BUCKET, Key="images/b.jpg")
+    assert head["ContentType"] == "image/jpeg"
+    assert head["ContentLength"] == 20
+    assert set(UploadManifest(s3.manifest.path).entries) == {
+        "images/a.jpg",
+        "images/b.jpg",
+    }
+
+
+def test_second_sync_skips_unchanged_files(client, tmp_path, images):
+    syncer(client, tmp_path).sync(targets(images))
+    (images / "b.jpg").write_bytes(b"c" * 25)
+    os.utime(images / "b.jpg", (1_600_000_100, 1_600_000_100))
+
+    s3 = syncer(client, tmp_path)
+    s3.sync(targets(images))
+
+    assert s3.client.calls == ["put_object"]
+    assert client.head_object(Bucket=BUCKET, Key="images/b.jpg")["ContentLength"] == 25
+
+
+def test_files_removed_locally_are_deleted(client, tmp_path, images):
+    syncer(client, tmp_path).sync(targets(images))
+    os.remove(images / "a.jpg")
+
+    syncer(client, tmp_path).sync(targets(images))
+
+    assert bucket_keys(client) == ["images/b.jpg"]
+
+
+def test_bootstrap_trusts_the_bucket_instead_of_reuploading(client, tmp_path, images):
+    client.put_object(Bucket=BUCKET, Key="images/a.jpg", Body=b"a" * 10)
+    client.put_object(Bucket=BUCKET, Key="images/stale.jpg", Body=b"x")
+
+    s3 = syncer(client, tmp_path)
+    s3.sync(targets(images))
+
+    # a.jpg is already there and newer than the local file; stale.jpg isn't local
+    assert sorted(s3.client.calls) == ["delete_objects", "put_object"]
+    assert bucket_keys(client) == ["images/a.jpg", "images/b.jpg"]
+
+
+def test_changed_cache_control_is_rewritten_without_reuploading(
+    client, tmp_path, images
+):
+    syncer(client, tmp_path).sync(targets(images))
+
+    s3 = syncer(
+        client, tmp_path, extra_args_for_key=lambda key: {"CacheControl": "no-cache"}
+    )
+    s3.sync(targets(images))
+
+    assert s3.client.calls == ["copy_object", "copy_object"]
+    head = client.head_object(Bucket=BUCKET, Key="images/a.jpg")
+    assert head["CacheControl"] == "no-cache"
+    assert head["ContentType"] == "image/jpeg"
+
+
+def test_unreadable_manifest_is_rebuilt_from_the_bucket(client, tmp_path, images):
+    syncer(client, tmp_path).sync(targets(images))
+    (tmp_path / ".s3_manifest.json").write_text("{truncated")
+
+    s3 = syncer(client, tmp_path)
+    s3.sync(targets(images))
+
+    assert s3.client.calls == []
+    assert bucket_keys(client) == ["images/a.jpg", "images/b.jpg"]
@@ -0,0 +1,62 @@
+import datetime as dt
+import json
+
+from models.csv_entry import CsvEntry
+from search_index import delta_decode, shard_file_name, write_search_index
+
+
+def entry(file_name, year, tokens):
+    return CsvEntry(
+        file_name=file_name,
+        aspect_ratio=1.5,
+        created_date=dt.datetime(year, 5, 1, tzinfo=dt.timezone.utc),
+        tokens=tokens,
+    )
+
+
+ROWS = [
+    entry("a.jpg", 2019, ["Beach", "dog"]),
+    entry("b.jpg", 2020, []),
+    entry("c.jpg", 2020, ["dog", " cat "]),
+]
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_shards_hold_only_row_tokens(tmp_path):
+    search = tmp_path / "search"
+
+    write_search_index(ROWS, str(search), str(tmp_path / "search-tokens.csv"))
+
+    index = read_json(search / "index.json")
+    assert index["count"] == len(ROWS)
+    # No year or month tokens, so rows without tags are in no shard
+    assert sorted(index["shards"]) == ["be", "ca", "do"]
+    dog = read_json(search / "do.json")
+    assert {token: delta_decode(gaps) for token, gaps in dog.items()} == {"dog": [0, 2]}
+    assert (tmp_path / "search-tokens.csv").read_text().split() == [
+        "dog",
+        "beach",
+        "cat",
+    ]
+
+
+def test_stale_shards_are_removed(tmp_path):
+    search = tmp_path / "search"
+    write_search_index(ROWS, str(search), str(tmp_path / "search-tokens.csv"))
+
+    write_search_index(ROWS[:1], str(search), str(tmp_path / "search-tokens.csv"))
+
+    assert sorted(path.name for path in search.iterdir()) == [
+        "be.json",
+        "do.json",
+        "index.json",
+    ]
+
+
+def test_unsafe_prefixes_are_hex_encoded():
+    assert shard_file_name("ab") == "ab.json"
+    assert shard_file_name("é.") == "_c3a92e.json"
@@ -0,0 +1,146 @@
+import os
+
+import pytest
+
+from sync_directory import (
+    FileDesc,
+    classify,
+    compare_directories,
+    copy_source_recursive_to_destination,
+    get_duplicate_different_size,
+    get_duplicate_same_size,
+    get_missing_files,
+    numbered_name,
+    recursive_full_path,
+)
+
+
+def write(path, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def read_tree(directory):
+    return {
+        name: open(os.path.join(directory, name), "rb").read()
+        for name in sorted(os.listdir(directory))
+        if not name.startswith(".")
+    }
+
+
+@pytest.fixture(autouse=True)
+def log_in_tmp(tmp_path, monkeypatch):
+    # sync_directory.log is written to the working directory
+    monkeypatch.chdir(tmp_path)
+
+
+def names(files):
+    return sorted(f.filename for f in files)
+
+
+def test_classify_sorts_sources_in_one_pass_without_touching_the_disk():
+    # Roots that don't exist: classify only looks at the indexed sizes
+    source = [
+        FileDesc("/nowhere/a", "new.jpg", 10),
+        FileDesc("/nowhere/a", "same.jpg", 20),
+        FileDesc("/nowhere/b", "resized.jpg", 30),
+    ]
+    destination = [
+        FileDesc("/nowhere/dst", "same.jpg", 20),
+        FileDesc("/nowhere/dst", "resized.jpg", 31),
+        FileDesc("/nowhere/dst", "other.jpg", 5),
+    ]
+
+    result = classify(source, destination)
+
+    assert names(result.missing) == ["new.jpg"]
+    assert names(result.duplicate_same_size) == ["same.jpg"]
+    assert names(result.duplicate_different_size) == ["resized.jpg"]
+
+
+def test_recursive_index_and_comparison_helpers_agree(tmp_path):
+    source, destination = str(tmp_path / "src"), str(tmp_path / "dst")
+    write(f"{source}/2024/01/new.jpg", b"1")
+    write(f"{source}/2024/02/same.jpg", b"22")
+    write(f"{source}/resized.jpg", b"333")
+    write(f"{destination}/same.jpg", b"22")
+    write(f"{destination}/resized.jpg", b"4444")
+
+    indexed = recursive_full_path(source)
+    assert {(f.filename, f.filesize) for f in indexed} == {
+        ("new.jpg", 1),
+        ("same.jpg", 2),
+        ("resized.jpg", 3),
+    }
+    assert all(os.path.isfile(f.full) for f in indexed)
+
+    result = compare_directories(source, destination)
+    assert names(result.missing) == names(get_missing_files(source, destination))
+    assert names(result.missing) == ["new.jpg"]
+    assert names(result.duplicate_same_size) == names(
+        get_duplicate_same_size(source, destination)
+    )
+    assert names(result.duplicate_different_size) == names(
+        get_duplicate_different_size(source, destination)
+    )
+    assert names(result.duplicate_different_size) == ["resized.jpg"]
+
+
+def test_numbered_name_skips_taken_names():
+    assert numbered_name("IMG_0001.jpg", set()) == "IMG_0001 (1).jpg"
+    assert (
+        numbered_name("IMG_0001.jpg", {"IMG_0001 (1).jpg", "IMG_0001 (2).jpg"})
+        == "IMG_0001 (3).jpg"
+    )
+
+
+@pytest.mark.parametrize("copy_workers", [1, 4])
+def test_hash_mode_keeps_same_name_sources_with_different_contents(
+    tmp_path, copy_workers
+):
+    source, destination = str(tmp_path / "src"), str(tmp_path / "dst")
+    write(f"{source}/a/IMG_0001.jpg", b"first")
+    write(f"{source}/b/IMG_0001.jpg", b"second")
+    write(f"{source}/c/IMG_0001.jpg", b"first")
+    os.makedirs(destination)
+
+    copy_source_recursive_to_destination(
+        source, destination, dedup="hash", copy_workers=copy_workers
+    )
+
+    assert sorted(read_tree(destination).values()) == [b"first", b"second"]
+    assert set(read_tree(destination)) == {"IMG_0001.jpg", "IMG_0001 (1).jpg"}
+
+
+def test_renamed_copies_never_overwrite_existing_numbered_names(tmp_path):
+    source, destination = str(tmp_path / "src"), str(tmp_path / "dst")
+    write(f"{source}/IMG_0001.jpg", b"new contents")
+    write(f"{destination}/IMG_0001.jpg", b"old")
+    write(f"{destination}/IMG_0001 (1).jpg", b"older")
+
+    copy_source_recursive_to_destination(source, destination, dedup="hash")
+
+    assert read_tree(destination) == {
+        "IMG_0001.jpg": b"old",
+        "IMG_0001 (1).jpg": b"older",
+        "IMG_0001 (2).jpg": b"new contents",
+    }
+
+
+def test_name_mode_reports_sources_dropped_for_a_later_one(tmp_path, capsys):
+    source, destination = str(tmp_path / "src"), str(tmp_path / "dst")
+    write(f"{source}/a/IMG_0001.jpg", b"first")
+    write(f"{source}/b/IMG_0001.jpg", b"second")
+    os.makedirs(destination)
+
+    copy_source_recursive_to_destination(source, destination)
+
+    output = capsys.readouterr().out
+    [copied] = read_tree(destination).values()
+    kept, skipped = ("a", "b") if copied == b"first" else ("b", "a")
+    assert output.count("cp ") == 1
+    assert f"cp {source}/{kept}/IMG_0001.jpg" in output
+    assert f"skipping {source}/{skipped}/IMG_0001.jpg" in output
+    with open("sync_directory.log") as log:
+        assert log.read() == f"{source}/{kept}/IMG_0001.jpg,{destination}\n"
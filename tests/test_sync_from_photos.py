@@ -0,0 +1,391 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import types
+
+import pytest
+
+import sync_from_photos
+from photos_stub import StubMediaItems, StubPhotosService, serve_stub_downloads
+from sync_from_photos import (
+    PathLocks,
+    download_item,
+    iter_items_to_sync,
+    parse_content_range,
+    refresh_stale_item,
+)
+
+ITEM_COUNT = 120  # more than one search page and more than one batchGet
+
+
+def album_items(port: int, count: int = ITEM_COUNT):
+    return [
+        {
+            "id": f"item-{i}",
+            "productUrl": f"https://photos.google.com/lr/photo/item-{i}",
+            "baseUrl": f"http://127.0.0.1:{port}/item-{i}",
+            "mimeType": "image/jpeg",
+            "mediaMetadata": {
+                "creationTime": "2024-01-01T00:00:00Z",
+                "width": "4",
+                "height": "3",
+                "photo": {},
+            },
+            "filename": f"IMG_{i:04d}.jpg",
+        }
+        for i in range(count)
+    ]
+
+
+def content(media_item_id: str) -> bytes:
+    return f"jpeg bytes of {media_item_id}".encode() * 10
+
+
+@pytest.fixture
+def server():
+    server = serve_stub_downloads(content)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def album(server, monkeypatch):
+    media_items = StubMediaItems(album_items(server.server_address[1]))
+    monkeypatch.setattr(sync_from_photos, "authenticate", lambda: None)
+    monkeypatch.setattr(
+        sync_from_photos,
+        "build",
+        lambda *args, **kwargs: StubPhotosService(media_items),
+    )
+    return media_items
+
+
+def sync(tmp_path, metadata_source, concurrency=1, max_url_age=3000.0, state_db=None):
+    sync_from_photos.download_album(
+        "album",
+        str(tmp_path / "images"),
+        str(tmp_path / "videos"),
+        str(tmp_path / "video_thumbnail"),
+        concurrency=concurrency,
+        metadata_source=metadata_source,
+        max_url_age=max_url_age,
+        state_db=state_db,
+    )
+
+
+def assert_album_on_disk(tmp_path):
+    images = tmp_path / "images"
+    for i in range(ITEM_COUNT):
+        assert (images / f"IMG_{i:04d}.jpg").read_bytes() == content(f"item-{i}")
+        with open(images / f"IMG_{i:04d}.jpg.meta.json") as f:
+            assert json.load(f)["id"] == f"item-{i}"
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_search_mode_writes_sidecars_from_the_listing(tmp_path, album, concurrency):
+    sync(tmp_path, "search", concurrency)
+
+    assert_album_on_disk(tmp_path)
+    assert album.calls == {"search": 2}
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_batch_mode_fetches_sidecars_50_at_a_time(tmp_path, album, concurrency):
+    sync(tmp_path, "batch", concurrency)
+
+    assert_album_on_disk(tmp_path)
+    # 100 + 20 items per page, in batches of at most 50
+    assert album.calls == {"search": 2, "batchGet": 3}
+
+
+def test_get_mode_fetches_each_sidecar(tmp_path, album):
+    sync(tmp_path, "get")
+
+    assert_album_on_disk(tmp_path)
+    assert album.calls == {"search": 2, "get": ITEM_COUNT}
+
+
+def test_second_sync_downloads_nothing(tmp_path, album, server):
+    sync(tmp_path, "search")
+    server.requests.clear()
+
+    sync(tmp_path, "search")
+
+    assert server.requests == []
+
+
+def test_state_db_refetches_files_deleted_from_disk(tmp_path, album, server):
+    state_db = str(tmp_path / "sync_state.db")
+    sync(tmp_path, "get", state_db=state_db)
+    (tmp_path / "images" / "IMG_0003.jpg").unlink()
+    (tmp_path / "images" / "IMG_0005.jpg.meta.json").unlink()
+    server.requests.clear()
+    album.calls.clear()
+
+    sync(tmp_path, "get", state_db=state_db)
+
+    assert_album_on_disk(tmp_path)
+    assert server.requests == [("/item-3=d", None)]
+    assert album.calls == {"search": 2, "get": 1}
+
+
+def test_state_db_reports_each_removal_once(tmp_path, album, capsys):
+    state_db = str(tmp_path / "sync_state.db")
+    sync(tmp_path, "search", state_db=state_db)
+    del album.items[-2:]
+
+    capsys.readouterr()
+    sync(tmp_path, "search", state_db=state_db)
+    output = capsys.readouterr().out
+    assert "No longer in album: IMG_0118.jpg" in output
+    assert "No longer in album: IMG_0119.jpg" in output
+    assert "2 removed" in output
+
+    sync(tmp_path, "search", state_db=state_db)
+    output = capsys.readouterr().out
+    assert "No longer in album" not in output
+    assert "0 removed" in output
+
+
+class Clock:
+    """Stands in for the `time` module with a monotonic clock the test moves."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(
+        sync_from_photos, "time", types.SimpleNamespace(monotonic=clock.monotonic)
+    )
+    return clock
+
+
+def listed_pages(items, listed_at, page_size=100):
+    return [
+        (listed_at, items[start : start + page_size], {})
+        for start in range(0, len(items), page_size)
+    ]
+
+
+def test_fresh_base_urls_are_not_refreshed(clock):
+    media_items = StubMediaItems(album_items(0))
+    service = StubPhotosService(media_items)
+    pages = listed_pages(media_items.items, clock.now)
+    clock.now += 3000 - 1
+
+    yielded = list(iter_items_to_sync(service, pages, 3000))
+
+    assert [item["id"] for _, item, _ in yielded] == [
+        item["id"] for item in media_items.items
+    ]
+    assert media_items.calls == {}
+
+
+def test_stale_base_urls_are_refreshed_in_batches(clock):
+    listed = album_items(0)
+    media_items = StubMediaItems(album_items(1))  # every baseUrl has changed since
+    service = StubPhotosService(media_items)
+    pages = listed_pages(listed, clock.now)
+    clock.now += 3000
+
+    yielded = list(iter_items_to_sync(service, pages, 3000))
+
+    # Pages of 100 + 20 items, in batches of at most 50
+    assert media_items.calls == {"batchGet": 3}
+    assert [item["baseUrl"] for _, item, _ in yielded] == [
+        item["baseUrl"] for item in media_items.items
+    ]
+    assert {listed_at for listed_at, _, _ in yielded} == {clock.now}
+    # Refreshed items are fresh again, so nothing is fetched one by one
+    for listed_at, item, _ in yielded:
+        refresh_stale_item(service, item, listed_at, 3000)
+    assert media_items.calls == {"batchGet": 3}
+
+
+def test_items_batch_get_misses_are_refreshed_one_by_one(clock):
+    listed = album_items(0, count=3)
+    media_items = StubMediaItems(album_items(1, count=3))
+    del media_items.by_id["item-1"]
+    service = StubPhotosService(media_items)
+    listed_at = clock.now
+    clock.now += 3000
+
+    yielded = list(iter_items_to_sync(service, listed_pages(listed, listed_at), 3000))
+
+    missed = yielded[1]
+    assert missed[:2] == (listed_at, listed[1])
+    media_items.by_id["item-1"] = media_items.items[1]
+    assert refresh_stale_item(service, missed[1], missed[0], 3000) == (
+        media_items.items[1]
+    )
+    assert media_items.calls == {"batchGet": 1, "get": 1}
+
+
+def test_path_locks_serialize_only_the_same_path():
+    locks = PathLocks()
+    active = {"a": 0, "b": 0}
+    overlaps = {"a": 0, "b": 0}
+    counter_lock = threading.Lock()
+
+    def work(path):
+        with locks.hold(path):
+            with counter_lock:
+                active[path] += 1
+                overlaps[path] = max(overlaps[path], active[path])
+            time.sleep(0.01)
+            with counter_lock:
+                active[path] -= 1
+
+    threads = [threading.Thread(target=work, args=(path,)) for path in "abababab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlaps == {"a": 1, "b": 1}
+    # Locks are dropped once nobody holds or waits for them
+    assert locks._locks == {}
+
+
+def test_path_locks_let_different_paths_run_together():
+    locks = PathLocks()
+    both_inside = threading.Barrier(2, timeout=5)
+
+    def work(path):
+        with locks.hold(path):
+            both_inside.wait()
+
+    threads = [threading.Thread(target=work, args=(path,)) for path in "ab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not both_inside.broken
+
+
+def test_threaded_items_sharing_a_filename_leave_one_complete_file(
+    tmp_path, album, server
+):
+    for item in album.items[1::2]:
+        item["filename"] = album.items[0]["filename"]
+
+    sync(tmp_path, "search", concurrency=4)
+
+    images = tmp_path / "images"
+    assert sorted(os.listdir(images))[:2] == ["IMG_0000.jpg", "IMG_0000.jpg.meta.json"]
+    assert not [name for name in os.listdir(images) if name.endswith(".part")]
+    with open(images / "IMG_0000.jpg.meta.json") as f:
+        sidecar_id = json.load(f)["id"]
+    assert (images / "IMG_0000.jpg").read_bytes() == content(sidecar_id)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("bytes 100-199/200", (100, 200)),
+        ("bytes 100-199/*", (100, None)),
+        ("bytes */200", (None, 200)),
+        ("garbage", (None, None)),
+        (None, (None, None)),
+    ],
+)
+def test_parse_content_range(value, expected):
+    assert parse_content_range(value) == expected
+
+
+def test_download_writes_atomically_and_returns_size_and_hash(tmp_path, server):
+    url = f"http://127.0.0.1:{server.server_address[1]}/item-7=d"
+    local_path = str(tmp_path / "IMG_0007.jpg")
+
+    size, content_hash = download_item(url, local_path)
+
+    assert (size, content_hash) == (
+        len(content("item-7")),
+        hashlib.sha256(content("item-7")).hexdigest(),
+    )
+    assert os.listdir(tmp_path) == ["IMG_0007.jpg"]
+
+
+def test_interrupted_download_keeps_only_the_part_file_and_resumes(
+    tmp_path, server, monkeypatch
+):
+    url = f"http://127.0.0.1:{server.server_address[1]}/item-7=d"
+    local_path = str(tmp_path / "IMG_0007.jpg")
+    # Small chunks, so the bytes before the cut reach the .part file
+    monkeypatch.setattr(sync_from_photos, "DOWNLOAD_CHUNK_SIZE", 16)
+    server.cut_short["item-7"] = 40
+
+    with pytest.raises(Exception):
+        download_item(url, local_path)
+    assert os.listdir(tmp_path) == ["IMG_0007.jpg.part"]
+    received = os.path.getsize(f"{local_path}.part")
+    assert 0 < received <= 40
+
+    _, content_hash = download_item(url, local_path)
+
+    assert open(local_path, "rb").read() == content("item-7")
+    # The hash covers the bytes from both attempts
+    assert content_hash == hashlib.sha256(content("item-7")).hexdigest()
+    assert server.requests[-1] == ("/item-7=d", f"bytes={received}-")
+
+
+def test_failed_request_writes_nothing(tmp_path):
+    server = serve_stub_downloads(lambda media_item_id: None)
+    url = f"http://127.0.0.1:{server.server_address[1]}/item-7=d"
+    try:
+        with pytest.raises(Exception, match="status code: 404"):
+            download_item(url, str(tmp_path / "IMG_0007.jpg"))
+    finally:
+        server.shutdown()
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_resumes_a_partial_file(tmp_path, server):
+    url = f"http://127.0.0.1:{server.server_address[1]}/item-7=d"
+    local_path = str(tmp_path / "IMG_0007.jpg")
+    with open(f"{local_path}.part", "wb") as f:
+        f.write(content("item-7")[:25])
+
+    size, _ = download_item(url, local_path)
+
+    assert size == len(content("item-7"))
+    assert open(local_path, "rb").read() == content("item-7")
+    assert server.requests == [("/item-7=d", "bytes=25-")]
+
+
+def test_download_finishes_a_complete_partial_file_on_416(tmp_path, server):
+    url = f"http://127.0.0.1:{server.server_address[1]}/item-7=d"
+    local_path = str(tmp_path / "IMG_0007.jpg")
+    with open(f"{local_path}.part", "wb") as f:
+        f.write(content("item-7"))
+
+    download_item(url, local_path)
+
+    assert open(local_path, "rb").read() == content("item-7")
+    assert not os.path.exists(f"{local_path}.part")
+    assert len(server.requests) == 1
+
+
+def test_download_restarts_when_the_partial_file_is_too_long(tmp_path, server):
+    url = f"http://127.0.0.1:{server.server_address[1]}/item-7=d"
+    local_path = str(tmp_path / "IMG_0007.jpg")
+    with open(f"{local_path}.part", "wb") as f:
+        f.write(content("item-7") + b"extra")
+
+    download_item(url, local_path)
+
+    assert open(local_path, "rb").read() == content("item-7")
+    assert [range_header for _, range_header in server.requests] == [
+        f"bytes={len(content('item-7')) + 5}-",
+        None,
+    ]
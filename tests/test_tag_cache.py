@@ -0,0 +1,37 @@
+import json
+
+from tag_cache import MODEL_NAME, cached_tags, load_tag_cache, save_tag_cache
+
+
+def test_cached_tags_maps_file_names_through_content_hashes(tmp_path):
+    cache_file = str(tmp_path / "photos.tags.json")
+    save_tag_cache(
+        cache_file,
+        {
+            "model": MODEL_NAME,
+            "files": {
+                "a.jpg": [1, 10, "h1"],
+                "copy-of-a.jpg": [2, 10, "h1"],
+                "unreadable.jpg": [3, 5, "h2"],
+            },
+            "tags": {"h1": ["golden", "retriever"]},
+        },
+    )
+
+    assert cached_tags(cache_file) == {
+        "a.jpg": ["golden", "retriever"],
+        "copy-of-a.jpg": ["golden", "retriever"],
+        "unreadable.jpg": [],
+    }
+
+
+def test_cache_from_another_model_is_discarded(tmp_path):
+    cache_file = tmp_path / "photos.tags.json"
+    cache_file.write_text(
+        json.dumps(
+            {"model": "other", "files": {"a.jpg": [1, 1, "h"]}, "tags": {"h": ["x"]}}
+        )
+    )
+
+    assert load_tag_cache(str(cache_file))["files"] == {}
+    assert cached_tags(str(cache_file)) == {}
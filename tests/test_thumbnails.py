@@ -0,0 +1,101 @@
+import os
+
+import pytest
+from PIL import Image
+
+import thumbnails
+from thumbnails import generate_thumbnails, thumbnail_path
+
+HEIGHTS = (20, 100)
+
+
+def write_image(path, size=(300, 200), color=(200, 40, 40)):
+    Image.new("RGB", size, color).save(path, quality=95)
+
+
+@pytest.fixture
+def library(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    write_image(images / "a.jpg")
+    write_image(images / "b.png", size=(150, 300))
+    return images, tmp_path / "thumbnail"
+
+
+def test_writes_every_height(library):
+    images, thumbnail_directory = library
+
+    generate_thumbnails(str(images), str(thumbnail_directory), HEIGHTS)
+
+    for height in HEIGHTS:
+        for name in ("a.jpg", "b.png"):
+            with Image.open(
+                thumbnail_path(str(thumbnail_directory), height, name)
+            ) as im:
+                assert im.height == height
+    assert not any(
+        name.endswith(".tmp")
+        for height in HEIGHTS
+        for name in os.listdir(thumbnail_directory / str(height))
+    )
+
+
+def test_skips_thumbnails_newer_than_their_source(library, monkeypatch):
+    images, thumbnail_directory = library
+    generate_thumbnails(str(images), str(thumbnail_directory), HEIGHTS)
+    opened = []
+    original_open = Image.open
+    monkeypatch.setattr(
+        thumbnails.Image,
+        "open",
+        lambda path, *args: opened.append(path) or original_open(path, *args),
+    )
+
+    generate_thumbnails(str(images), str(thumbnail_directory), HEIGHTS)
+    assert opened == []
+
+    os.utime(images / "a.jpg", (2_000_000_000, 2_000_000_000))
+    generate_thumbnails(str(images), str(thumbnail_directory), HEIGHTS)
+    assert opened == [os.path.join(str(images), "a.jpg")]
+
+
+def test_failed_save_leaves_no_output(library, monkeypatch):
+    images, thumbnail_directory = library
+
+    def fail(self, path, *args, **kwargs):
+        with open(path, "wb") as f:
+            f.write(b"truncated")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(Image.Image, "save", fail)
+    generate_thumbnails(str(images), str(thumbnail_directory), HEIGHTS)
+
+    for height in HEIGHTS:
+        assert os.listdir(thumbnail_directory / str(height)) == []
+
+
+def test_ignores_hidden_and_temporary_files(library):
+    images, thumbnail_directory = library
+    (images / ".media_index.json.tmp").write_text("{}")
+    (images / "c.jpg.tmp").write_bytes(b"partial")
+    (images / ".DS_Store").write_bytes(b"\0")
+
+    generate_thumbnails(str(images), str(thumbnail_directory), HEIGHTS)
+
+    for height in HEIGHTS:
+        assert sorted(os.listdir(thumbnail_directory / str(height))) == [
+            "a.jpg",
+            "b.png",
+        ]
+
+
+def test_removes_thumbnails_of_deleted_images(library):
+    images, thumbnail_directory = library
+    generate_thumbnails(str(images), str(thumbnail_directory), HEIGHTS)
+    (images / "b.png").unlink()
+    (thumbnail_directory / "20" / "a.jpg.tmp").write_bytes(b"left by a crash")
+
+    generate_thumbnails(str(images), str(thumbnail_directory), HEIGHTS)
+
+    for height in HEIGHTS:
+        assert os.listdir(thumbnail_directory / str(height)) == ["a.jpg"]
@@ -0,0 +1,108 @@
+import json
+import os
+
+import pytest
+from PIL import Image
+
+import media_headers
+import trim
+from media_headers import MEDIA_INDEX_FILE_NAME, load_media_index
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    # trim.log is written to the working directory
+    monkeypatch.chdir(tmp_path)
+    images, trash = tmp_path / "images", tmp_path / "trash"
+    images.mkdir()
+    trash.mkdir()
+    Image.new("RGB", (300, 200)).save(images / "small.jpg")
+    Image.new("RGB", (1200, 300)).save(images / "wide.jpg")
+    Image.new("RGB", (800, 600)).save(images / "large.png")
+    (images / "clip.mp4").write_bytes(b"not much of a video")
+    (images / "small.jpg.meta.json").write_text("{}")
+    return images, trash
+
+
+@pytest.fixture
+def probed(monkeypatch):
+    names = []
+    original_probe_file = media_headers.probe_file
+
+    def probe_file(path):
+        names.append(os.path.basename(path))
+        return original_probe_file(path)
+
+    monkeypatch.setattr(media_headers, "probe_file", probe_file)
+    return names
+
+
+def test_moves_only_small_still_images(library):
+    images, trash = library
+
+    trim.process(str(images), str(trash))
+
+    assert os.listdir(trash) == ["small.jpg"]
+    assert sorted(load_media_index(str(images))) == [
+        "clip.mp4",
+        "large.png",
+        "wide.jpg",
+    ]
+    # Videos share the index but are never trimmed or reported
+    assert "clip.mp4" not in open("trim.log").read()
+
+
+def test_second_run_reads_no_headers(library, probed):
+    images, trash = library
+    trim.process(str(images), str(trash))
+    assert sorted(probed) == ["clip.mp4", "large.png", "small.jpg", "wide.jpg"]
+
+    Image.new("RGB", (100, 100)).save(images / "tiny.gif")
+    trim.process(str(images), str(trash))
+
+    assert sorted(probed) == [
+        "clip.mp4",
+        "large.png",
+        "small.jpg",
+        "tiny.gif",
+        "wide.jpg",
+    ]
+    assert sorted(os.listdir(trash)) == ["small.jpg", "tiny.gif"]
+
+
+def test_dry_run_leaves_the_directory_and_index_alone(library):
+    images, trash = library
+    index_file = images / MEDIA_INDEX_FILE_NAME
+
+    trim.process(str(images), str(trash), dry_run=True)
+    assert not index_file.exists()
+
+    trim.process(str(images), str(trash))
+    index = index_file.read_bytes()
+    Image.new("RGB", (100, 100)).save(images / "tiny.gif")
+    trim.process(str(images), str(trash), dry_run=True)
+
+    assert os.listdir(trash) == ["small.jpg"]
+    assert (images / "tiny.gif").exists()
+    assert index_file.read_bytes() == index
+
+
+def test_duplicates_are_kept_when_the_copy_to_keep_is_gone(library, tmp_path):
+    images, trash = library
+    Image.new("RGB", (800, 600)).save(images / "large copy.png")
+    report = tmp_path / "near_duplicates.json"
+    report.write_text(
+        json.dumps(
+            {
+                "clusters": [
+                    {"keep": "large.png", "duplicates": ["large copy.png"]},
+                    {"keep": "deleted.jpg", "duplicates": ["wide.jpg"]},
+                ]
+            }
+        )
+    )
+
+    trim.trim_duplicates(str(images), str(trash), str(report))
+
+    assert os.listdir(trash) == ["large copy.png"]
+    assert (images / "wide.jpg").exists()
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from video_posters import generate_posters, poster_path  # noqa: E402
+
+
+def write_video(path, frames=20, size=(1280, 720)):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 10, size)
+    if not writer.isOpened():
+        pytest.skip("OpenCV was built without an MP4 encoder")
+    for i in range(frames):
+        # Each frame a different grey, so the poster shows which one was read
+        writer.write(np.full((size[1], size[0], 3), i * 10, dtype=np.uint8))
+    writer.release()
+
+
+@pytest.fixture
+def videos(tmp_path):
+    videos = tmp_path / "videos"
+    videos.mkdir()
+    write_video(videos / "clip.mp4")
+    (videos / "clip.mp4.meta.json").write_text("{}")
+    return videos, tmp_path / "video_thumbnail"
+
+
+def test_poster_is_a_frame_past_the_start_fitted_to_640(videos):
+    source, posters = videos
+
+    generate_posters(str(source), str(posters))
+
+    poster = cv2.imread(poster_path(str(posters), "clip.mp4"))
+    assert poster.shape == (360, 640, 3)
+    # 10% into 20 frames is frame 2, not the black first frame
+    assert 10 <= poster.mean() <= 30
+    assert os.listdir(posters) == ["clip.mp4.jpg"]
+
+
+def test_posters_newer_than_their_video_are_kept(videos, capsys):
+    source, posters = videos
+    generate_posters(str(source), str(posters))
+    output = poster_path(str(posters), "clip.mp4")
+    os.utime(output, (2_000_000_000, 2_000_000_000))
+    capsys.readouterr()
+
+    generate_posters(str(source), str(posters), workers=2)
+
+    assert "Wrote 0 video posters for 1 videos, 0 failed" in capsys.readouterr().out
+    assert os.path.getmtime(output) == 2_000_000_000
+
+
+def test_unreadable_videos_are_counted_as_failed(videos, capsys):
+    source, posters = videos
+    (source / "broken.mov").write_bytes(b"not a video")
+    capsys.readouterr()
+
+    generate_posters(str(source), str(posters))
+
+    assert "Wrote 1 video posters for 2 videos, 1 failed" in capsys.readouterr().out
+    assert not os.path.exists(poster_path(str(posters), "broken.mov"))